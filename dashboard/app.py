@@ -12,7 +12,11 @@ from pathlib import Path
 SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
 sys.path.insert(0, str(SCRIPTS_PATH))
 
-from finance_db import get_monthly_summary, get_categories, get_active_installments
+from finance_db import configure_read_only, get_monthly_summary, get_categories, get_installment_calendar
+
+# Dashboard only reads: mode=ro connections never block importers
+# (FINANCE_DB_SNAPSHOT=1 reads from a periodic snapshot instead)
+configure_read_only()
 
 # Page config
 st.set_page_config(
@@ -88,32 +92,11 @@ st.title(f"📊 Dashboard - {month_names[selected_month-1]} {selected_year}")
 # Load data
 summary = get_monthly_summary(selected_year, selected_month)
 categories = get_categories()
-all_installments = get_active_installments()
+installment_calendar = get_installment_calendar()
 
 # Filtrar parcelamentos ativos NO MÊS selecionado
-def filter_installments_by_month(installments, year, month):
-    """Retorna apenas parcelamentos ativos no mês/ano especificado."""
-    filtered = []
-    for inst in installments:
-        start = inst.get('start_date', '')
-        end = inst.get('end_date', '')
-        if not start or not end:
-            continue
-
-        start_y, start_m = int(start[:4]), int(start[5:7])
-        end_y, end_m = int(end[:4]), int(end[5:7])
-
-        # Verificar se o mês está dentro do período do parcelamento
-        target = (year, month)
-        start_tuple = (start_y, start_m)
-        end_tuple = (end_y, end_m)
-
-        if start_tuple <= target <= end_tuple:
-            filtered.append(inst)
-
-    return filtered
-
-installments = filter_installments_by_month(all_installments, selected_year, selected_month)
+# Apenas parcelamentos ativos no mês/ano selecionado
+installments = installment_calendar.active(selected_year, selected_month)
 
 # Categorias excluídas do cálculo de budget (obra é separada)
 EXCLUDED_CATEGORIES = ['obra', 'esportes']
@@ -14,7 +14,11 @@ import pandas as pd
 SCRIPTS_PATH = Path(__file__).parent.parent.parent / "scripts"
 sys.path.insert(0, str(SCRIPTS_PATH))
 
-from finance_db import get_monthly_summary, get_categories
+from finance_db import configure_read_only, get_monthly_summary, get_categories
+
+# Dashboard only reads: mode=ro connections never block importers
+# (FINANCE_DB_SNAPSHOT=1 reads from a periodic snapshot instead)
+configure_read_only()
 
 st.set_page_config(page_title="Categorias", page_icon="📊", layout="wide")
 
@@ -16,7 +16,11 @@ import pandas as pd
 SCRIPTS_PATH = Path(__file__).parent.parent.parent / "scripts"
 sys.path.insert(0, str(SCRIPTS_PATH))
 
-from finance_db import get_monthly_summary, get_categories
+from finance_db import configure_read_only, get_yearly_matrix, get_categories
+
+# Dashboard only reads: mode=ro connections never block importers
+# (FINANCE_DB_SNAPSHOT=1 reads from a periodic snapshot instead)
+configure_read_only()
 
 st.set_page_config(page_title="Fluxo Anual", page_icon="📈", layout="wide")
 
@@ -47,15 +51,17 @@ OBRA_BUDGET = sum(
 # Build data
 months = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
 
+# Real data from transactions (parcelamentos já incluídos nas categorias),
+# category x month in a single query
+matrix = get_yearly_matrix(2026)
+var_by_month = matrix.month_totals(exclude=tuple(EXCLUDED_CATEGORIES))
+obra_by_month = matrix.category('obra')
+
 data = []
 for m in range(1, 13):
-    # Get real data from transactions (parcelamentos já incluídos nas categorias)
-    summary = get_monthly_summary(2026, m)
-
     # Separar variáveis de obra
-    cats = summary.get('categories', [])
-    var_real = sum(c.get('total', 0) for c in cats if c.get('category') not in EXCLUDED_CATEGORIES)
-    obra_real = sum(c.get('total', 0) for c in cats if c.get('category') == 'obra')
+    var_real = float(var_by_month[m-1])
+    obra_real = float(obra_by_month[m-1])
 
     # Projetado: Budget mensal (teto de gastos)
     # Real: Soma das transações por categoria (já inclui parcelamentos)
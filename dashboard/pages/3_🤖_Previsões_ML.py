@@ -19,9 +19,13 @@ st.title("🤖 Previsões e Otimização com Machine Learning")
 
 # Try to load ML modules
 try:
+    from finance_db import configure_read_only
     from ml.spending_predictor import SpendingPredictor
     from ml.budget_optimizer import BudgetOptimizer
 
+    # Dashboard only reads: mode=ro connections never block importers
+    configure_read_only()
+
     ML_AVAILABLE = True
 except ImportError as e:
     ML_AVAILABLE = False
@@ -14,7 +14,11 @@ import pandas as pd
 SCRIPTS_PATH = Path(__file__).parent.parent.parent / "scripts"
 sys.path.insert(0, str(SCRIPTS_PATH))
 
-from finance_db import get_active_installments
+from finance_db import configure_read_only, get_active_installments, project_commitments
+
+# Dashboard only reads: mode=ro connections never block importers
+# (FINANCE_DB_SNAPSHOT=1 reads from a periodic snapshot instead)
+configure_read_only()
 
 st.set_page_config(page_title="Parcelamentos", page_icon="📦", layout="wide")
 
@@ -161,20 +165,9 @@ st.markdown("### Projeção Mensal")
 monthly_proj = []
 months = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
 
+committed = project_commitments((2026, 1), 12).total
 for m in range(1, 13):
-    total = 0
-    for inst in installments:
-        start_year, start_month = int(inst['start_date'][:4]), int(inst['start_date'][5:7])
-        end_year, end_month = int(inst['end_date'][:4]), int(inst['end_date'][5:7])
-
-        month_start = (2026, m)
-        inst_start = (start_year, start_month)
-        inst_end = (end_year, end_month)
-
-        if inst_start <= month_start <= inst_end:
-            total += inst['installment_amount']
-
-    monthly_proj.append({'Mês': months[m-1], 'Total': total})
+    monthly_proj.append({'Mês': months[m-1], 'Total': committed[m-1]})
 
 df_proj = pd.DataFrame(monthly_proj)
 
@@ -7,6 +7,11 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from hashing import transaction_hash
+except ImportError:
+    from scripts.hashing import transaction_hash
+
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
 DB_PATH = PROJECT_ROOT / "data" / "finance.db"
@@ -118,11 +123,9 @@ def add_transactions():
     inserted = 0
     for date, desc, amount, cat_id in transactions:
         try:
-            # Verificar duplicata simples (data + descrição + valor)
-            cursor.execute("""
-                SELECT id FROM transactions
-                WHERE date = ? AND description = ? AND amount = ?
-            """, (date, desc, amount))
+            # Verificar duplicata pelo hash canônico (data + descrição + valor)
+            tx_hash = transaction_hash(date, desc, amount)
+            cursor.execute("SELECT id FROM transactions WHERE hash = ?", (tx_hash,))
 
             if cursor.fetchone():
                 print(f"⏭️  Duplicata: {date} {desc} R$ {amount:.2f}")
@@ -130,9 +133,9 @@ def add_transactions():
 
             tx_type = 'expense' if amount > 0 else 'income'
             cursor.execute("""
-                INSERT INTO transactions (date, description, amount, category_id, type, source)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (date, desc, amount, cat_id, tx_type, 'manual_jan2026'))
+                INSERT INTO transactions (date, description, amount, category_id, type, source, hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (date, desc, amount, cat_id, tx_type, 'manual_jan2026', tx_hash))
 
             inserted += 1
             print(f"✅ {date} {desc}: R$ {amount:.2f}")
@@ -42,6 +42,7 @@ def add_installment(description, total_amount, installment_amount, total_install
     category = get_category_by_name(category_name)
     if not category:
         print(f"❌ Categoria '{category_name}' não encontrada!")
+        conn.close()
         return False
 
     category_id = category['id']
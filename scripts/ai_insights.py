@@ -17,10 +17,14 @@ from enum import Enum
 
 from finance_db import (
     get_categories,
+    get_category_stats,
     get_transactions,
     get_monthly_summary,
-    get_active_installments
+    get_active_installments,
+    get_spending_history,
+    history_window
 )
+from anomalies import detect_anomalies
 
 # Configuracao do usuario - Dados reais do CLAUDE.md
 USER_PROFILE = {
@@ -114,24 +118,14 @@ class SpendingPredictor:
         self.history_months = history_months
         self.category_history: Dict[str, List[float]] = defaultdict(list)
         self._load_history()
+        # Estatisticas online dos meses fechados (Welford + EWMA, leitura O(1))
+        self.month_stats = get_category_stats("month")
 
     def _load_history(self):
-        """Carrega historico de gastos."""
-        today = date.today()
-
-        for i in range(self.history_months):
-            month = today.month - i
-            year = today.year
-            while month <= 0:
-                month += 12
-                year -= 1
-
-            try:
-                summary = get_monthly_summary(year, month)
-                for cat in summary["categories"]:
-                    self.category_history[cat["category"]].append(cat["total"])
-            except:
-                pass
+        """Carrega historico de gastos (meses fechados, mais recente primeiro)."""
+        history = get_spending_history(*history_window(self.history_months))
+        for category, row in zip(history.categories, history.totals):
+            self.category_history[category] = row[::-1].tolist()
 
     def predict_category(self, category: str) -> Prediction:
         """Preve gasto de uma categoria para proximo mes."""
@@ -180,8 +174,11 @@ class SpendingPredictor:
         elif trend == TrendDirection.DOWN:
             factors.append(f"Tendencia de queda: {trend_pct*100:.0f}% nos ultimos meses")
 
-        # Confianca baseada em variabilidade
-        if len(history) >= 3:
+        # Confianca baseada em variabilidade (recente, via EWMA dos meses fechados)
+        stats = self.month_stats.get(category)
+        if stats and stats.n >= 3:
+            confidence = max(0.3, min(0.9, stats.confidence()))
+        elif len(history) >= 3:
             cv = statistics.stdev(history) / mean if mean > 0 else 1
             confidence = max(0.3, min(0.9, 1 - cv))
         else:
@@ -317,27 +314,27 @@ class PatternDetector:
         return patterns
 
     def _detect_large_purchases(self) -> List[Pattern]:
-        """Detecta compras grandes atipicas."""
+        """Detecta compras grandes atipicas (z robusto contra o historico da categoria)."""
         patterns = []
 
         if len(self.transactions) < 5:
             return patterns
 
-        amounts = [abs(tx["amount"]) for tx in self.transactions]
-        mean = statistics.mean(amounts)
-        stdev = statistics.stdev(amounts) if len(amounts) > 1 else 0
-
-        for tx in self.transactions:
-            if abs(tx["amount"]) > mean + 2 * stdev:
-                patterns.append(Pattern(
-                    type="large_purchase",
-                    description=f"Compra atipica: {tx['description'][:30]} - R$ {abs(tx['amount']):,.0f}",
-                    confidence=0.85,
-                    data={
-                        "transaction": tx,
-                        "zscore": (abs(tx["amount"]) - mean) / stdev if stdev > 0 else 0
-                    }
-                ))
+        start = date(self.year, self.month, 1)
+        end = date(self.year + self.month // 12, self.month % 12 + 1, 1)
+        by_id = {tx["id"]: tx for tx in self.transactions}
+
+        for a in detect_anomalies(start.isoformat(), end.isoformat()):
+            tx = by_id.get(a["id"], a)
+            patterns.append(Pattern(
+                type="large_purchase",
+                description=f"Compra atipica: {tx['description'][:30]} - R$ {a['amount']:,.0f}",
+                confidence=0.85,
+                data={
+                    "transaction": tx,
+                    "zscore": a["z_score"]
+                }
+            ))
 
         return patterns
 
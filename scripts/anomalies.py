@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Anomaly Engine
+Detecção vetorizada de despesas atípicas sobre o ledger em colunas numpy.
+
+O z-score robusto (Iglewicz-Hoaglin) usa mediana e MAD por categoria em vez
+de média e desvio padrão, então as próprias compras grandes não inflam a
+régua. Mediana e MAD de todos os grupos saem de duas ordenações + bincount, sem
+loop Python por transação ou por categoria.
+
+    z = 0.6745 * (x - mediana) / MAD
+
+Com MAD = 0 (metade ou mais dos valores iguais, ex: assinaturas) cai para o
+desvio absoluto médio: z = (x - mediana) / (1.2533 * MeanAD).
+
+Uso:
+    python anomalies.py                       # últimos 30 dias x histórico
+    python anomalies.py 2026-01-01 2026-02-01 # janela [início, fim)
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from finance_db import get_connection
+except ImportError:
+    from scripts.finance_db import get_connection
+
+try:
+    from sklearn.ensemble import IsolationForest
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+ROBUST_Z_THRESHOLD = 3.5
+MAD_SCALE = 0.6745       # MAD -> desvio padrão de uma normal
+MEANAD_SCALE = 1.253314  # MeanAD -> desvio padrão de uma normal
+MIN_GROUP_SIZE = 5       # grupos menores não são pontuados (z = 0)
+
+COLUMN_DTYPE = [("id", "i8"), ("date", "datetime64[D]"), ("amount", "f8"), ("category_id", "i8")]
+
+COLUMNS_QUERY = '''
+    SELECT id, date, ABS(amount), COALESCE(category_id, 0)
+    FROM transactions
+    WHERE type = 'expense'
+'''
+
+
+@dataclass
+class LedgerColumns:
+    """Despesas do ledger em colunas (uma posição por transação)."""
+    ids: np.ndarray
+    dates: np.ndarray        # datetime64[D]
+    amounts: np.ndarray      # valor absoluto
+    codes: np.ndarray        # índice em `categories`
+    categories: List[str]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def window(self, start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+        """Máscara do intervalo semiaberto [start, end) (None = sem limite)."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if start:
+            mask &= self.dates >= np.datetime64(start, "D")
+        if end:
+            mask &= self.dates < np.datetime64(end, "D")
+        return mask
+
+
+def load_expense_columns(start: Optional[str] = None, end: Optional[str] = None) -> LedgerColumns:
+    """Carrega id, data, valor e categoria das despesas em [start, end)."""
+    query = COLUMNS_QUERY
+    params = []
+    if start:
+        query += " AND date >= ?"
+        params.append(start)
+    if end:
+        query += " AND date < ?"
+        params.append(end)
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        rows = np.array(cursor.fetchall(), dtype=COLUMN_DTYPE)
+        names = dict(conn.execute("SELECT id, name FROM categories").fetchall())
+    finally:
+        conn.close()
+
+    category_ids, codes = np.unique(rows["category_id"], return_inverse=True)
+    return LedgerColumns(
+        ids=rows["id"],
+        dates=rows["date"],
+        amounts=rows["amount"],
+        codes=codes.astype(np.int64),
+        categories=[names.get(int(cid), "sem categoria") for cid in category_ids],
+    )
+
+
+def group_medians(values: np.ndarray, codes: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mediana de `values` por grupo (codes em 0..n_groups-1), em uma ordenação.
+
+    Returns:
+        (medianas, tamanhos); grupos vazios têm mediana NaN
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    medians = np.full(n_groups, np.nan)
+    if len(values) == 0:
+        return medians, counts
+
+    # Ordena por valor e depois (estável) por grupo: mesmo resultado de
+    # lexsort((values, codes)), mas o segundo sort é radix nos códigos estreitos
+    order = np.argsort(values)
+    group_keys = codes[order].astype(np.min_scalar_type(max(n_groups - 1, 0)))
+    ordered = values[order[np.argsort(group_keys, kind="stable")]]
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lo] + ordered[hi]) / 2
+    return medians, counts
+
+
+def robust_scale(values: np.ndarray, codes: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mediana e escala robusta por grupo (MAD / 0.6745; MeanAD * 1.2533 se MAD = 0).
+
+    Returns:
+        (medianas, escalas, tamanhos)
+    """
+    medians, counts = group_medians(values, codes, n_groups)
+    deviations = np.abs(values - medians[codes])
+    mad, _ = group_medians(deviations, codes, n_groups)
+    mean_ad = np.divide(np.bincount(codes, deviations, minlength=n_groups), counts,
+                        out=np.zeros(n_groups), where=counts > 0)
+    scale = np.where(mad > 0, mad / MAD_SCALE, mean_ad * MEANAD_SCALE)
+    return medians, np.nan_to_num(scale), counts
+
+
+def robust_zscores(
+    values: np.ndarray,
+    codes: np.ndarray,
+    n_groups: int,
+    baseline: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    z-score robusto de cada valor contra o seu grupo.
+
+    Args:
+        baseline: máscara das linhas que definem mediana/MAD (padrão: todas)
+
+    Returns:
+        (z, medianas, escalas); z = 0 em grupos com menos de MIN_GROUP_SIZE
+        linhas no baseline ou sem dispersão
+    """
+    if baseline is None:
+        medians, scale, counts = robust_scale(values, codes, n_groups)
+    else:
+        medians, scale, counts = robust_scale(values[baseline], codes[baseline], n_groups)
+    usable = (counts >= MIN_GROUP_SIZE) & (scale > 0)
+    safe_scale = np.where(usable, scale, 1.0)
+    z = np.where(usable[codes], (values - np.nan_to_num(medians)[codes]) / safe_scale[codes], 0.0)
+    return z, medians, scale
+
+
+def isolation_flags(
+    values: np.ndarray,
+    z: np.ndarray,
+    baseline: np.ndarray,
+    contamination="auto",
+    random_state: int = 42
+) -> np.ndarray:
+    """
+    Modo IsolationForest sobre as mesmas colunas: features (log do valor,
+    z robusto da categoria), treinado no baseline. Requer scikit-learn.
+    """
+    if not SKLEARN_AVAILABLE:
+        raise ImportError("scikit-learn não instalado: use method='mad'")
+    features = np.column_stack([np.log1p(values), z])
+    model = IsolationForest(contamination=contamination, random_state=random_state)
+    model.fit(features[baseline])
+    return model.predict(features) == -1
+
+
+def _descriptions(ids: np.ndarray) -> Dict[int, str]:
+    """Descrições só das linhas sinalizadas (as colunas não carregam texto)."""
+    result = {}
+    conn = get_connection()
+    try:
+        id_list = [int(i) for i in ids]
+        for i in range(0, len(id_list), 500):
+            chunk = id_list[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            result.update(conn.execute(
+                f"SELECT id, description FROM transactions WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+    finally:
+        conn.close()
+    return result
+
+
+def detect_anomalies(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    baseline_start: Optional[str] = None,
+    baseline_end: Optional[str] = None,
+    threshold: float = ROBUST_Z_THRESHOLD,
+    by_category: bool = True,
+    two_sided: bool = False,
+    method: str = "mad",
+    columns: Optional[LedgerColumns] = None
+) -> List[Dict]:
+    """
+    Despesas atípicas na janela [start, end), pontuadas contra o baseline
+    [baseline_start, baseline_end) (padrão: todo o histórico carregado).
+
+    Args:
+        by_category: mediana/MAD por categoria (False = todas juntas)
+        two_sided: sinaliza também valores muito abaixo da mediana
+        method: "mad" (z robusto) ou "isolation_forest" (requer scikit-learn)
+        columns: colunas já carregadas (reaproveitadas entre chamadas)
+
+    Returns:
+        [{id, date, description, amount, category, z_score, median, scale}],
+        ordenado por |z| decrescente
+    """
+    if columns is None:
+        columns = load_expense_columns()
+    if len(columns) == 0:
+        return []
+
+    codes = columns.codes if by_category else np.zeros(len(columns), dtype=np.int64)
+    n_groups = len(columns.categories) if by_category else 1
+    baseline = columns.window(baseline_start, baseline_end)
+    target = columns.window(start, end)
+
+    z, medians, scale = robust_zscores(columns.amounts, codes, n_groups, baseline)
+    if method == "isolation_forest":
+        flagged = target & isolation_flags(columns.amounts, z, baseline)
+    elif method == "mad":
+        flagged = target & ((np.abs(z) if two_sided else z) > threshold)
+    else:
+        raise ValueError(f"method deve ser 'mad' ou 'isolation_forest': {method!r}")
+
+    rows = np.flatnonzero(flagged)
+    rows = rows[np.argsort(-np.abs(z[rows]), kind="stable")]
+    descriptions = _descriptions(columns.ids[rows])
+    return [
+        {
+            "id": int(columns.ids[i]),
+            "date": str(columns.dates[i]),
+            "description": descriptions.get(int(columns.ids[i]), ""),
+            "amount": float(columns.amounts[i]),
+            "category": columns.categories[columns.codes[i]],
+            "z_score": round(float(z[i]), 2),
+            "median": float(medians[codes[i]]),
+            "scale": float(scale[codes[i]]),
+        }
+        for i in rows
+    ]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 2:
+        start, end = sys.argv[1], sys.argv[2]
+    else:
+        start, end = (date.today() - timedelta(days=30)).isoformat(), None
+
+    for a in detect_anomalies(start, end):
+        print(f"{a['date']}  {a['description'][:30]:30}  R$ {a['amount']:>10,.2f}  "
+              f"{a['category']:12}  z={a['z_score']:5.1f}  (mediana R$ {a['median']:,.2f})")
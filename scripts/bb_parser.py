@@ -4,10 +4,14 @@ BB Parser Module
 Parseia transacoes extraidas do Banco do Brasil.
 """
 
+import io
 import re
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
 
 # Mapeamento de palavras-chave para categorias
 CATEGORY_KEYWORDS = {
@@ -109,15 +113,6 @@ CATEGORY_KEYWORDS = {
         "materiais construcao", "acabamento", "eletrica", "hidraulica",
         "moveis planejados", "marcenaria", "serralheria",
     ],
-    "taxas": [
-        "iof", "taxa", "tarifa", "anuidade", "seguro", "juros",
-        "multa", "cartorio", "despachante", "detran",
-        # Adicionados Jan 2026
-        "receita federal", "darf", "imposto", "tributo",
-        "tokio marine", "porto seguro", "bradesco seguros",
-        "shopping", "estacion",  # Estacionamento parcial match
-        "devolucao",
-    ],
     "esportes": [
         "thiago mariotti", "thiago adauto", "tenis", "quadra", "raquete",
         "esporte", "academia esport", "clube esport", "aula tenis",
@@ -139,29 +134,207 @@ class ParsedTransaction:
     raw_text: str = ""
 
 
-def categorize_transaction(description: str) -> str:
-    """Categoriza transacao baseado em palavras-chave."""
-    desc_lower = description.lower()
+class KeywordMatcher:
+    """
+    Automato Aho-Corasick sobre as palavras-chave das categorias.
+
+    Compilado uma vez; cada descricao e percorrida em uma unica passada.
+    Prioridade igual a do loop original: vence a primeira categoria (na
+    ordem do dicionario) com alguma palavra-chave contida na descricao.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], default: str = "compras"):
+        self.categories = list(keywords)
+        self.default = default
+        none = len(self.categories)
+
+        # Trie: goto[estado][caractere] -> estado; output = melhor categoria
+        goto: List[Dict[str, int]] = [{}]
+        output = [none]
+        for priority, category in enumerate(self.categories):
+            for keyword in keywords[category]:
+                state = 0
+                for ch in keyword:
+                    if ch not in goto[state]:
+                        goto.append({})
+                        output.append(none)
+                        goto[state][ch] = len(goto) - 1
+                    state = goto[state][ch]
+                output[state] = min(output[state], priority)
+
+        # Links de falha em BFS; output herda o do sufixo
+        fail = [0] * len(goto)
+        bfs_order = [0]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            bfs_order.append(state)
+            for ch, child in goto[state].items():
+                queue.append(child)
+                link = fail[state]
+                while link and ch not in goto[link]:
+                    link = fail[link]
+                fail[child] = goto[link].get(ch, 0) if state else 0
+                output[child] = min(output[child], output[fail[child]])
+
+        # DFA completo (sem seguir falhas no match), em BFS para que o
+        # estado de falha ja esteja pronto; caractere fora do alfabeto
+        # volta para a raiz
+        alphabet = {ch for edges in goto for ch in edges}
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        for state in bfs_order:
+            for ch in alphabet:
+                if ch in goto[state]:
+                    delta[state][ch] = goto[state][ch]
+                elif state:
+                    delta[state][ch] = delta[fail[state]][ch]
+                else:
+                    delta[state][ch] = 0
+
+        self._delta = delta
+        self._output = output
+
+    def match(self, description: str) -> str:
+        """Categoria de uma descricao."""
+        delta, output = self._delta, self._output
+        best = len(self.categories)
+        state = 0
+        for ch in description.lower():
+            state = delta[state].get(ch, 0)
+            if output[state] < best:
+                best = output[state]
+                if best == 0:
+                    break
+        return self.categories[best] if best < len(self.categories) else self.default
+
+    def match_many(self, descriptions: Iterable[str]) -> List[str]:
+        """Categorias de varias descricoes (descricoes repetidas sao casadas uma vez)."""
+        seen: Dict[str, str] = {}
+        result = []
+        for description in descriptions:
+            category = seen.get(description)
+            if category is None:
+                category = seen[description] = self.match(description)
+            result.append(category)
+        return result
+
+
+_KEYWORD_MATCHER = KeywordMatcher(CATEGORY_KEYWORDS)
+
+
+# Categoria conhecida de um estabelecimento (None = desconhecido)
+MerchantLookup = Callable[[str], Optional[str]]
+
+
+@lru_cache(maxsize=None)
+def _finance_db():
+    """finance_db importado sob demanda: parsear e categorizar nao exigem o banco."""
+    try:
+        import finance_db
+    except ImportError:
+        from scripts import finance_db
+    return finance_db
+
+
+def lookup_known_merchant(description: str) -> Optional[str]:
+    """
+    Categoria aprendida do ledger (finance_db.merchant_categories). Sem banco
+    em finance_db.DB_PATH retorna None, sem criar nem migrar o banco.
+    """
+    finance_db = _finance_db()
+    if not Path(finance_db.DB_PATH).exists():
+        return None
+    return finance_db.lookup_merchant_category(description)
+
+
+def categorize_transaction(
+    description: str,
+    merchant_lookup: Optional[MerchantLookup] = lookup_known_merchant
+) -> str:
+    """
+    Categoriza transacao: primeiro o cache de estabelecimentos
+    (merchant_lookup; None = so palavras-chave), depois as palavras-chave.
+    """
+    known = merchant_lookup(description) if merchant_lookup else None
+    return known or _KEYWORD_MATCHER.match(description)
 
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in desc_lower:
-                return category
 
-    return "compras"  # Default
+def categorize_many(
+    descriptions: Iterable[str],
+    merchant_lookup: Optional[MerchantLookup] = lookup_known_merchant
+) -> List[str]:
+    """
+    Categoriza varias descricoes de uma vez: estabelecimentos conhecidos pelo
+    merchant_lookup, o resto em lote no KeywordMatcher.match_many.
+    """
+    descriptions = list(descriptions)
+    known: Dict[str, Optional[str]] = {}
+    if merchant_lookup:
+        for description in descriptions:
+            if description not in known:
+                known[description] = merchant_lookup(description)
+
+    fallback = iter(_KEYWORD_MATCHER.match_many(d for d in descriptions if not known.get(d)))
+    return [known.get(description) or next(fallback) for description in descriptions]
+
+
+# Padroes de parcelamento, testados nesta ordem (o primeiro que casar vence)
+INSTALLMENT_PATTERNS = [
+    re.compile(r"(\d+)/(\d+)"),                   # 3/10
+    re.compile(r"(\d+)\s*DE\s*(\d+)", re.I),       # 3 DE 10
+    re.compile(r"PARC\s*(\d+)/(\d+)", re.I),       # PARC 3/10
+    re.compile(r"PARCELA\s*(\d+)", re.I),          # PARCELA 3 (sem total)
+]
+
+_AMOUNT_NOISE = re.compile(r"[^\d,.-]")
+
+# Data DD/MM/AAAA, DD/MM/AA, DD-MM-AAAA ou DD.MM.AAAA (campo inteiro)
+DATE_PATTERN = r"(?P<day>\d{1,2})(?P<dsep>[/.-])(?P<month>\d{1,2})(?P=dsep)(?P<year>\d{4}|\d{2})"
+DATE_RE = re.compile(r"\s*" + DATE_PATTERN + r"\s*$")
+
+# Valor no padrao brasileiro (R$ 1.234,56)
+AMOUNT_PATTERN = r"(?:R\$\s*)?(?P<reais>\d{1,3}(?:\.\d{3})+|\d+),(?P<centavos>\d{2})"
+
+# Linha da fatura "DATA | DESCRICAO | ... | VALOR" em uma unica passada:
+# data e valor no formato comum ja saem decompostos; se nao, o campo bruto
+# vai para parse_date/parse_amount. Linhas fora desse formato (tab, espacos,
+# campos vazios) usam o split por separadores.
+BB_LINE_RE = re.compile(r"""
+    ^\s*(?:""" + DATE_PATTERN + r"""|(?P<date>[^|]*?[^|\s]))\s*\|   # DATA
+    \s*(?P<description>[^|]*?[^|\s])\s*\|                          # DESCRICAO
+    (?:[^|]*[^|\s][^|]*\|)*?                                       # colunas intermediarias
+    \s*(?:""" + AMOUNT_PATTERN + r"""|(?P<amount>[^|]*?[^|\s]))\s*$  # VALOR
+""", re.X)
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def decode_date(day: int, month: int, year: int) -> Optional[str]:
+    """Valida dia/mes/ano e monta YYYY-MM-DD (None se a data nao existe)."""
+    if not 1 <= month <= 12 or day < 1 or year < 1:
+        return None
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if day > _DAYS_IN_MONTH[month - 1] + (month == 2 and leap):
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+@lru_cache(maxsize=4096)
+def _date_from_parts(day: str, sep: str, month: str, year: str) -> Optional[str]:
+    """Data das partes capturadas (faturas repetem poucas datas)."""
+    if len(year) == 4:
+        return decode_date(int(day), int(month), int(year))
+    # Ano com 2 digitos so no formato com barra (mesma regra do %y)
+    if sep == "/":
+        short = int(year)
+        return decode_date(int(day), int(month), short + (2000 if short < 69 else 1900))
+    return None
 
 
 def parse_installment(description: str) -> Tuple[Optional[int], Optional[int]]:
     """Extrai informacao de parcelamento."""
-    patterns = [
-        r"(\d+)/(\d+)",           # 3/10
-        r"(\d+)\s*DE\s*(\d+)",    # 3 DE 10
-        r"PARC\s*(\d+)/(\d+)",    # PARC 3/10
-        r"PARCELA\s*(\d+)",       # PARCELA 3 (sem total)
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, description.upper())
+    for pattern in INSTALLMENT_PATTERNS:
+        match = pattern.search(description)
         if match:
             groups = match.groups()
             if len(groups) == 2:
@@ -175,7 +348,7 @@ def parse_installment(description: str) -> Tuple[Optional[int], Optional[int]]:
 def parse_amount(amount_str: str) -> float:
     """Converte string de valor para float."""
     # Remove caracteres nao numericos exceto virgula e ponto
-    cleaned = re.sub(r"[^\d,.-]", "", amount_str)
+    cleaned = _AMOUNT_NOISE.sub("", amount_str)
 
     # Padrao brasileiro: 1.234,56
     if "," in cleaned:
@@ -189,25 +362,55 @@ def parse_amount(amount_str: str) -> float:
 
 def parse_date(date_str: str) -> str:
     """Converte string de data para formato padrao YYYY-MM-DD."""
-    patterns = [
-        ("%d/%m/%Y", date_str),
-        ("%d/%m/%y", date_str),
-        ("%d-%m-%Y", date_str),
-        ("%d.%m.%Y", date_str),
-    ]
-
-    for fmt, ds in patterns:
-        try:
-            dt = datetime.strptime(ds.strip(), fmt)
-            return dt.strftime("%Y-%m-%d")
-        except ValueError:
-            continue
+    match = DATE_RE.match(date_str)
+    if match:
+        decoded = _date_from_parts(*match.group("day", "dsep", "month", "year"))
+        if decoded:
+            return decoded
 
     # Se nao conseguiu parsear, retorna o mes atual
     return datetime.now().strftime("%Y-%m-01")
 
 
-def parse_bb_transactions(raw_data: str) -> List[ParsedTransaction]:
+def split_bb_line(line: str) -> Optional[List[str]]:
+    """Divide a linha pelo primeiro separador que der 3+ campos (caminho lento)."""
+    parts = None
+    for sep in ["|", "\t", "   "]:
+        if sep in line:
+            parts = [p.strip() for p in line.split(sep) if p.strip()]
+            if len(parts) >= 3:
+                break
+
+    if not parts or len(parts) < 3:
+        return None
+    return parts
+
+
+def tokenize_bb_line(line: str) -> Optional[Tuple[str, str, float]]:
+    """
+    Extrai (data YYYY-MM-DD, descricao, valor) de uma linha da fatura.
+    Usa BB_LINE_RE quando possivel; senao, o split por separadores.
+    """
+    match = BB_LINE_RE.match(line)
+    if match is None:
+        parts = split_bb_line(line)
+        if parts is None:
+            return None
+        return parse_date(parts[0]), parts[1], parse_amount(parts[-1])
+
+    day, sep, month, year, date_field, description, reais, centavos, amount_field = match.groups()
+    date_str = (day and _date_from_parts(day, sep, month, year)) or parse_date(date_field or "")
+    if reais:
+        amount = float(reais.replace(".", "") + "." + centavos)
+    else:
+        amount = parse_amount(amount_field)
+    return date_str, description, amount
+
+
+def parse_bb_transactions(
+    raw_data: str,
+    merchant_lookup: Optional[MerchantLookup] = lookup_known_merchant
+) -> List[ParsedTransaction]:
     """
     Parseia texto bruto extraido da fatura BB.
 
@@ -219,43 +422,52 @@ def parse_bb_transactions(raw_data: str) -> List[ParsedTransaction]:
     Exemplo:
     15/01/2026 | IFOOD *RESTAURANTE | R$ 45,90
     """
-    transactions = []
+    return list(iter_bb_transactions(raw_data, merchant_lookup))
+
 
-    # Separar por linhas
-    lines = raw_data.strip().split("\n")
+def iter_bb_transactions(
+    source: Union[str, Path, Iterable[str]],
+    merchant_lookup: Optional[MerchantLookup] = lookup_known_merchant
+) -> Iterator[ParsedTransaction]:
+    """
+    Versao em streaming de parse_bb_transactions: gera uma transacao por
+    linha valida, sem carregar o arquivo inteiro.
+
+    Args:
+        source: texto bruto (str), caminho do arquivo (Path) ou qualquer
+                iteravel de linhas (ex: arquivo aberto)
+        merchant_lookup: categoria conhecida do estabelecimento, consultada
+                         antes das palavras-chave (None = so palavras-chave)
+    """
+    if isinstance(source, Path):
+        with open(source, "r", encoding="utf-8") as f:
+            yield from iter_bb_transactions(f, merchant_lookup)
+        return
+
+    lines = io.StringIO(source) if isinstance(source, str) else source
 
     for line in lines:
         line = line.strip()
         if not line:
             continue
 
-        # Tentar diferentes separadores
-        parts = None
-        for sep in ["|", "\t", "   "]:
-            if sep in line:
-                parts = [p.strip() for p in line.split(sep) if p.strip()]
-                if len(parts) >= 3:
-                    break
-
-        if not parts or len(parts) < 3:
-            continue
-
         try:
             # Extrair campos
-            date_str = parse_date(parts[0])
-            description = parts[1]
-            amount = parse_amount(parts[-1])
+            fields = tokenize_bb_line(line)
+            if fields is None:
+                continue
+            date_str, description, amount = fields
 
             if amount == 0:
                 continue
 
             # Categorizar
-            category = categorize_transaction(description)
+            category = categorize_transaction(description, merchant_lookup)
 
             # Verificar parcelamento
             inst_current, inst_total = parse_installment(description)
 
-            transactions.append(ParsedTransaction(
+            parsed = ParsedTransaction(
                 date=date_str,
                 description=description,
                 amount=amount,
@@ -263,18 +475,21 @@ def parse_bb_transactions(raw_data: str) -> List[ParsedTransaction]:
                 installment_current=inst_current,
                 installment_total=inst_total,
                 raw_text=line
-            ))
+            )
 
         except Exception as e:
             print(f"Erro ao parsear linha: {line} - {e}")
             continue
 
-    return transactions
+        yield parsed
 
 
-def import_to_database(transactions: List[ParsedTransaction], source: str = "bb_fatura") -> Dict:
-    """Importa transacoes parseadas para o banco."""
-    from scripts.finance_db import add_transaction
+def import_to_database(transactions: Iterable[ParsedTransaction], source: str = "bb_fatura") -> Dict:
+    """
+    Importa transacoes parseadas para o banco em lotes (add_transactions_chunked).
+    Aceita lista ou gerador (ex: iter_bb_transactions(Path(...))).
+    """
+    add_transactions_chunked = _finance_db().add_transactions_chunked
 
     results = {
         "inserted": 0,
@@ -283,28 +498,32 @@ def import_to_database(transactions: List[ParsedTransaction], source: str = "bb_
         "total_amount": 0
     }
 
-    for tx in transactions:
-        try:
-            result = add_transaction(
-                date_str=tx.date,
-                description=tx.description,
-                amount=tx.amount,
-                category=tx.category,
-                installment_current=tx.installment_current,
-                installment_total=tx.installment_total,
-                source=source
-            )
-
-            if result["status"] == "inserted":
-                results["inserted"] += 1
-                results["total_amount"] += tx.amount
-            elif result["status"] == "duplicate":
-                results["duplicates"] += 1
-
-        except Exception as e:
-            print(f"Erro ao importar: {tx.description} - {e}")
-            results["errors"] += 1
-
+    consumed = 0
+
+    def rows():
+        nonlocal consumed
+        for tx in transactions:
+            consumed += 1
+            yield {
+                "date": tx.date,
+                "description": tx.description,
+                "amount": tx.amount,
+                "category": tx.category,
+                "installment_current": tx.installment_current,
+                "installment_total": tx.installment_total,
+            }
+
+    stats: Dict = {}
+    try:
+        add_transactions_chunked(rows(), source=source, stats=stats)
+    except Exception as e:
+        # Lotes anteriores ficam gravados; o lote com erro e descartado
+        results["errors"] = consumed - stats.get("total", 0)
+        print(f"Erro ao importar lote de {results['errors']} transacoes: {e}")
+
+    results["inserted"] = stats.get("inserted", 0)
+    results["duplicates"] = stats.get("duplicates", 0)
+    results["total_amount"] = stats.get("total_amount", 0)
     return results
 
 
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Parser de linhas da fatura BB
+
+Compara em linhas sintéticas (padrão: 200k) a implementação anterior
+(split por separadores + 4 re.search + até 4 strptime por linha) com o
+tokenizador atual (BB_LINE_RE decompõe data e valor na mesma passada,
+decode_date em vez de strptime, padrões de parcela pré-compilados):
+
+1. só os campos: data, descrição, parcela e valor
+2. parse_bb_transactions completo (inclui categorização)
+
+Antes de medir, confere que as duas versões produzem as mesmas transações.
+A categorização usa um banco temporário (cache de estabelecimentos vazio).
+
+Uso:
+    python scripts/benchmarks/bench_bb_parser.py
+    python scripts/benchmarks/bench_bb_parser.py --rows 500000
+"""
+
+import argparse
+import dataclasses
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import finance_db
+from bb_parser import (CATEGORY_KEYWORDS, ParsedTransaction, categorize_transaction,
+                       parse_bb_transactions, parse_installment, tokenize_bb_line)
+
+
+# ---- Implementação anterior (referência) ----
+
+def legacy_parse_installment(description: str):
+    patterns = [r"(\d+)/(\d+)", r"(\d+)\s*DE\s*(\d+)", r"PARC\s*(\d+)/(\d+)", r"PARCELA\s*(\d+)"]
+    for pattern in patterns:
+        match = re.search(pattern, description.upper())
+        if match:
+            groups = match.groups()
+            if len(groups) == 2:
+                return int(groups[0]), int(groups[1])
+            elif len(groups) == 1:
+                return int(groups[0]), None
+    return None, None
+
+
+def legacy_parse_amount(amount_str: str) -> float:
+    cleaned = re.sub(r"[^\d,.-]", "", amount_str)
+    if "," in cleaned:
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    try:
+        return abs(float(cleaned))
+    except ValueError:
+        return 0.0
+
+
+def legacy_parse_date(date_str: str) -> str:
+    for fmt in ("%d/%m/%Y", "%d/%m/%y", "%d-%m-%Y", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(date_str.strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return datetime.now().strftime("%Y-%m-01")
+
+
+def legacy_fields(line: str):
+    parts = None
+    for sep in ["|", "\t", "   "]:
+        if sep in line:
+            parts = [p.strip() for p in line.split(sep) if p.strip()]
+            if len(parts) >= 3:
+                break
+    if not parts or len(parts) < 3:
+        return None
+    return (legacy_parse_date(parts[0]), parts[1], legacy_parse_installment(parts[1]),
+            legacy_parse_amount(parts[-1]))
+
+
+def legacy_parse_bb_transactions(raw_data: str):
+    transactions = []
+    for line in raw_data.strip().split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        fields = legacy_fields(line)
+        if fields is None:
+            continue
+        date_str, description, (inst_current, inst_total), amount = fields
+        if amount == 0:
+            continue
+        transactions.append(ParsedTransaction(
+            date=date_str, description=description, amount=amount,
+            category=categorize_transaction(description),
+            installment_current=inst_current, installment_total=inst_total, raw_text=line
+        ))
+    return transactions
+
+
+# ---- Implementação atual ----
+
+def current_fields(line: str):
+    fields = tokenize_bb_line(line)
+    if fields is None:
+        return None
+    date_str, description, amount = fields
+    return date_str, description, parse_installment(description), amount
+
+
+def build_lines(rows: int, seed: int = 42):
+    """Linhas no formato da fatura: maioria com "|", algumas com tab."""
+    rng = random.Random(seed)
+    merchants = [k.upper() for words in CATEGORY_KEYWORDS.values() for k in words]
+    lines = []
+    for _ in range(rows):
+        description = rng.choice(merchants)
+        if rng.random() < 0.2:
+            description += f" PARC {rng.randint(1, 9):02d}/{rng.randint(10, 12)}"
+        date_str = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026"
+        amount = f"R$ {rng.uniform(5, 3000):,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+        sep = " | " if rng.random() < 0.9 else "\t"
+        lines.append(sep.join([date_str, description, amount]))
+    return lines
+
+
+def lines_per_second(fn, arg, rows: int) -> float:
+    start = time.perf_counter()
+    fn(arg)
+    return rows / (time.perf_counter() - start)
+
+
+def run(rows: int):
+    lines = build_lines(rows)
+    raw = "\n".join(lines)
+    print(f"{rows:,} linhas sintéticas\n")
+
+    assert [legacy_fields(line) for line in lines] == [current_fields(line) for line in lines]
+    as_tuples = lambda txs: [dataclasses.astuple(tx) for tx in txs]
+    assert as_tuples(legacy_parse_bb_transactions(raw)) == as_tuples(parse_bb_transactions(raw))
+
+    results = [
+        ("campos (anterior)", lines_per_second(lambda ls: [legacy_fields(x) for x in ls], lines, rows)),
+        ("campos (tokenizador)", lines_per_second(lambda ls: [current_fields(x) for x in ls], lines, rows)),
+        ("parse_bb (anterior)", lines_per_second(legacy_parse_bb_transactions, raw, rows)),
+        ("parse_bb (atual)", lines_per_second(parse_bb_transactions, raw, rows)),
+    ]
+
+    print("-" * 50)
+    for label, rate in results:
+        print(f"{label:24} {rate:>14,.0f} linhas/s")
+    print("-" * 50)
+    print(f"Ganho nos campos: {results[1][1] / results[0][1]:.1f}x  |  "
+          f"parse completo: {results[3][1] / results[2][1]:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parser de linhas da fatura BB")
+    parser.add_argument("--rows", type=int, default=200_000, help="Número de linhas")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        finance_db.DB_PATH = Path(tmp) / "bench.db"
+        try:
+            run(args.rows)
+        finally:
+            finance_db.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
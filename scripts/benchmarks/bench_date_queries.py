@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Filtros de data: strftime() vs intervalo semiaberto
+
+Gera um ledger sintético (padrão: 1M transações, 2015-2026) em um arquivo
+temporário e compara o resumo mensal por categoria em quatro cenários:
+
+1. strftime('%Y-%m', date) = ?   sem índice
+2. date >= ? AND date < ?         sem índice
+3. strftime('%Y-%m', date) = ?   com índices de migrate_schema
+4. date >= ? AND date < ?         com índices de migrate_schema
+
+Para cada cenário mostra o plano (EXPLAIN QUERY PLAN) e o tempo médio.
+O esperado: com strftime() o SQLite precisa avaliar a função em todas as
+linhas (no máximo ANY(date) no índice); o intervalo vira SEARCH
+(date>? AND date<?) no índice de cobertura e só lê as linhas do mês.
+
+Uso:
+    python scripts/benchmarks/bench_date_queries.py
+    python scripts/benchmarks/bench_date_queries.py --rows 200000 --repeat 5
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from finance_db import month_range
+from migrate_schema import QUERY_INDEXES
+
+CATEGORIES = ["alimentacao", "compras", "casa", "transporte", "saude",
+              "assinaturas", "lazer", "educacao", "taxas", "esportes", "obra"]
+
+STRFTIME_QUERY = '''
+    SELECT c.name, COALESCE(SUM(ABS(t.amount)), 0) as total
+    FROM categories c
+    LEFT JOIN transactions t ON t.category_id = c.id
+        AND strftime('%Y-%m', t.date) = ?
+        AND t.type = 'expense'
+    GROUP BY c.id
+'''
+
+RANGE_QUERY = '''
+    SELECT c.name, COALESCE(SUM(ABS(t.amount)), 0) as total
+    FROM categories c
+    LEFT JOIN transactions t ON t.category_id = c.id
+        AND t.date >= ? AND t.date < ?
+        AND t.type = 'expense'
+    GROUP BY c.id
+'''
+
+
+def build_ledger(path: Path, rows: int, first_year: int = 2015, last_year: int = 2026):
+    """Cria o ledger sintético com `rows` transações."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, date TEXT NOT NULL, description TEXT,
+            amount REAL NOT NULL, category_id INTEGER, type TEXT DEFAULT 'expense',
+            hash TEXT
+        );
+    ''')
+    conn.executemany("INSERT INTO categories (name) VALUES (?)", [(c,) for c in CATEGORIES])
+
+    rng = random.Random(42)
+    years = last_year - first_year + 1
+
+    def generate():
+        for i in range(rows):
+            year = first_year + rng.randrange(years)
+            date_str = f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            yield (date_str, f"TX {i}", round(rng.uniform(5, 900), 2),
+                   rng.randint(1, len(CATEGORIES)),
+                   "expense" if rng.random() < 0.95 else "income",
+                   f"{i:032x}")
+
+    conn.executemany(
+        "INSERT INTO transactions (date, description, amount, category_id, type, hash) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        generate()
+    )
+    conn.commit()
+    return conn
+
+
+def query_plan(conn, query: str, params) -> str:
+    rows = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return " | ".join(row[3] for row in rows)
+
+
+def time_query(conn, query: str, params, repeat: int) -> float:
+    conn.execute(query, params).fetchall()  # aquecer cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(query, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(rows: int, repeat: int, year: int, month: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "ledger.db"
+
+        print(f"Gerando ledger sintético com {rows:,} transações...")
+        start = time.perf_counter()
+        conn = build_ledger(db_path, rows)
+        print(f"  pronto em {time.perf_counter() - start:.1f}s\n")
+
+        strftime_params = (f"{year}-{month:02d}",)
+        range_params = month_range(year, month)
+        scenarios = [
+            ("strftime, sem índice", STRFTIME_QUERY, strftime_params),
+            ("intervalo, sem índice", RANGE_QUERY, range_params),
+        ]
+
+        results = []
+        for label, query, params in scenarios:
+            results.append((label, query_plan(conn, query, params),
+                            time_query(conn, query, params, repeat)))
+
+        print("Criando índices (migrate_schema.QUERY_INDEXES)...")
+        for _, ddl in QUERY_INDEXES:
+            conn.execute(ddl)
+        conn.execute("ANALYZE")
+        print()
+
+        scenarios = [
+            ("strftime, com índice", STRFTIME_QUERY, strftime_params),
+            ("intervalo, com índice", RANGE_QUERY, range_params),
+        ]
+        for label, query, params in scenarios:
+            results.append((label, query_plan(conn, query, params),
+                            time_query(conn, query, params, repeat)))
+
+        conn.close()
+
+    print(f"Resumo mensal {month:02d}/{year} (média de {repeat} execuções)")
+    print("-" * 78)
+    for label, plan, ms in results:
+        print(f"{label:24} {ms:>9.2f} ms")
+        print(f"  plano: {plan}")
+    print("-" * 78)
+
+    baseline = results[0][2]
+    best = results[-1][2]
+    if best > 0:
+        print(f"Ganho (intervalo + índice vs strftime): {baseline / best:,.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de filtros de data no ledger")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Número de transações sintéticas")
+    parser.add_argument("--repeat", type=int, default=10, help="Execuções por cenário")
+    parser.add_argument("--year", type=int, default=2026)
+    parser.add_argument("--month", type=int, default=1)
+    args = parser.parse_args()
+
+    run(args.rows, args.repeat, args.year, args.month)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,7 @@ from finance_db import (
     get_categories,
     get_transactions,
     get_monthly_summary,
-    get_active_installments
+    get_installment_calendar
 )
 
 # Configuracao de thresholds
@@ -67,7 +67,8 @@ class BudgetMonitor:
         self.month = month
         self.summary = get_monthly_summary(year, month)
         self.transactions = get_transactions(year=year, month=month, limit=500)
-        self.installments = get_active_installments()
+        self.installment_calendar = get_installment_calendar()
+        self.installments = self.installment_calendar.installments
         self.alerts: List[Alert] = []
 
     def check_all(self) -> List[Alert]:
@@ -143,26 +144,25 @@ class BudgetMonitor:
         days_threshold = ALERT_CONFIG["installment_ending_days"]
         today = datetime.now().date()
 
-        for inst in self.installments:
-            try:
-                end_date = datetime.strptime(inst["end_date"], "%Y-%m-%d").date()
-                days_remaining = (end_date - today).days
-
-                if 0 < days_remaining <= days_threshold:
-                    self.alerts.append(Alert(
-                        type="installment_ending",
-                        severity="info",
-                        category=inst.get("category_name"),
-                        message=f"Parcelamento '{inst['description'][:20]}' termina em {days_remaining} dias",
-                        value=days_remaining,
-                        threshold=days_threshold,
-                        timestamp=datetime.now().isoformat()
-                    ))
-            except (ValueError, TypeError):
-                pass
-
-        # Total comprometido com parcelamentos
-        total_installments = sum(i["installment_amount"] for i in self.installments)
+        ending = self.installment_calendar.ending_between(
+            today + timedelta(days=1), today + timedelta(days=days_threshold)
+        )
+        for inst in ending:
+            end_date = datetime.strptime(inst["end_date"], "%Y-%m-%d").date()
+            days_remaining = (end_date - today).days
+
+            self.alerts.append(Alert(
+                type="installment_ending",
+                severity="info",
+                category=inst.get("category_name"),
+                message=f"Parcelamento '{inst['description'][:20]}' termina em {days_remaining} dias",
+                value=days_remaining,
+                threshold=days_threshold,
+                timestamp=datetime.now().isoformat()
+            ))
+
+        # Total comprometido com parcelamentos no mes
+        total_installments = float(self.installment_calendar.committed(self.year, self.month, 1)[0])
         if total_installments > 5000:
             self.alerts.append(Alert(
                 type="installments_high",
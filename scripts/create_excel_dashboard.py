@@ -15,10 +15,10 @@ from pathlib import Path
 
 # Import database functions
 try:
-    from finance_db import (get_monthly_summary, get_categories, get_active_installments,
+    from finance_db import (get_monthly_summary, get_yearly_matrix, get_categories, project_commitments,
                             get_pj_monthly_summary, get_pj_yearly_summary, get_consolidated_summary)
 except ImportError:
-    from scripts.finance_db import (get_monthly_summary, get_categories, get_active_installments,
+    from scripts.finance_db import (get_monthly_summary, get_yearly_matrix, get_categories, project_commitments,
                                     get_pj_monthly_summary, get_pj_yearly_summary, get_consolidated_summary)
 
 # Paths
@@ -34,50 +34,24 @@ def get_category_data(year: int, month: int):
 
 def get_monthly_installments():
     """Get installment projections per month for 2026, grouped by category and major items."""
-    installments = get_active_installments()
+    by_category = project_commitments((2026, 1), 12, group_by="category")
+    by_class = project_commitments((2026, 1), 12, group_by="description_class")
 
     # Category mapping
     categories = ["alimentacao", "compras", "casa", "transporte", "saude",
                   "assinaturas", "lazer", "educacao", "taxas"]
 
     # Monthly projections by category
-    monthly = {m: {cat: 0 for cat in categories} for m in range(1, 13)}
-    monthly_total = {m: 0 for m in range(1, 13)}
+    monthly = {m: {cat: float(by_category.row(cat)[m - 1]) for cat in categories} for m in range(1, 13)}
+    for m in range(1, 13):
+        # Installments without category count as compras
+        monthly[m]["compras"] += float(by_category.row("sem categoria")[m - 1])
+    monthly_total = {m: float(total) for m, total in enumerate(by_category.total, 1)}
 
     # Major items tracking for Fluxo de Caixa
-    major_items = {m: {"moveis": 0, "mesa": 0, "eletros": 0, "outros": 0} for m in range(1, 13)}
-
-    for inst in installments:
-        amount = inst["installment_amount"]
-        start = inst["start_date"]
-        end = inst["end_date"]
-        cat_name = inst.get("category_name", "compras") or "compras"
-        description = inst.get("description", "").upper()
-
-        # Parse dates
-        start_year, start_month = int(start[:4]), int(start[5:7])
-        end_year, end_month = int(end[:4]), int(end[5:7])
-
-        # Calculate months active in 2026
-        for month in range(1, 13):
-            month_start = (2026, month)
-            inst_start = (start_year, start_month)
-            inst_end = (end_year, end_month)
-
-            if inst_start <= month_start <= inst_end:
-                if cat_name in categories:
-                    monthly[month][cat_name] += amount
-                monthly_total[month] += amount
-
-                # Classify major items
-                if "MOVEIS PLANEJADOS" in description:
-                    major_items[month]["moveis"] += amount
-                elif "MESA" in description and "CADEIRAS" in description:
-                    major_items[month]["mesa"] += amount
-                elif "ELETRODOMESTICOS" in description:
-                    major_items[month]["eletros"] += amount
-                else:
-                    major_items[month]["outros"] += amount
+    major_items = {m: {item: float(by_class.row(item)[m - 1])
+                       for item in ("moveis", "mesa", "eletros", "outros")}
+                   for m in range(1, 13)}
 
     return monthly, monthly_total, major_items
 
@@ -270,16 +244,14 @@ def create_dashboard_sheet(ws):
     month_names = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun"]
     BUDGET_VARIAVEIS = 16500
 
+    # Real = Transações reais do mês (meses futuros ficam zerados)
+    real_by_month = get_yearly_matrix(2026).month_totals()
+
     months = []
     for m in range(1, 7):
         # Projetado = Budget variáveis + Parcelamentos do mês
         projetado = BUDGET_VARIAVEIS + int(monthly_total.get(m, 0))
-        # Real = Transações reais do mês (só janeiro tem dados por enquanto)
-        if m == 1:
-            summary = get_monthly_summary(2026, m)
-            real = int(summary.get("total_spent", 0))
-        else:
-            real = 0
+        real = int(real_by_month[m-1])
         months.append([month_names[m-1], projetado, real])
 
     for row_idx, row_data in enumerate(months, 27):
@@ -336,18 +308,19 @@ def create_mensal_sheet(ws):
     total_budget = 0
     monthly_totals = {m: 0 for m in range(1, 7)}
 
+    # Category x month spending (future months have no data yet)
+    matrix = get_yearly_matrix(2026)
+
     row = 5
-    for cat_name, budget, spent_jan, pct in cat_data:
+    for cat_name, budget, _, pct in cat_data:
         ws.cell(row=row, column=1, value=cat_name).border = THIN_BORDER
         ws.cell(row=row, column=2, value=budget).border = THIN_BORDER
         ws.cell(row=row, column=2).number_format = 'R$ #,##0'
 
-        # Monthly spending (only January has data for now)
+        # Monthly spending
+        spent_by_month = matrix.category(cat_name.lower())
         for month_idx, month_num in enumerate(range(1, 7), 3):
-            if month_num == 1:
-                real = int(spent_jan)
-            else:
-                real = 0  # Future months - no data yet
+            real = int(spent_by_month[month_num - 1])
 
             cell = ws.cell(row=row, column=month_idx, value=real)
             cell.border = THIN_BORDER
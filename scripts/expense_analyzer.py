@@ -5,7 +5,6 @@ Analisa padroes de gastos, detecta anomalias e sugere otimizacoes.
 """
 
 import json
-import statistics
 from datetime import datetime, date, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -18,6 +17,7 @@ from finance_db import (
     get_monthly_summary,
     get_active_installments
 )
+from anomalies import ROBUST_Z_THRESHOLD, detect_anomalies
 
 # Paths
 BASE_PATH = Path(__file__).parent.parent
@@ -168,28 +168,26 @@ class ExpenseAnalyzer:
         return sorted_txs[:limit]
 
     def _detect_anomalies(self) -> List[Dict]:
-        """Detecta transacoes anomalas."""
+        """Detecta transacoes anomalas (z robusto contra o historico da categoria)."""
         anomalies = []
 
         if len(self.transactions) < 5:
             return anomalies
 
-        # Calcular estatisticas
-        amounts = [abs(t["amount"]) for t in self.transactions]
-        mean = statistics.mean(amounts)
-        stdev = statistics.stdev(amounts) if len(amounts) > 1 else 0
-
-        # Transacoes acima de 2 desvios padrao
-        threshold = mean + (2 * stdev)
-
-        for tx in self.transactions:
-            if abs(tx["amount"]) > threshold:
-                anomalies.append({
-                    "transaction": tx,
-                    "reason": "valor_atipico",
-                    "threshold": threshold,
-                    "description": f"Valor R$ {abs(tx['amount']):,.0f} e muito acima da media (R$ {mean:,.0f})"
-                })
+        start = date(self.year, self.month, 1)
+        end = date(self.year + self.month // 12, self.month % 12 + 1, 1)
+        by_id = {t["id"]: t for t in self.transactions}
+
+        # Mediana + ROBUST_Z_THRESHOLD desvios robustos da categoria (MAD), historico completo
+        for a in detect_anomalies(start.isoformat(), end.isoformat()):
+            threshold = a["median"] + ROBUST_Z_THRESHOLD * a["scale"]
+            anomalies.append({
+                "transaction": by_id.get(a["id"], a),
+                "reason": "valor_atipico",
+                "threshold": threshold,
+                "description": f"Valor R$ {a['amount']:,.0f} e muito acima do normal em "
+                               f"{a['category']} (mediana R$ {a['median']:,.0f})"
+            })
 
         return anomalies
 
@@ -11,14 +11,61 @@ METODOLOGIA DE DATAS:
 """
 
 import sqlite3
-import hashlib
 import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime, date
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+try:
+    from hashing import hash_many, transaction_hash
+except ImportError:
+    from scripts.hashing import hash_many, transaction_hash
 
 DB_PATH = Path(__file__).parent.parent / "data" / "finance.db"
 
+# PRAGMAs aplicados a cada conexão do pool (ver configure_connection_pool)
+# - WAL: leitores (dashboard) não bloqueiam escritores (importadores)
+# - synchronous=NORMAL: seguro com WAL, evita fsync a cada commit
+# - mmap_size / cache_size: leituras do ledger direto da memória
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,  # 256 MB
+    "cache_size": -20000,            # ~20 MB (valor negativo = KiB)
+    "temp_store": "MEMORY",
+}
+
+# Modo somente leitura (dashboard, páginas ML, sync Excel): mode=ro na URI,
+# query_only como segunda barreira e mmap mais agressivo (leitores não
+# competem com escritores no mesmo processo). Ver configure_read_only.
+READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 1024 * 1024 * 1024,  # 1 GB
+    "cache_size": -64000,             # ~64 MB
+    "temp_store": "MEMORY",
+}
+
+# Statements preparados mantidos por conexão (padrão do sqlite3: 128).
+# Os resumos/dashboards reutilizam poucas dezenas de queries fixas, mas
+# importadores e relatórios geram variações; 256 evita re-preparar.
+STATEMENT_CACHE_SIZE = 256
+
+# Réplica de leitura gerada por snapshot_database (backup API).
+# None = finance_replica.db no mesmo diretório de DB_PATH
+REPLICA_PATH: Optional[Path] = None
+
 
 def ensure_database_exists():
     """Verifica se o banco existe com schema correto, se não cria dados demo."""
@@ -80,44 +127,592 @@ def ensure_database_exists():
             print("Minimal database created with correct schema")
 
 
-def get_connection():
-    """Retorna conexao com o banco."""
-    ensure_database_exists()
-    conn = sqlite3.connect(DB_PATH)
+# ==================== CONNECTION POOL ====================
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Conexão reutilizável do pool.
+
+    close() não fecha o arquivo: apenas devolve a conexão ao pool.
+    Chamadas aninhadas (ex: generate_installment_transactions chamando
+    get_active_installments) são contadas, e só a última close() desfaz
+    uma transação não commitada — mesmo comportamento de uma conexão nova.
+
+    Por isso toda get_connection() precisa de close() em try/finally: uma
+    exceção sem close() deixa o contador acima de zero para sempre e a
+    thread passa a segurar transações abertas (e o lock de escrita do WAL).
+
+    A conexão é a mesma em todos os níveis: commit() de uma chamada
+    aninhada (ex: add_transaction) confirma também o que o chamador externo
+    já escreveu e ainda não commitou. Quem precisa de atomicidade entre
+    várias escritas não deve chamar funções que commitam no meio delas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._depth = 0
+
+    def close(self):
+        self._depth = max(0, self._depth - 1)
+        if self._depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def _close_for_real(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Pool de conexões SQLite com uma conexão por thread.
+
+    - Verificação de schema (ensure_database_exists + apply_migrations)
+      roda uma única vez por processo, na primeira conexão
+    - Cada thread reutiliza a sua conexão; conexões de threads já
+      encerradas são fechadas na próxima abertura (o Streamlit roda cada
+      rerun em uma thread nova). check_same_thread=False só serve para
+      permitir esse fechamento a partir de outra thread
+    - PRAGMAs configuráveis aplicados na abertura de cada conexão
+    - read_only=True abre com mode=ro e só confere a versão do schema
+      (check_schema_version), sem migrar; check_schema=False pula a
+      verificação (réplicas geradas por snapshot_database)
+    """
+
+    def __init__(self, db_path: Path, pragmas: Optional[Dict[str, Any]] = None,
+                 read_only: bool = False, check_schema: bool = True):
+        self.db_path = Path(db_path)
+        self.read_only = read_only
+        default = READ_ONLY_PRAGMAS if read_only else DEFAULT_PRAGMAS
+        self.pragmas = dict(default if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[Tuple[threading.Thread, PooledConnection]] = []
+        self._schema_checked = not check_schema
+
+    def _ensure_schema(self):
+        if self._schema_checked:
+            return
+        with self._lock:
+            if not self._schema_checked:
+                if self.read_only:
+                    check_schema_version(self.db_path)
+                else:
+                    ensure_database_exists()
+                    conn = sqlite3.connect(self.db_path)
+                    try:
+                        apply_migrations(conn)
+                    finally:
+                        conn.close()
+                self._schema_checked = True
+
+    def _open(self) -> PooledConnection:
+        if self.read_only:
+            conn = sqlite3.connect(read_only_uri(self.db_path), uri=True,
+                                   factory=PooledConnection, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, factory=PooledConnection,
+                                   check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            stale = [c for thread, c in self._connections if not thread.is_alive()]
+            self._connections = [(thread, c) for thread, c in self._connections if thread.is_alive()]
+            self._connections.append((threading.current_thread(), conn))
+        for c in stale:
+            c._close_for_real()
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Retorna a conexão da thread atual, abrindo se necessário."""
+        self._ensure_schema()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        conn.row_factory = sqlite3.Row
+        conn._depth += 1
+        return conn
+
+    def close_all(self):
+        """Fecha de fato todas as conexões abertas pelo pool."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn._close_for_real()
+        self._local = threading.local()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# Configuração do modo somente leitura (None = leitura e escrita)
+_read_only: Optional[Dict[str, Any]] = None
+
+
+def read_only_uri(path: Path) -> str:
+    """URI SQLite somente leitura para o arquivo."""
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+
+def connect_read_only(path: Optional[Path] = None) -> sqlite3.Connection:
+    """Conexão avulsa somente leitura (fora do pool), com row_factory Row."""
+    conn = sqlite3.connect(read_only_uri(path or DB_PATH), uri=True)
+    conn.execute("PRAGMA query_only = ON")
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_replica_path() -> Path:
+    """Caminho da réplica de leitura (REPLICA_PATH ou ao lado de DB_PATH)."""
+    return Path(REPLICA_PATH or Path(DB_PATH).parent / "finance_replica.db")
+
+
+def _snapshot_is_stale() -> bool:
+    max_age = _read_only["max_age"]
+    try:
+        return time.time() - os.path.getmtime(get_replica_path()) > max_age
+    except OSError:
+        return True
+
+
+def _build_pool() -> ConnectionPool:
+    if _read_only is None:
+        return ConnectionPool(DB_PATH)
+    if _read_only["snapshot"]:
+        return ConnectionPool(get_replica_path(), _read_only["pragmas"],
+                              read_only=True, check_schema=False)
+    return ConnectionPool(DB_PATH, _read_only["pragmas"], read_only=True)
+
+
+def get_pool() -> ConnectionPool:
+    """Retorna o pool do processo, criando-o na primeira chamada."""
+    global _pool
+    snapshot = _read_only is not None and _read_only["snapshot"]
+    if snapshot and _snapshot_is_stale():
+        # Réplica vencida: novo snapshot e pool reaberto sobre o arquivo novo
+        with _pool_lock:
+            if _snapshot_is_stale():
+                snapshot_database()
+                if _pool is not None:
+                    _pool.close_all()
+                _pool = None
+
+    target = get_replica_path() if snapshot else Path(DB_PATH)
+    if _pool is None or _pool.db_path != target:
+        with _pool_lock:
+            if _pool is None or _pool.db_path != target:
+                if _pool is not None:
+                    _pool.close_all()
+                _pool = _build_pool()
+    return _pool
+
+
+def configure_connection_pool(**pragmas) -> ConnectionPool:
+    """
+    Recria o pool com PRAGMAs customizados (mesclados aos padrões).
+
+    Exemplo:
+        configure_connection_pool(mmap_size=0, synchronous="FULL")
+    """
+    global _pool, _read_only
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _read_only = None
+        _pool = ConnectionPool(DB_PATH, {**DEFAULT_PRAGMAS, **pragmas})
+    return _pool
+
+
+def configure_read_only(snapshot: Optional[bool] = None, max_age: int = 300, **pragmas) -> ConnectionPool:
+    """
+    Coloca o processo em modo somente leitura: get_connection() passa a
+    devolver conexões mode=ro + query_only (escritas falham com
+    "attempt to write a readonly database").
+
+    Para processos que só leem (dashboard Streamlit, páginas ML). Em WAL,
+    leitores não bloqueiam nem são bloqueados pelos importadores. Nada é
+    escrito no banco principal: não cria o banco nem aplica migrações, só
+    avisa se o schema estiver atrasado (check_schema_version).
+
+    Args:
+        snapshot: lê da réplica (get_replica_path), cópia do banco gerada pela
+                  backup API e renovada quando tiver mais de max_age
+                  segundos — análises pesadas não tocam no arquivo principal.
+                  None = variável de ambiente FINANCE_DB_SNAPSHOT=1
+        max_age: idade máxima da réplica em segundos
+        **pragmas: sobrescrevem READ_ONLY_PRAGMAS
+
+    Idempotente: chamar de novo com a mesma configuração (ex: a cada rerun
+    do Streamlit) mantém o pool atual.
+
+    Exemplo:
+        configure_read_only(snapshot=True, max_age=600)
+    """
+    global _pool, _read_only
+    if snapshot is None:
+        snapshot = os.environ.get("FINANCE_DB_SNAPSHOT") == "1"
+    config = {
+        "snapshot": snapshot,
+        "max_age": max_age,
+        "pragmas": {**READ_ONLY_PRAGMAS, **pragmas},
+    }
+    if config != _read_only:
+        with _pool_lock:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = None
+            _read_only = config
+    return get_pool()
+
+
+def snapshot_database(dest: Optional[Path] = None) -> Path:
+    """
+    Copia o banco principal para `dest` (padrão get_replica_path()) com a backup
+    API do SQLite, que lê um estado consistente mesmo com escritores ativos.
+    A cópia é gravada em arquivo temporário e trocada atomicamente. O banco
+    principal é aberto somente leitura (sem migrações).
+    """
+    dest = Path(dest or get_replica_path())
+    tmp_path = dest.with_name(dest.name + ".tmp")
+
+    check_schema_version(DB_PATH)
+    src = sqlite3.connect(read_only_uri(DB_PATH), uri=True)
+    try:
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+            # Réplica em modo rollback journal: abre com mode=ro sem -wal/-shm
+            dst.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+    os.replace(tmp_path, dest)
+    return dest
+
+
+def close_connection_pool():
+    """Fecha todas as conexões do pool (ex: antes de mover/apagar o banco)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def get_connection():
+    """Retorna conexao com o banco (reutilizada do pool da thread atual)."""
+    return get_pool().acquire()
+
+
 def generate_hash(date_str: str, description: str, amount: float) -> str:
-    """Gera hash unico para evitar duplicatas com normalizacao robusta."""
-    # Normalizar descrição: remover espaços extras, lowercase
-    normalized_desc = ' '.join(description.strip().split()).lower()
-    # Formatar valor com 2 casas decimais para consistência
-    amount_str = f"{abs(amount):.2f}"
-    # Usar separador null byte (não aparece em texto normal)
-    content = f"{date_str}\x00{normalized_desc}\x00{amount_str}"
-    return hashlib.md5(content.encode()).hexdigest()
+    """Gera hash unico para evitar duplicatas (hash canonico de hashing.py)."""
+    return transaction_hash(date_str, description, amount)
 
 
-# ==================== CATEGORIES ====================
+# ==================== DATE RANGES ====================
+# Filtros de data sempre como intervalo semiaberto [inicio, fim) sobre a
+# coluna 'date' (TEXT YYYY-MM-DD). Diferente de strftime('%Y-%m', date) = ?,
+# a comparação direta permite que o SQLite use os índices em transactions(date).
+
+def month_range(year: int, month: int) -> tuple:
+    """Retorna (inicio, fim) do mês: '2026-01-01', '2026-02-01'."""
+    start = f"{year:04d}-{month:02d}-01"
+    if month == 12:
+        end = f"{year + 1:04d}-01-01"
+    else:
+        end = f"{year:04d}-{month + 1:02d}-01"
+    return start, end
+
+
+def year_range(year: int) -> tuple:
+    """Retorna (inicio, fim) do ano: '2026-01-01', '2027-01-01'."""
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+# ==================== ROLLUPS ====================
+# monthly_category_totals: gasto por (ano, mês, categoria, tipo) mantido por
+# triggers em transactions, para que os resumos leiam O(categorias x meses)
+# linhas em vez de varrer o ledger. Vale para qualquer escritor (inclusive
+# scripts com sqlite3.connect direto). rebuild_rollups() reconstrói do zero.
+# category_id/type nulos viram 0/'' (a chave primária não aceita NULL).
+
+ROLLUP_KEY_NEW = (
+    "CAST(substr(NEW.date, 1, 4) AS INTEGER), CAST(substr(NEW.date, 6, 2) AS INTEGER), "
+    "COALESCE(NEW.category_id, 0), COALESCE(NEW.type, '')"
+)
+ROLLUP_MATCH_OLD = (
+    "year = CAST(substr(OLD.date, 1, 4) AS INTEGER) "
+    "AND month = CAST(substr(OLD.date, 6, 2) AS INTEGER) "
+    "AND category_id = COALESCE(OLD.category_id, 0) "
+    "AND type = COALESCE(OLD.type, '')"
+)
+ROLLUP_ADD_NEW = f'''
+        INSERT INTO monthly_category_totals (year, month, category_id, type, total, count)
+        VALUES ({ROLLUP_KEY_NEW}, ABS(NEW.amount), 1)
+        ON CONFLICT(year, month, category_id, type) DO UPDATE SET
+            total = total + excluded.total,
+            count = count + 1;
+'''
+ROLLUP_REMOVE_OLD = f'''
+        UPDATE monthly_category_totals
+        SET total = total - ABS(OLD.amount), count = count - 1
+        WHERE {ROLLUP_MATCH_OLD};
+        DELETE FROM monthly_category_totals
+        WHERE count <= 0 AND {ROLLUP_MATCH_OLD};
+'''
+
+ROLLUP_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS monthly_category_totals (
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (year, month, category_id, type)
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert
+    AFTER INSERT ON transactions
+    BEGIN
+        {ROLLUP_ADD_NEW}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete
+    AFTER DELETE ON transactions
+    BEGIN
+        {ROLLUP_REMOVE_OLD}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+    AFTER UPDATE OF date, amount, category_id, type ON transactions
+    BEGIN
+        {ROLLUP_REMOVE_OLD}
+        {ROLLUP_ADD_NEW}
+    END;
+'''
+
+REBUILD_ROLLUPS_SQL = '''
+    INSERT INTO monthly_category_totals (year, month, category_id, type, total, count)
+    SELECT
+        CAST(substr(date, 1, 4) AS INTEGER),
+        CAST(substr(date, 6, 2) AS INTEGER),
+        COALESCE(category_id, 0),
+        COALESCE(type, ''),
+        SUM(ABS(amount)),
+        COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def ensure_rollup_schema(conn):
+    """
+    Cria tabela e triggers do rollup; popula a tabela se acabou de ser criada.
+    Aplicada pelo registro de migrações (SCHEMA_MIGRATIONS).
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_category_totals'"
+    ).fetchone()
+    conn.executescript(ROLLUP_SCHEMA)
+    if not exists:
+        conn.execute(REBUILD_ROLLUPS_SQL)
+    conn.commit()
+
+
+# Contador de versão por tabela, incrementado por trigger a cada escrita.
+# Caches em memória (ex: calendário de parcelamentos, histórico de gastos)
+# comparam a versão antes de reutilizar o resultado.
+def version_triggers(table: str) -> str:
+    """Triggers que incrementam table_versions[table] a cada escrita."""
+    return "".join(f'''
+CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+AFTER {event} ON {table}
+BEGIN
+    INSERT INTO table_versions (name, version) VALUES ('{table}', 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+END;
+''' for event in ("INSERT", "UPDATE", "DELETE"))
+
+
+TABLE_VERSION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+''' + version_triggers("installments")
+
+
+def create_table_versions(conn):
+    """Cria table_versions e os triggers de versão de `installments`."""
+    conn.executescript(TABLE_VERSION_SCHEMA)
+    conn.commit()
+
+
+def create_history_versions(conn):
+    """Triggers de versão de `transactions` e `categories` (cache do histórico)."""
+    conn.executescript(TABLE_VERSION_SCHEMA + version_triggers("transactions")
+                       + version_triggers("categories"))
+    conn.commit()
 
-def get_categories() -> List[Dict]:
-    """Retorna todas as categorias."""
+
+def get_table_version(name: str) -> Optional[int]:
+    """Versão atual da tabela (0 se nunca escrita; None sem table_versions)."""
     conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT version FROM table_versions WHERE name = ?", (name,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
+def rebuild_rollups() -> int:
+    """Reconstrói monthly_category_totals a partir de transactions (reparo)."""
+    conn = get_connection()
+    try:
+        conn.execute("DELETE FROM monthly_category_totals")
+        conn.execute(REBUILD_ROLLUPS_SQL)
+        count = conn.execute("SELECT COUNT(*) FROM monthly_category_totals").fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+# ==================== ROW TYPES ====================
+# Caminho rápido opcional dos leitores (parâmetro fmt):
+#   "dict"  - padrão, list[dict] com todas as colunas (SELECT *)
+#   "rows"  - list[NamedTuple] com as colunas abaixo, sem montar dicts
+#   "array" - numpy structured array (colunar) para análises
+# Os formatos "rows"/"array" usam uma lista fixa de colunas, presente
+# também no banco demo; ids nulos viram 0 (mesma convenção do rollup).
+
+ROW_FORMATS = ("dict", "rows", "array")
+
+
+class CategoryRow(NamedTuple):
+    id: int
+    name: str
+    icon: str
+    budget_monthly: float
+    is_excluded: int
+
+
+class TransactionRow(NamedTuple):
+    id: int
+    date: str
+    description: str
+    amount: float
+    category_id: int
+    category_name: Optional[str]
+    type: str
+    source: Optional[str]
+
+
+class InstallmentRow(NamedTuple):
+    id: int
+    description: str
+    total_amount: float
+    installment_amount: float
+    total_installments: int
+    current_installment: int
+    start_date: str
+    end_date: Optional[str]
+    category_id: int
+    category_name: Optional[str]
+    status: str
+
+
+ROW_DTYPES = {
+    CategoryRow: [
+        ("id", "i8"), ("name", "O"), ("icon", "O"),
+        ("budget_monthly", "f8"), ("is_excluded", "?"),
+    ],
+    TransactionRow: [
+        ("id", "i8"), ("date", "datetime64[D]"), ("description", "O"),
+        ("amount", "f8"), ("category_id", "i8"), ("category_name", "O"),
+        ("type", "O"), ("source", "O"),
+    ],
+    InstallmentRow: [
+        ("id", "i8"), ("description", "O"), ("total_amount", "f8"),
+        ("installment_amount", "f8"), ("total_installments", "i8"),
+        ("current_installment", "i8"), ("start_date", "datetime64[D]"),
+        ("end_date", "datetime64[D]"), ("category_id", "i8"),
+        ("category_name", "O"), ("status", "O"),
+    ],
+}
+
+
+def _execute_excluded(cursor, query: str, params=()):
+    """
+    Executa `query` com {excluded} = coluna categories.is_excluded (alias c);
+    no banco demo, que não tem a coluna, cai para 0 (tudo variável).
+    """
+    try:
+        cursor.execute(query.format(excluded="COALESCE(c.is_excluded, 0)"), params)
+    except sqlite3.OperationalError:
+        cursor.execute(query.format(excluded="0"), params)
+
+
+def _typed_cursor(conn):
+    """Cursor que devolve tuplas puras (sem sqlite3.Row) para os tipos acima."""
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM categories ORDER BY name")
-    rows = cursor.fetchall()
-    conn.close()
+    cursor.row_factory = None
+    return cursor
+
+
+def _typed_result(cursor, fmt: str, row_type):
+    """Converte o resultado já executado para "rows" ou "array"."""
+    if fmt == "rows":
+        return list(map(row_type._make, cursor.fetchall()))
+    if fmt == "array":
+        return np.array(cursor.fetchall(), dtype=ROW_DTYPES[row_type])
+    raise ValueError(f"fmt deve ser um de {ROW_FORMATS}: {fmt!r}")
+
+
+# ==================== CATEGORIES ====================
+
+def get_categories(fmt: str = "dict"):
+    """
+    Retorna todas as categorias.
+
+    Args:
+        fmt: "dict" (padrão), "rows" (CategoryRow) ou "array" (numpy)
+    """
+    conn = get_connection()
+    try:
+        if fmt != "dict":
+            cursor = _typed_cursor(conn)
+            _execute_excluded(cursor, '''
+                SELECT c.id, c.name, c.icon, COALESCE(c.budget_monthly, 0), {excluded}
+                FROM categories c
+                ORDER BY c.name
+            ''')
+            return _typed_result(cursor, fmt, CategoryRow)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM categories ORDER BY name")
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
     return [dict(row) for row in rows]
 
 
 def get_category_by_name(name: str) -> Optional[Dict]:
     """Busca categoria por nome."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM categories WHERE name = ?", (name.lower(),))
-    row = cursor.fetchone()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM categories WHERE name = ?", (name.lower(),))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
     return dict(row) if row else None
 
 
@@ -128,15 +723,17 @@ def get_variable_categories() -> List[Dict]:
     alimentacao, transporte, saude, assinaturas, compras, lazer, educacao, casa, taxas
     """
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, name, icon, budget_monthly
-        FROM categories
-        WHERE is_excluded = 0
-        ORDER BY name
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, name, icon, budget_monthly
+            FROM categories
+            WHERE is_excluded = 0
+            ORDER BY name
+        """)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
     return [dict(row) for row in rows]
 
 
@@ -148,15 +745,17 @@ def get_excluded_categories() -> List[Dict]:
     - esportes: R$ 1.500/mês
     """
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, name, icon, budget_monthly
-        FROM categories
-        WHERE is_excluded = 1
-        ORDER BY name
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, name, icon, budget_monthly
+            FROM categories
+            WHERE is_excluded = 1
+            ORDER BY name
+        """)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
     return [dict(row) for row in rows]
 
 
@@ -183,42 +782,43 @@ def add_transaction(
                   NÃO usar data de pagamento da fatura.
     """
     conn = get_connection()
-    cursor = conn.cursor()
-
-    # Gerar hash para evitar duplicatas
-    tx_hash = generate_hash(date_str, description, amount)
-
-    # Verificar duplicata
-    cursor.execute("SELECT id FROM transactions WHERE hash = ?", (tx_hash,))
-    if cursor.fetchone():
+    try:
+        cursor = conn.cursor()
+
+        # Gerar hash para evitar duplicatas
+        tx_hash = generate_hash(date_str, description, amount)
+
+        # Verificar duplicata
+        cursor.execute("SELECT id FROM transactions WHERE hash = ?", (tx_hash,))
+        if cursor.fetchone():
+            return {"status": "duplicate", "hash": tx_hash}
+
+        # Buscar category_id
+        cursor.execute("SELECT id FROM categories WHERE name = ?", (category.lower(),))
+        cat_row = cursor.fetchone()
+        category_id = cat_row["id"] if cat_row else None
+
+        # Buscar account_id
+        cursor.execute("SELECT id FROM accounts WHERE name = ?", (account,))
+        acc_row = cursor.fetchone()
+        account_id = acc_row["id"] if acc_row else None
+
+        # Inserir transacao
+        cursor.execute('''
+            INSERT INTO transactions
+            (date, description, amount, category_id, account_id, type,
+             installment_current, installment_total, tags, source, hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            date_str, description, amount, category_id, account_id, type_,
+            installment_current, installment_total,
+            json.dumps(tags) if tags else None, source, tx_hash
+        ))
+
+        tx_id = cursor.lastrowid
+        conn.commit()
+    finally:
         conn.close()
-        return {"status": "duplicate", "hash": tx_hash}
-
-    # Buscar category_id
-    cursor.execute("SELECT id FROM categories WHERE name = ?", (category.lower(),))
-    cat_row = cursor.fetchone()
-    category_id = cat_row["id"] if cat_row else None
-
-    # Buscar account_id
-    cursor.execute("SELECT id FROM accounts WHERE name = ?", (account,))
-    acc_row = cursor.fetchone()
-    account_id = acc_row["id"] if acc_row else None
-
-    # Inserir transacao
-    cursor.execute('''
-        INSERT INTO transactions
-        (date, description, amount, category_id, account_id, type,
-         installment_current, installment_total, tags, source, hash)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        date_str, description, amount, category_id, account_id, type_,
-        installment_current, installment_total,
-        json.dumps(tags) if tags else None, source, tx_hash
-    ))
-
-    tx_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
 
     return {
         "status": "inserted",
@@ -231,183 +831,1372 @@ def add_transaction(
     }
 
 
+def ensure_unique_hash_index(conn):
+    """
+    Garante o índice UNIQUE em transactions(hash), usado pelo INSERT OR IGNORE.
+    Falha se o banco ainda tiver hashes duplicados (rodar migrate_schema.py).
+    """
+    try:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_hash_unique "
+            "ON transactions(hash)"
+        )
+    except sqlite3.IntegrityError as e:
+        raise RuntimeError(
+            "Existem hashes duplicados em transactions; "
+            "rode scripts/migrate_schema.py antes da importação em lote"
+        ) from e
+
+
+def rehash_transactions(conn, delete_duplicates: bool = False) -> Dict:
+    """
+    Recalcula o hash de todas as transações com o hash canônico (hash_many)
+    e garante o índice UNIQUE em transactions(hash).
+
+    Linhas que passam a colidir com uma anterior (menor id) são duplicatas:
+    ficam com hash NULL (fora do índice, preservadas para revisão) ou são
+    removidas com delete_duplicates=True.
+
+    Bancos sem a coluna hash (ex: demo do Streamlit Cloud, data/demo_data.py)
+    ganham a coluna antes; sem a tabela transactions não faz nada.
+
+    Returns:
+        {"rehashed", "duplicates"}
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(transactions)")]
+    if not columns:
+        return {"rehashed": 0, "duplicates": 0}
+    if "hash" not in columns:
+        conn.execute("ALTER TABLE transactions ADD COLUMN hash TEXT")
+
+    rows = conn.execute(
+        "SELECT id, date, description, amount FROM transactions ORDER BY id"
+    ).fetchall()
+
+    hashes = hash_many((row[1], row[2] or "", row[3]) for row in rows)
+
+    seen = set()
+    updates = []
+    duplicates = []
+    for row, tx_hash in zip(rows, hashes):
+        if tx_hash in seen:
+            duplicates.append((row[0],))
+        else:
+            seen.add(tx_hash)
+            updates.append((tx_hash, row[0]))
+
+    # Limpa antes de gravar: o índice UNIQUE pode já existir com hashes antigos
+    conn.execute("UPDATE transactions SET hash = NULL")
+    conn.executemany("UPDATE transactions SET hash = ? WHERE id = ?", updates)
+    if delete_duplicates:
+        conn.executemany("DELETE FROM transactions WHERE id = ?", duplicates)
+    ensure_unique_hash_index(conn)
+    conn.commit()
+
+    return {"rehashed": len(updates), "duplicates": len(duplicates)}
+
+
+def _load_id_map(cursor, table: str) -> Dict[str, int]:
+    """Carrega {name: id} de uma tabela de lookup (vazio se não existir)."""
+    try:
+        cursor.execute(f"SELECT id, name FROM {table}")
+    except sqlite3.OperationalError:
+        return {}
+    return {row["name"]: row["id"] for row in cursor.fetchall()}
+
+
+def add_transactions_bulk(transactions, source: str = "manual") -> Dict:
+    """
+    Insere várias transações em uma única transação SQLite.
+
+    Cada item é um dict com as mesmas chaves de add_transaction:
+    date, description, amount, category e opcionalmente account, type,
+    installment_current, installment_total, tags e source.
+
+    Categorias e contas são resolvidas por mapas em memória (uma query
+    cada), e duplicatas são descartadas pelo índice UNIQUE em hash via
+    INSERT OR IGNORE — inclusive repetições dentro do próprio lote.
+    Os estabelecimentos inseridos atualizam o cache merchant_categories
+    na mesma transação (_learn_merchants).
+
+    Returns:
+        {"total", "inserted", "duplicates", "total_amount"}, onde
+        total_amount soma apenas as transações efetivamente inseridas.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        ensure_unique_hash_index(conn)
+        category_ids = _load_id_map(cursor, "categories")
+        account_ids = _load_id_map(cursor, "accounts")
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+        last_id = cursor.fetchone()[0]
+
+        transactions = list(transactions)
+        total = len(transactions)
+        hashes = hash_many(
+            (tx["date"], tx["description"], tx["amount"]) for tx in transactions
+        )
+
+        def rows():
+            for tx, tx_hash in zip(transactions, hashes):
+                category = tx.get("category")
+                tags = tx.get("tags")
+                yield (
+                    tx["date"], tx["description"], tx["amount"],
+                    category_ids.get(category.lower()) if category else None,
+                    account_ids.get(tx.get("account", "BB Credito")),
+                    tx.get("type", "expense"),
+                    tx.get("installment_current"), tx.get("installment_total"),
+                    json.dumps(tags) if tags else None,
+                    tx.get("source", source),
+                    tx_hash
+                )
+
+        cursor.executemany('''
+            INSERT OR IGNORE INTO transactions
+            (date, description, amount, category_id, account_id, type,
+             installment_current, installment_total, tags, source, hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows())
+        # rowcount = soma de changes() de cada execução (ignorados contam 0)
+        inserted = max(cursor.rowcount, 0)
+
+        # Linhas novas recebem id > last_id (único escritor dentro da transação)
+        cursor.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE id > ?",
+            (last_id,)
+        )
+        total_amount = cursor.fetchone()[0]
+
+        # Estabelecimentos das linhas novas entram no cache aprendido
+        if inserted:
+            cursor.execute('''
+                SELECT description, category_id FROM transactions
+                WHERE id > ? AND category_id IS NOT NULL AND type = 'expense'
+            ''', (last_id,))
+            learned = _learn_merchants(conn, cursor.fetchall())
+        else:
+            learned = 0
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    if learned:
+        _merchant_category.cache_clear()
+    return {
+        "total": total,
+        "inserted": inserted,
+        "duplicates": total - inserted,
+        "total_amount": total_amount
+    }
+
+
+BULK_CHUNK_SIZE = 5000
+
+
+def add_transactions_chunked(
+    transactions: Iterable[Dict],
+    source: str = "manual",
+    chunk_size: int = BULK_CHUNK_SIZE,
+    stats: Optional[Dict] = None
+) -> Dict:
+    """
+    Sink em lotes para importações grandes: consome `transactions` (qualquer
+    iterável, inclusive geradores) de chunk_size em chunk_size, cada lote em
+    uma transação via add_transactions_bulk. A memória fica limitada a um lote.
+
+    Args:
+        stats: dict opcional atualizado a cada lote confirmado; se um lote
+               falhar, mostra o que já foi gravado
+
+    Returns:
+        {"total", "inserted", "duplicates", "total_amount", "chunks"}
+    """
+    if stats is None:
+        stats = {}
+    for key in ("total", "inserted", "duplicates", "total_amount", "chunks"):
+        stats.setdefault(key, 0)
+
+    iterator = iter(transactions)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+        result = add_transactions_bulk(chunk, source=source)
+        for key in ("total", "inserted", "duplicates", "total_amount"):
+            stats[key] += result[key]
+        stats["chunks"] += 1
+
+    return stats
+
+
 def get_transactions(
     year: Optional[int] = None,
     month: Optional[int] = None,
     category: Optional[str] = None,
-    limit: int = 100
-) -> List[Dict]:
-    """Busca transacoes com filtros opcionais."""
+    limit: int = 100,
+    fmt: str = "dict"
+):
+    """
+    Busca transacoes com filtros opcionais.
+
+    Args:
+        fmt: "dict" (padrão), "rows" (TransactionRow) ou "array" (numpy)
+    """
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        if fmt == "dict":
+            cursor = conn.cursor()
+            query = '''
+                SELECT t.*, c.name as category_name, c.icon as category_icon, a.name as account_name
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN accounts a ON t.account_id = a.id
+                WHERE 1=1
+            '''
+        else:
+            cursor = _typed_cursor(conn)
+            query = '''
+                SELECT t.id, t.date, t.description, t.amount, COALESCE(t.category_id, 0),
+                       c.name, t.type, t.source
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                WHERE 1=1
+            '''
+        params = []
+
+        if year and month:
+            query += " AND t.date >= ? AND t.date < ?"
+            params.extend(month_range(year, month))
+        elif year:
+            query += " AND t.date >= ? AND t.date < ?"
+            params.extend(year_range(year))
+        elif month:
+            # Mesmo mês em todos os anos: não há intervalo contíguo
+            query += " AND strftime('%m', t.date) = ?"
+            params.append(f"{month:02d}")
+
+        if category:
+            query += " AND c.name = ?"
+            params.append(category.lower())
+
+        query += " ORDER BY t.date DESC LIMIT ?"
+        params.append(limit)
+
+        cursor.execute(query, params)
+        if fmt != "dict":
+            return _typed_result(cursor, fmt, TransactionRow)
+
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
 
-    query = '''
-        SELECT t.*, c.name as category_name, c.icon as category_icon, a.name as account_name
-        FROM transactions t
-        LEFT JOIN categories c ON t.category_id = c.id
-        LEFT JOIN accounts a ON t.account_id = a.id
-        WHERE 1=1
-    '''
-    params = []
+    return [dict(row) for row in rows]
 
-    if year:
-        query += " AND strftime('%Y', t.date) = ?"
-        params.append(str(year))
 
-    if month:
-        query += " AND strftime('%m', t.date) = ?"
-        params.append(f"{month:02d}")
+# ==================== MERCHANTS ====================
 
-    if category:
-        query += " AND c.name = ?"
-        params.append(category.lower())
+# Cache estabelecimento -> categoria aprendido do ledger. Consultado antes das
+# palavras-chave (bb_parser.categorize_transaction), então recategorizações
+# manuais passam a valer para as próximas importações. Cada lote gravado por
+# add_transactions_bulk (e portanto add_transactions_chunked / importações)
+# atualiza os estabelecimentos que trouxe.
+MERCHANT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS merchant_categories (
+    merchant TEXT PRIMARY KEY,
+    category_id INTEGER NOT NULL,
+    source TEXT NOT NULL DEFAULT 'ledger',   -- 'ledger' (aprendido) ou 'manual'
+    count INTEGER NOT NULL DEFAULT 0,        -- transações que sustentam o mapeamento
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+'''
 
-    query += " ORDER BY t.date DESC LIMIT ?"
-    params.append(limit)
+MERCHANT_TOKENS = 3
+MERCHANT_STOPWORDS = {"parc", "parcela", "de", "da", "do", "br"}
+_MERCHANT_NOISE = re.compile(r"[^a-z]+")
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
 
-    return [dict(row) for row in rows]
+def normalize_merchant(description: str) -> str:
+    """
+    Chave do estabelecimento: minúsculas sem acento, sem dígitos/pontuação
+    (parcelas, códigos, datas) e só os primeiros MERCHANT_TOKENS termos.
 
+    Ex: "IFOOD *RESTAURANTE 123" -> "ifood restaurante";
+        "PARC 03/10 MOVEIS XPTO" -> "moveis xpto"
+    """
+    text = unicodedata.normalize("NFKD", (description or "").lower())
+    text = _MERCHANT_NOISE.sub(" ", text.encode("ascii", "ignore").decode())
+    tokens = [t for t in text.split() if t not in MERCHANT_STOPWORDS]
+    return " ".join(tokens[:MERCHANT_TOKENS])
 
-def get_monthly_summary(year: int, month: int) -> Dict:
-    """Retorna resumo mensal de gastos por categoria."""
+
+def learn_merchant_categories(conn=None) -> int:
+    """
+    (Re)aprende o cache a partir de `transactions`: para cada estabelecimento,
+    a categoria mais frequente. Entradas 'manual' não são sobrescritas.
+
+    Returns:
+        número de estabelecimentos no cache
+    """
+    own = conn is None
+    if own:
+        conn = get_connection()
+    try:
+        votes: Counter = Counter()
+        cursor = conn.execute('''
+            SELECT description, category_id FROM transactions
+            WHERE category_id IS NOT NULL AND type = 'expense'
+        ''')
+        for description, category_id in cursor:
+            merchant = normalize_merchant(description)
+            if merchant:
+                votes[merchant, category_id] += 1
+
+        best: Dict[str, tuple] = {}
+        for (merchant, category_id), count in votes.most_common():
+            best.setdefault(merchant, (category_id, count))
+
+        conn.executemany('''
+            INSERT INTO merchant_categories (merchant, category_id, source, count)
+            VALUES (?, ?, 'ledger', ?)
+            ON CONFLICT(merchant) DO UPDATE SET
+                category_id = excluded.category_id,
+                count = excluded.count,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE merchant_categories.source = 'ledger'
+        ''', [(m, c, n) for m, (c, n) in best.items()])
+        total = conn.execute("SELECT COUNT(*) FROM merchant_categories").fetchone()[0]
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+
+    _merchant_category.cache_clear()
+    return total
+
+
+def _learn_merchants(conn, rows: Iterable[tuple]) -> int:
+    """
+    Atualiza o cache com transações recém-inseridas ((description,
+    category_id)), sem reler o ledger: voto de maioria (Boyer-Moore) por
+    estabelecimento — mesma categoria soma em `count`, outra categoria
+    subtrai e assume o lugar se o saldo ficar negativo. Entradas 'manual'
+    não mudam. learn_merchant_categories() continua sendo a contagem exata.
+
+    Não faz commit (roda dentro da transação do chamador).
+
+    Returns:
+        número de estabelecimentos atualizados
+    """
+    votes: Counter = Counter()
+    for description, category_id in rows:
+        merchant = normalize_merchant(description)
+        if merchant and category_id is not None:
+            votes[merchant, category_id] += 1
+    if not votes:
+        return 0
+
+    merchants = list({merchant for merchant, _ in votes})
+    current: Dict[str, list] = {}
+    for i in range(0, len(merchants), 500):
+        chunk = merchants[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for merchant, category_id, source, count in conn.execute(
+            f"SELECT merchant, category_id, source, count FROM merchant_categories "
+            f"WHERE merchant IN ({placeholders})", chunk
+        ):
+            current[merchant] = [category_id, source, count]
+
+    updates = {}
+    for (merchant, category_id), n in votes.most_common():
+        entry = current.setdefault(merchant, [category_id, "ledger", 0])
+        if entry[1] != "ledger":
+            continue
+        if entry[0] == category_id:
+            entry[2] += n
+        elif entry[2] >= n:
+            entry[2] -= n
+        else:
+            entry[0], entry[2] = category_id, n - entry[2]
+        updates[merchant] = (merchant, entry[0], entry[2])
+
+    conn.executemany('''
+        INSERT INTO merchant_categories (merchant, category_id, source, count)
+        VALUES (?, ?, 'ledger', ?)
+        ON CONFLICT(merchant) DO UPDATE SET
+            category_id = excluded.category_id,
+            count = excluded.count,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE merchant_categories.source = 'ledger'
+    ''', list(updates.values()))
+    return len(updates)
+
+
+def create_merchant_categories(conn):
+    """Cria merchant_categories e semeia com o ledger existente."""
+    conn.executescript(MERCHANT_SCHEMA)
+    learn_merchant_categories(conn)
+
+
+@lru_cache(maxsize=4096)
+def _merchant_category(db_path: str, merchant: str) -> Optional[str]:
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        row = conn.execute('''
+            SELECT c.name FROM merchant_categories m
+            JOIN categories c ON c.id = m.category_id
+            WHERE m.merchant = ?
+        ''', (merchant,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
 
-    cursor.execute('''
-        SELECT
-            c.name as category,
-            c.icon,
-            c.budget_monthly as budget,
-            COALESCE(SUM(ABS(t.amount)), 0) as total
-        FROM categories c
-        LEFT JOIN transactions t ON t.category_id = c.id
-            AND strftime('%Y', t.date) = ?
-            AND strftime('%m', t.date) = ?
-            AND t.type = 'expense'
-        GROUP BY c.id
-        ORDER BY total DESC
-    ''', (str(year), f"{month:02d}"))
-
-    rows = cursor.fetchall()
-    conn.close()
-
-    result = {
-        "year": year,
-        "month": month,
-        "categories": [],
-        "total_spent": 0,
-        "total_budget": 0
+
+def lookup_merchant_category(description: str) -> Optional[str]:
+    """Categoria conhecida do estabelecimento (LRU em memória na frente da tabela)."""
+    merchant = normalize_merchant(description)
+    if not merchant:
+        return None
+    try:
+        return _merchant_category(str(DB_PATH), merchant)
+    except sqlite3.Error:
+        return None
+
+
+def set_merchant_category(description: str, category: str) -> bool:
+    """Grava (ou corrige) manualmente a categoria de um estabelecimento."""
+    merchant = normalize_merchant(description)
+    if not merchant:
+        return False
+    conn = get_connection()
+    try:
+        cat_row = conn.execute(
+            "SELECT id FROM categories WHERE name = ?", (category.lower(),)
+        ).fetchone()
+        if not cat_row:
+            return False
+        conn.execute('''
+            INSERT INTO merchant_categories (merchant, category_id, source, count)
+            VALUES (?, ?, 'manual', 0)
+            ON CONFLICT(merchant) DO UPDATE SET
+                category_id = excluded.category_id,
+                source = 'manual',
+                updated_at = CURRENT_TIMESTAMP
+        ''', (merchant, cat_row[0]))
+        conn.commit()
+    finally:
+        conn.close()
+
+    _merchant_category.cache_clear()
+    return True
+
+
+def recategorize_transaction(transaction_id: int, category: str) -> bool:
+    """Muda a categoria de uma transação e memoriza o estabelecimento."""
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT description FROM transactions WHERE id = ?", (transaction_id,)
+        ).fetchone()
+        cat_row = conn.execute(
+            "SELECT id FROM categories WHERE name = ?", (category.lower(),)
+        ).fetchone()
+        if not row or not cat_row:
+            return False
+        conn.execute(
+            "UPDATE transactions SET category_id = ? WHERE id = ?", (cat_row[0], transaction_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    set_merchant_category(row[0], category)
+    return True
+
+
+# ==================== NEAR DUPLICATES ====================
+# Duplicatas "quase iguais" que o hash exato não pega: mesma compra com a
+# descrição escrita diferente por fontes diferentes (fatura x extrato x
+# lançamento manual). Candidatos são bloqueados por (valor em centavos,
+# data ± NEAR_DUPLICATE_DAYS) com um índice de expressão, e só então as
+# descrições são comparadas. A varredura é incremental: só as transações
+# com id acima da marca d'água (near_duplicate_scan) são examinadas, então
+# reimportar faturas sobrepostas custa O(linhas novas), não O(ledger).
+# Os pares ficam em near_duplicates para revisão; nada é removido sozinho.
+
+NEAR_DUPLICATE_DAYS = 2
+NEAR_DUPLICATE_THRESHOLD = 0.5
+
+# A expressão do índice e a da query precisam ser idênticas para o SQLite usar o índice
+AMOUNT_CENTS_SQL = "CAST(ROUND({col}amount * 100) AS INTEGER)"
+
+NEAR_DUPLICATE_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS near_duplicates (
+    transaction_id INTEGER NOT NULL,         -- a mais nova (maior id)
+    original_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- 'pending', 'dismissed' ou 'removed'
+    detected_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (transaction_id, original_id)
+);
+
+CREATE TABLE IF NOT EXISTS near_duplicate_scan (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_id INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_cents_date
+ON transactions({AMOUNT_CENTS_SQL.format(col="")}, date);
+'''
+
+NEAR_DUPLICATE_CANDIDATES_SQL = f'''
+    SELECT n.id, o.id, n.description, o.description
+    FROM transactions n
+    JOIN transactions o
+        ON {AMOUNT_CENTS_SQL.format(col="o.")} = {AMOUNT_CENTS_SQL.format(col="n.")}
+        AND o.date >= date(n.date, ?) AND o.date <= date(n.date, ?)
+        AND o.id < n.id
+    WHERE n.id > ?
+'''
+
+_SIMILARITY_NOISE = re.compile(r"[^a-z0-9]+")
+
+
+def _description_tokens(description: str) -> frozenset:
+    """Termos da descrição: minúsculas sem acento, sem pontuação."""
+    text = unicodedata.normalize("NFKD", (description or "").lower())
+    text = _SIMILARITY_NOISE.sub(" ", text.encode("ascii", "ignore").decode())
+    return frozenset(text.split())
+
+
+def _trigrams(tokens: frozenset) -> frozenset:
+    text = " " + " ".join(sorted(tokens)) + " "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def description_similarity(a: str, b: str) -> float:
+    """
+    Similaridade entre duas descrições, em [0, 1]: o maior entre a
+    sobreposição dos conjuntos de termos (|A∩B| / min(|A|, |B|), tolera
+    sufixos como cidade/UF) e o Jaccard de trigramas (tolera grafias
+    diferentes do mesmo termo, ex: "IFOOD*REST" x "IFOOD RESTAURANTE").
+    """
+    tokens_a, tokens_b = _description_tokens(a), _description_tokens(b)
+    if not tokens_a or not tokens_b:
+        return 0.0
+    overlap = len(tokens_a & tokens_b) / min(len(tokens_a), len(tokens_b))
+    if overlap == 1.0:
+        return overlap
+    grams_a, grams_b = _trigrams(tokens_a), _trigrams(tokens_b)
+    jaccard = len(grams_a & grams_b) / len(grams_a | grams_b)
+    return max(overlap, jaccard)
+
+
+def create_near_duplicates(conn):
+    """Cria near_duplicates, a marca d'água e o índice (centavos, data)."""
+    conn.executescript(NEAR_DUPLICATE_SCHEMA)
+    conn.execute("INSERT OR IGNORE INTO near_duplicate_scan (id, last_id) VALUES (1, 0)")
+    conn.commit()
+
+
+def scan_near_duplicates(
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    days: int = NEAR_DUPLICATE_DAYS,
+    full: bool = False
+) -> Dict:
+    """
+    Procura quase-duplicatas entre as transações novas (id acima da marca
+    d'água) e todo o ledger, grava os pares em near_duplicates e avança a
+    marca d'água.
+
+    Args:
+        threshold: similaridade mínima das descrições (description_similarity)
+        days: janela de datas (± dias) do bloqueio
+        full: reexamina o ledger inteiro (ex: depois de mudar o threshold)
+
+    Returns:
+        {"scanned", "candidates", "found"} — transações novas examinadas,
+        pares do bloqueio comparados e pares acima do threshold
+    """
+    conn = get_connection()
+    try:
+        last_id = 0 if full else conn.execute(
+            "SELECT last_id FROM near_duplicate_scan WHERE id = 1"
+        ).fetchone()[0]
+        max_id, scanned = conn.execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM transactions WHERE id > ?", (last_id,)
+        ).fetchone()
+
+        candidates = 0
+        found = []
+        rows = conn.execute(NEAR_DUPLICATE_CANDIDATES_SQL, (f"-{days} days", f"+{days} days", last_id))
+        for tx_id, original_id, description, original_description in rows:
+            candidates += 1
+            score = description_similarity(description, original_description)
+            if score >= threshold:
+                found.append((tx_id, original_id, round(score, 3)))
+
+        conn.executemany('''
+            INSERT INTO near_duplicates (transaction_id, original_id, score)
+            VALUES (?, ?, ?)
+            ON CONFLICT(transaction_id, original_id) DO UPDATE SET score = excluded.score
+        ''', found)
+        conn.execute(
+            "UPDATE near_duplicate_scan SET last_id = MAX(last_id, ?) WHERE id = 1", (max_id,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {"scanned": scanned, "candidates": candidates, "found": len(found)}
+
+
+def get_near_duplicates(status: str = "pending") -> List[Dict]:
+    """Pares de quase-duplicatas (ambas as transações ainda no ledger)."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT d.transaction_id AS id, d.original_id, d.score,
+                   t.date, t.description, t.amount,
+                   o.date AS original_date, o.description AS original_description
+            FROM near_duplicates d
+            JOIN transactions t ON t.id = d.transaction_id
+            JOIN transactions o ON o.id = d.original_id
+            WHERE d.status = ?
+            ORDER BY t.date, d.transaction_id
+        ''', (status,))
+        rows = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return rows
+
+
+def resolve_near_duplicate(transaction_id: int, original_id: int, remove: bool = False) -> bool:
+    """Marca um par como revisado; com remove=True apaga a transação mais nova."""
+    conn = get_connection()
+    try:
+        cursor = conn.execute('''
+            UPDATE near_duplicates SET status = ?
+            WHERE transaction_id = ? AND original_id = ? AND status = 'pending'
+        ''', ("removed" if remove else "dismissed", transaction_id, original_id))
+        updated = cursor.rowcount > 0
+        if updated and remove:
+            conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    return updated
+
+
+# ==================== ONLINE STATS ====================
+# Estatísticas mensais por categoria mantidas incrementalmente, para que a
+# confiança das previsões seja uma leitura O(1) em vez de recarregar o
+# histórico: total mensal (rollup) de cada mês fechado, incorporado por
+# close_month_stats (fim do import). Um lançamento em mês já incorporado
+# marca a categoria como dirty (trigger) e ela é recalculada no próximo
+# fechamento. rebuild_category_stats() reconstrói tudo do rollup (reparo).
+#
+# A migração 8 também criava a escala 'transaction' (Welford por despesa,
+# mantida por trigger a cada escrita). A migração 10 a remove: o z-score de
+# anomalias passou a ser robusto (mediana/MAD, anomalies.py) e nada mais lia
+# esses acumuladores.
+
+# EWMA com alfa 2/(N+1): N = 6 meses, a mesma janela das previsões
+STATS_EWMA_ALPHA = 2 / (6 + 1)
+
+STATS_MONTH_INDEX = "(CAST(substr({d}, 1, 4) AS INTEGER) * 12 + CAST(substr({d}, 6, 2) AS INTEGER) - 1)"
+
+_STATS_ADD_NEW = f'''
+        INSERT INTO category_stats (category_id, scale, n, mean, m2, min, max, ewma, ewm_var)
+        SELECT NEW.category_id, 'transaction', 1, ABS(NEW.amount), 0,
+               ABS(NEW.amount), ABS(NEW.amount), ABS(NEW.amount), 0
+        WHERE NEW.type = 'expense' AND NEW.category_id IS NOT NULL
+        ON CONFLICT(category_id, scale) DO UPDATE SET
+            n = n + 1,
+            mean = mean + (excluded.mean - mean) / (n + 1),
+            m2 = m2 + (excluded.mean - mean) * (excluded.mean - mean - (excluded.mean - mean) / (n + 1)),
+            min = MIN(COALESCE(min, excluded.min), excluded.min),
+            max = MAX(COALESCE(max, excluded.max), excluded.max),
+            ewma = COALESCE(ewma + {STATS_EWMA_ALPHA!r} * (excluded.mean - ewma), excluded.mean),
+            ewm_var = COALESCE((1 - {STATS_EWMA_ALPHA!r}) * (ewm_var + {STATS_EWMA_ALPHA!r}
+                      * (excluded.mean - ewma) * (excluded.mean - ewma)), 0);
+'''
+_STATS_REMOVE_OLD = '''
+        UPDATE category_stats SET
+            n = n - 1,
+            mean = CASE WHEN n > 1 THEN (n * mean - ABS(OLD.amount)) / (n - 1) ELSE 0 END,
+            m2 = CASE WHEN n > 1 THEN MAX(m2 - (ABS(OLD.amount) - mean)
+                 * (ABS(OLD.amount) - (n * mean - ABS(OLD.amount)) / (n - 1)), 0) ELSE 0 END
+        WHERE category_id = OLD.category_id AND scale = 'transaction'
+        AND OLD.type = 'expense' AND n > 0;
+'''
+_STATS_DIRTY = '''
+        UPDATE category_stats SET dirty = 1
+        WHERE scale = 'month' AND category_id = {row}.category_id
+        AND last_month >= {month};
+'''
+
+CATEGORY_STATS_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS category_stats (
+    category_id INTEGER NOT NULL,
+    scale TEXT NOT NULL,               -- 'transaction' ou 'month'
+    n INTEGER NOT NULL DEFAULT 0,
+    mean REAL NOT NULL DEFAULT 0,
+    m2 REAL NOT NULL DEFAULT 0,        -- soma dos quadrados dos desvios (Welford)
+    min REAL,
+    max REAL,
+    ewma REAL,
+    ewm_var REAL,
+    last_month INTEGER,                -- (month) último mês incorporado, month_index
+    dirty INTEGER NOT NULL DEFAULT 0,  -- (month) mês incorporado mudou: recalcular
+    PRIMARY KEY (category_id, scale)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_stats_insert
+AFTER INSERT ON transactions
+BEGIN
+    {_STATS_ADD_NEW}
+    {_STATS_DIRTY.format(row="NEW", month=STATS_MONTH_INDEX.format(d="NEW.date"))}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_stats_delete
+AFTER DELETE ON transactions
+BEGIN
+    {_STATS_REMOVE_OLD}
+    {_STATS_DIRTY.format(row="OLD", month=STATS_MONTH_INDEX.format(d="OLD.date"))}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_stats_update
+AFTER UPDATE OF date, amount, category_id, type ON transactions
+BEGIN
+    {_STATS_REMOVE_OLD}
+    {_STATS_ADD_NEW}
+    {_STATS_DIRTY.format(row="OLD", month=STATS_MONTH_INDEX.format(d="OLD.date"))}
+    {_STATS_DIRTY.format(row="NEW", month=STATS_MONTH_INDEX.format(d="NEW.date"))}
+END;
+'''
+
+# Migração 10: triggers só com o dirty mensal
+MONTH_STATS_TRIGGERS = f'''
+DROP TRIGGER IF EXISTS trg_transactions_stats_insert;
+DROP TRIGGER IF EXISTS trg_transactions_stats_delete;
+DROP TRIGGER IF EXISTS trg_transactions_stats_update;
+
+CREATE TRIGGER trg_transactions_stats_insert
+AFTER INSERT ON transactions
+BEGIN
+    {_STATS_DIRTY.format(row="NEW", month=STATS_MONTH_INDEX.format(d="NEW.date"))}
+END;
+
+CREATE TRIGGER trg_transactions_stats_delete
+AFTER DELETE ON transactions
+BEGIN
+    {_STATS_DIRTY.format(row="OLD", month=STATS_MONTH_INDEX.format(d="OLD.date"))}
+END;
+
+CREATE TRIGGER trg_transactions_stats_update
+AFTER UPDATE OF date, amount, category_id, type ON transactions
+BEGIN
+    {_STATS_DIRTY.format(row="OLD", month=STATS_MONTH_INDEX.format(d="OLD.date"))}
+    {_STATS_DIRTY.format(row="NEW", month=STATS_MONTH_INDEX.format(d="NEW.date"))}
+END;
+'''
+
+
+@dataclass
+class OnlineStats:
+    """Acumulador Welford + EWMA de uma categoria (valores absolutos)."""
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: Optional[float] = None
+    max: Optional[float] = None
+    ewma: Optional[float] = None
+    ewm_var: Optional[float] = None
+
+    def push(self, x: float, alpha: float = STATS_EWMA_ALPHA):
+        """Incorpora um valor (Welford + EWMA)."""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        if self.ewma is None:
+            self.ewma, self.ewm_var = x, 0.0
+        else:
+            diff = x - self.ewma
+            self.ewma += alpha * diff
+            self.ewm_var = (1 - alpha) * (self.ewm_var + alpha * diff * diff)
+
+    @property
+    def std(self) -> float:
+        """Desvio padrão populacional (como np.std)."""
+        return math.sqrt(self.m2 / self.n) if self.n > 0 else 0.0
+
+    @property
+    def ew_std(self) -> float:
+        return math.sqrt(self.ewm_var) if self.ewm_var else 0.0
+
+    def z_score(self, x: float) -> float:
+        """z-score de x (0 sem variância)."""
+        std = self.std
+        return (x - self.mean) / std if std > 0 else 0.0
+
+    def confidence(self) -> float:
+        """1 - coeficiente de variação recente (EWMA), limitado a [0, 1]."""
+        if not self.ewma or self.ewma <= 0:
+            return 0.5
+        return max(0.0, min(1.0, 1 - self.ew_std / self.ewma))
+
+
+def _previous_month_index() -> int:
+    today = date.today()
+    return month_index(today.year, today.month) - 1
+
+
+def _fold_month_stats(conn, through: int) -> int:
+    """Incorpora os meses fechados até `through` (month_index). Retorna categorias atualizadas."""
+    state = {
+        row[0]: (row[1], row[2])
+        for row in conn.execute(
+            "SELECT category_id, last_month, dirty FROM category_stats WHERE scale = 'month'"
+        )
     }
+    rows = conn.execute('''
+        SELECT category_id, year * 12 + month - 1 as idx, total
+        FROM monthly_category_totals
+        WHERE type = 'expense' AND category_id != 0 AND year * 12 + month - 1 <= ?
+        ORDER BY category_id, idx
+    ''', (through,)).fetchall()
+
+    by_category: Dict[int, list] = {}
+    for category_id, idx, total in rows:
+        by_category.setdefault(category_id, []).append((idx, total))
+
+    updates = []
+    for category_id, months in by_category.items():
+        last_month, dirty = state.get(category_id, (None, 0))
+        if last_month is not None and not dirty and last_month >= through:
+            continue
+        if last_month is None or dirty:
+            acc, start = OnlineStats(), -1
+        else:
+            row = conn.execute('''
+                SELECT n, mean, m2, min, max, ewma, ewm_var FROM category_stats
+                WHERE category_id = ? AND scale = 'month'
+            ''', (category_id,)).fetchone()
+            acc, start = OnlineStats(*row), last_month
+        for idx, total in months:
+            if idx > start:
+                acc.push(total)
+        updates.append((category_id, acc.n, acc.mean, acc.m2, acc.min, acc.max,
+                        acc.ewma, acc.ewm_var, through))
+
+    conn.executemany('''
+        INSERT INTO category_stats
+            (category_id, scale, n, mean, m2, min, max, ewma, ewm_var, last_month, dirty)
+        VALUES (?, 'month', ?, ?, ?, ?, ?, ?, ?, ?, 0)
+        ON CONFLICT(category_id, scale) DO UPDATE SET
+            n = excluded.n, mean = excluded.mean, m2 = excluded.m2,
+            min = excluded.min, max = excluded.max,
+            ewma = excluded.ewma, ewm_var = excluded.ewm_var,
+            last_month = excluded.last_month, dirty = 0
+    ''', updates)
+    return len(updates)
+
+
+def close_month_stats(year: Optional[int] = None, month: Optional[int] = None) -> int:
+    """
+    Incorpora às estatísticas mensais os meses fechados até (year, month)
+    (padrão: o mês anterior ao atual). Só lê os meses novos de cada
+    categoria, salvo as marcadas dirty.
+
+    Returns:
+        número de categorias atualizadas
+    """
+    through = month_index(year, month) if year and month else _previous_month_index()
+    conn = get_connection()
+    try:
+        updated = _fold_month_stats(conn, through)
+        conn.commit()
+    finally:
+        conn.close()
+    return updated
+
+
+def rebuild_category_stats(conn=None) -> int:
+    """Reconstrói category_stats dos meses fechados (rollup)."""
+    own = conn is None
+    if own:
+        conn = get_connection()
+    try:
+        conn.execute("DELETE FROM category_stats")
+        _fold_month_stats(conn, _previous_month_index())
+        count = conn.execute("SELECT COUNT(*) FROM category_stats").fetchone()[0]
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return count
 
-    for row in rows:
-        cat_data = dict(row)
-        cat_data["percent"] = round(cat_data["total"] / cat_data["budget"] * 100, 1) if cat_data["budget"] > 0 else 0
-        cat_data["status"] = "ok" if cat_data["percent"] <= 90 else ("warning" if cat_data["percent"] <= 110 else "critical")
-        result["categories"].append(cat_data)
-        result["total_spent"] += cat_data["total"]
-        result["total_budget"] += cat_data["budget"]
 
-    result["savings_rate"] = round((55000 - result["total_spent"]) / 55000 * 100, 1)
+def create_category_stats(conn):
+    """Cria category_stats + triggers e semeia com o ledger existente."""
+    conn.executescript(CATEGORY_STATS_SCHEMA)
+    rebuild_category_stats(conn)
+
+
+def drop_transaction_stats(conn):
+    """Remove a escala 'transaction' e deixa nos triggers só o dirty mensal."""
+    conn.executescript(MONTH_STATS_TRIGGERS)
+    conn.execute("DELETE FROM category_stats WHERE scale = 'transaction'")
+    conn.commit()
 
+
+def get_category_stats(scale: str = "month") -> Dict[str, OnlineStats]:
+    """Estatísticas online (meses fechados) por nome de categoria."""
+    conn = get_connection()
+    try:
+        rows = conn.execute('''
+            SELECT c.name, s.n, s.mean, s.m2, s.min, s.max, s.ewma, s.ewm_var
+            FROM category_stats s
+            JOIN categories c ON c.id = s.category_id
+            WHERE s.scale = ? AND s.n > 0
+        ''', (scale,)).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+    return {row[0]: OnlineStats(*row[1:]) for row in rows}
+
+
+# ==================== SPENDING HISTORY ====================
+# Histórico mensal de gastos por categoria em janelas alinhadas ao
+# calendário: [mês inicial, mês final], ambos inclusive, com zero nos meses
+# sem gasto (a coluna j é sempre o j-ésimo mês da janela). Por padrão a
+# janela termina no último mês fechado, então o resultado não muda ao longo
+# do mês corrente. Fica em cache por (início, fim) até `transactions` ou
+# `categories` mudarem (table_versions); previsões, otimizador de orçamento
+# e insights compartilham a mesma matriz.
+
+SPENDING_HISTORY_QUERY = '''
+    SELECT c.name, r.year * 12 + r.month - 1 as month_idx, r.total
+    FROM monthly_category_totals r
+    JOIN categories c ON c.id = r.category_id
+    WHERE r.type = 'expense'
+    AND r.year * 12 + r.month - 1 BETWEEN ? AND ?
+    ORDER BY c.id
+'''
+
+
+@dataclass
+class SpendingHistory:
+    """
+    Gastos categoria x mês de uma janela de meses (numpy, zeros onde não
+    houve gasto). Trate `totals` como somente leitura: a instância é
+    compartilhada pelo cache.
+
+    totals[i, j] = gasto da categoria categories[i] no mês labels[j].
+    Só entram categorias com algum gasto na janela, na ordem de categories.id.
+    """
+    start: tuple
+    end: tuple
+    categories: List[str]
+    labels: List[str]
+    totals: np.ndarray
+
+    @property
+    def months(self) -> int:
+        return len(self.labels)
+
+    def category(self, name: str) -> np.ndarray:
+        """Série mensal de uma categoria; zeros se não gastou na janela."""
+        if name not in self.categories:
+            return np.zeros(self.months)
+        return self.totals[self.categories.index(name)].copy()
+
+    def as_dict(self) -> Dict[str, List[float]]:
+        """{categoria: [gasto do mês 1, ..., gasto do último mês]}."""
+        return {name: row.tolist() for name, row in zip(self.categories, self.totals)}
+
+
+def history_window(months: int, end: Optional[tuple] = None) -> tuple:
+    """
+    Janela ((ano, mês) inicial, (ano, mês) final) dos últimos `months`
+    meses terminando em `end` (padrão: último mês fechado).
+    """
+    last = month_index(*end) if end else _previous_month_index()
+    first = last - months + 1
+    return (first // 12, first % 12 + 1), (last // 12, last % 12 + 1)
+
+
+_history_cache: Dict[tuple, Any] = {}
+_history_cache_lock = threading.Lock()
+HISTORY_CACHE_SIZE = 32
+
+
+def get_spending_history(start: tuple, end: tuple) -> SpendingHistory:
+    """
+    Matriz densa categoria x mês de [start, end] ((ano, mês), inclusive),
+    lida do rollup em uma consulta:
+        history = get_spending_history(*history_window(6))
+        history.totals                  # (categorias, 6)
+        history.category("lazer")       # 6 meses, zeros incluídos
+    """
+    first, last = month_index(*start), month_index(*end)
+    if last < first:
+        raise ValueError(f"janela inválida: {start} > {end}")
+
+    key = (first, last)
+    version = (get_table_version("transactions"), get_table_version("categories"))
+    with _history_cache_lock:
+        cached = _history_cache.get(key)
+        if cached is not None and None not in version and cached[0] == version:
+            return cached[1]
+
+    conn = get_connection()
+    try:
+        rows = conn.execute(SPENDING_HISTORY_QUERY, (first, last)).fetchall()
+    finally:
+        conn.close()
+
+    categories: List[str] = []
+    cells = []
+    for name, idx, total in rows:
+        if not categories or categories[-1] != name:
+            categories.append(name)
+        cells.append((len(categories) - 1, idx - first, total))
+
+    totals = np.zeros((len(categories), last - first + 1))
+    if cells:
+        rows_idx, cols_idx, values = zip(*cells)
+        totals[list(rows_idx), list(cols_idx)] = values
+
+    history = SpendingHistory(
+        start=(first // 12, first % 12 + 1),
+        end=(last // 12, last % 12 + 1),
+        categories=categories,
+        labels=[f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(first, last + 1)],
+        totals=totals
+    )
+    with _history_cache_lock:
+        if len(_history_cache) >= HISTORY_CACHE_SIZE:
+            _history_cache.clear()
+        _history_cache[key] = (version, history)
+    return history
+
+
+# ==================== MONTHLY AGGREGATION ====================
+# Uma leitura do rollup monthly_category_totals por mês (is_excluded como
+# coluna) alimenta get_monthly_summary, get_monthly_summary_v2 e
+# get_consolidated_summary.
+
+# Renda líquida mensal total (base da taxa de poupança)
+TOTAL_INCOME = 55000
+
+MONTHLY_AGGREGATE_QUERY = '''
+    SELECT
+        c.name as category,
+        c.icon,
+        c.budget_monthly as budget,
+        {excluded} as is_excluded,
+        COALESCE(r.total, 0) as total
+    FROM categories c
+    LEFT JOIN monthly_category_totals r ON r.category_id = c.id
+        AND r.year = ? AND r.month = ?
+        AND r.type = 'expense'
+    ORDER BY total DESC, c.id
+'''
+
+
+def budget_status(total: float, budget: float) -> tuple:
+    """Retorna (percentual do orçamento, status ok/warning/critical)."""
+    percent = round(total / budget * 100, 1) if budget > 0 else 0
+    status = "ok" if percent <= 90 else ("warning" if percent <= 110 else "critical")
+    return percent, status
+
+
+@dataclass
+class CategoryTotal:
+    """Gasto de uma categoria no mês."""
+    category: str
+    icon: str
+    budget: float
+    total: float
+    is_excluded: bool = False
+
+    def to_dict(self) -> Dict:
+        percent, status = budget_status(self.total, self.budget)
+        return {
+            "category": self.category,
+            "icon": self.icon,
+            "budget": self.budget,
+            "total": self.total,
+            "percent": percent,
+            "status": status
+        }
+
+
+@dataclass
+class MonthlyAggregate:
+    """Resultado agregado de um mês (PF por categoria + PJ opcional)."""
+    year: int
+    month: int
+    categories: List[CategoryTotal] = field(default_factory=list)
+    pj_gross_revenue: float = 0
+    pj_taxes: float = 0
+
+    @property
+    def variables(self) -> List[CategoryTotal]:
+        return [c for c in self.categories if not c.is_excluded]
+
+    @property
+    def excluded(self) -> List[CategoryTotal]:
+        return [c for c in self.categories if c.is_excluded]
+
+    @property
+    def total_spent(self) -> float:
+        return sum(c.total for c in self.categories)
+
+    @property
+    def total_budget(self) -> float:
+        return sum(c.budget for c in self.categories)
+
+    @staticmethod
+    def _group(categories: List[CategoryTotal]) -> Dict:
+        return {
+            "categories": [c.to_dict() for c in categories],
+            "total": sum(c.total for c in categories),
+            "budget": sum(c.budget for c in categories)
+        }
+
+    def as_summary(self) -> Dict:
+        """Formato de get_monthly_summary (todas as categorias)."""
+        total_spent = self.total_spent
+        return {
+            "year": self.year,
+            "month": self.month,
+            "categories": [c.to_dict() for c in self.categories],
+            "total_spent": total_spent,
+            "total_budget": self.total_budget,
+            "savings_rate": round((TOTAL_INCOME - total_spent) / TOTAL_INCOME * 100, 1)
+        }
+
+    def as_summary_v2(self) -> Dict:
+        """Formato de get_monthly_summary_v2 (variáveis x excluídas)."""
+        variables = self._group(self.variables)
+        excluded = self._group(self.excluded)
+        return {
+            "year": self.year,
+            "month": self.month,
+            "variables": variables,
+            "excluded": excluded,
+            # Taxa de poupança calculada APENAS sobre variáveis
+            "savings_rate": round((TOTAL_INCOME - variables["total"]) / TOTAL_INCOME * 100, 1),
+            "total_spent": variables["total"] + excluded["total"]
+        }
+
+    def as_consolidated(self) -> Dict:
+        """Formato de get_consolidated_summary (PF + PJ)."""
+        total_spent = self.total_spent
+        gross = self.pj_gross_revenue
+        return {
+            "year": self.year,
+            "month": self.month,
+            # PJ
+            "pj_gross_revenue": gross,
+            "pj_taxes": self.pj_taxes,
+            "pj_net_revenue": gross - self.pj_taxes,
+            "pj_tax_rate": round(self.pj_taxes / gross * 100, 2) if gross > 0 else 0,
+            # PF
+            "pf_expenses": total_spent,
+            "pf_budget": self.total_budget,
+            # Consolidado
+            "total_income": TOTAL_INCOME,
+            "total_outflow": total_spent + self.pj_taxes,
+            "savings": TOTAL_INCOME - total_spent,
+            "savings_rate": round((TOTAL_INCOME - total_spent) / TOTAL_INCOME * 100, 1)
+        }
+
+
+def aggregate_month(year: int, month: int, include_pj: bool = False) -> MonthlyAggregate:
+    """
+    Agrega os gastos do mês por categoria em uma única consulta ao rollup.
+
+    Args:
+        include_pj: também busca faturamento e impostos PJ do mês
+                    (duas leituras pontuais por (year, month))
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+
+        _execute_excluded(cursor, MONTHLY_AGGREGATE_QUERY, (year, month))
+
+        result = MonthlyAggregate(year=year, month=month, categories=[
+            CategoryTotal(
+                category=row["category"],
+                icon=row["icon"],
+                budget=row["budget"] or 0,
+                total=row["total"],
+                is_excluded=bool(row["is_excluded"])
+            )
+            for row in cursor.fetchall()
+        ])
+
+        if include_pj:
+            try:
+                cursor.execute('''
+                    SELECT
+                        (SELECT gross_revenue FROM pj_revenue WHERE year = ? AND month = ?),
+                        (SELECT SUM(amount) FROM pj_taxes WHERE year = ? AND month = ?)
+                ''', (year, month, year, month))
+                gross, taxes = cursor.fetchone()
+                result.pj_gross_revenue = gross or 0
+                result.pj_taxes = taxes or 0
+            except sqlite3.OperationalError:
+                # Tabelas PJ ainda não criadas
+                pass
+    finally:
+        conn.close()
     return result
 
 
-def get_monthly_summary_v2(year: int, month: int) -> Dict:
-    """Retorna resumo mensal separando variáveis de excluídas.
+@dataclass
+class YearlyMatrix:
+    """
+    Gastos do ano em uma matriz categoria x mês (numpy).
 
-    Categorias variáveis (9): alimentacao, transporte, saude, assinaturas,
-                             compras, lazer, educacao, casa, taxas
-    Categorias excluídas (2): obra, esportes
+    totals[i, m - 1] = gasto da categoria categories[i] no mês m.
+    Linhas na ordem de categories.id.
+    """
+    year: int
+    categories: List[str]
+    icons: List[str]
+    budgets: np.ndarray
+    is_excluded: np.ndarray
+    totals: np.ndarray
+
+    def index(self, name: str) -> Optional[int]:
+        try:
+            return self.categories.index(name)
+        except ValueError:
+            return None
+
+    def category(self, name: str) -> np.ndarray:
+        """Gastos mensais (12) de uma categoria; zeros se não existir."""
+        i = self.index(name)
+        return self.totals[i].copy() if i is not None else np.zeros(12)
+
+    def month_totals(self, exclude: tuple = ()) -> np.ndarray:
+        """Total gasto por mês (12), opcionalmente ignorando categorias."""
+        mask = np.array([name not in exclude for name in self.categories], dtype=bool)
+        return self.totals[mask].sum(axis=0) if mask.any() else np.zeros(12)
+
+    def month(self, month: int) -> MonthlyAggregate:
+        """Resumo de um mês (mesmo resultado de aggregate_month, sem consulta)."""
+        column = self.totals[:, month - 1]
+        order = sorted(range(len(self.categories)), key=lambda i: -column[i])
+        return MonthlyAggregate(year=self.year, month=month, categories=[
+            CategoryTotal(
+                category=self.categories[i],
+                icon=self.icons[i],
+                budget=float(self.budgets[i]),
+                total=float(column[i]),
+                is_excluded=bool(self.is_excluded[i])
+            )
+            for i in order
+        ])
+
+    def to_dataframe(self):
+        """DataFrame pandas (categorias x meses 1..12)."""
+        import pandas as pd
+        return pd.DataFrame(self.totals, index=self.categories, columns=range(1, 13))
+
+
+YEARLY_MATRIX_QUERY = '''
+    SELECT
+        c.name as category,
+        c.icon,
+        c.budget_monthly as budget,
+        {excluded} as is_excluded,
+        r.month,
+        COALESCE(r.total, 0) as total
+    FROM categories c
+    LEFT JOIN monthly_category_totals r ON r.category_id = c.id
+        AND r.year = ?
+        AND r.type = 'expense'
+    ORDER BY c.id
+'''
+
+
+def get_yearly_matrix(year: int) -> YearlyMatrix:
+    """
+    Retorna os gastos do ano por categoria x mês em uma única consulta ao rollup.
 
-    A taxa de poupança é calculada APENAS sobre as variáveis.
+    Substitui loops de 12 chamadas a get_monthly_summary:
+        matrix = get_yearly_matrix(2026)
+        matrix.month_totals()           # total por mês
+        matrix.category("obra")         # obra por mês
+        matrix.month(1).as_summary()    # == get_monthly_summary(2026, 1)
     """
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = conn.cursor()
 
-    # Buscar variáveis (is_excluded = 0)
-    cursor.execute('''
-        SELECT
-            c.name as category,
-            c.icon,
-            c.budget_monthly as budget,
-            COALESCE(SUM(ABS(t.amount)), 0) as total
-        FROM categories c
-        LEFT JOIN transactions t ON t.category_id = c.id
-            AND strftime('%Y', t.date) = ?
-            AND strftime('%m', t.date) = ?
-            AND t.type = 'expense'
-        WHERE c.is_excluded = 0
-        GROUP BY c.id
-        ORDER BY total DESC
-    ''', (str(year), f"{month:02d}"))
-
-    variable_rows = cursor.fetchall()
-
-    # Buscar excluídas (is_excluded = 1)
-    cursor.execute('''
-        SELECT
-            c.name as category,
-            c.icon,
-            c.budget_monthly as budget,
-            COALESCE(SUM(ABS(t.amount)), 0) as total
-        FROM categories c
-        LEFT JOIN transactions t ON t.category_id = c.id
-            AND strftime('%Y', t.date) = ?
-            AND strftime('%m', t.date) = ?
-            AND t.type = 'expense'
-        WHERE c.is_excluded = 1
-        GROUP BY c.id
-        ORDER BY total DESC
-    ''', (str(year), f"{month:02d}"))
-
-    excluded_rows = cursor.fetchall()
-    conn.close()
-
-    # Processar variáveis
-    variables = {
-        "categories": [],
-        "total": 0,
-        "budget": 0
-    }
+        _execute_excluded(cursor, YEARLY_MATRIX_QUERY, (year,))
 
-    for row in variable_rows:
-        cat_data = dict(row)
-        cat_data["percent"] = round(cat_data["total"] / cat_data["budget"] * 100, 1) if cat_data["budget"] > 0 else 0
-        cat_data["status"] = "ok" if cat_data["percent"] <= 90 else ("warning" if cat_data["percent"] <= 110 else "critical")
-        variables["categories"].append(cat_data)
-        variables["total"] += cat_data["total"]
-        variables["budget"] += cat_data["budget"]
-
-    # Processar excluídas
-    excluded = {
-        "categories": [],
-        "total": 0,
-        "budget": 0
-    }
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
 
-    for row in excluded_rows:
-        cat_data = dict(row)
-        cat_data["percent"] = round(cat_data["total"] / cat_data["budget"] * 100, 1) if cat_data["budget"] > 0 else 0
-        cat_data["status"] = "ok" if cat_data["percent"] <= 90 else ("warning" if cat_data["percent"] <= 110 else "critical")
-        excluded["categories"].append(cat_data)
-        excluded["total"] += cat_data["total"]
-        excluded["budget"] += cat_data["budget"]
+    categories, icons, budgets, excluded = [], [], [], []
+    cells = []
+    for row in rows:
+        if not categories or categories[-1] != row["category"]:
+            categories.append(row["category"])
+            icons.append(row["icon"])
+            budgets.append(row["budget"] or 0)
+            excluded.append(bool(row["is_excluded"]))
+        if row["month"]:
+            cells.append((len(categories) - 1, row["month"] - 1, row["total"]))
+
+    totals = np.zeros((len(categories), 12))
+    if cells:
+        rows_idx, cols_idx, values = zip(*cells)
+        totals[list(rows_idx), list(cols_idx)] = values
+
+    return YearlyMatrix(
+        year=year,
+        categories=categories,
+        icons=icons,
+        budgets=np.array(budgets, dtype=float),
+        is_excluded=np.array(excluded, dtype=bool),
+        totals=totals
+    )
 
-    # Taxa de poupança calculada APENAS sobre variáveis
-    savings_rate = round((55000 - variables["total"]) / 55000 * 100, 1)
 
-    return {
-        "year": year,
-        "month": month,
-        "variables": variables,
-        "excluded": excluded,
-        "savings_rate": savings_rate,
-        "total_spent": variables["total"] + excluded["total"]
-    }
+def get_monthly_summary(year: int, month: int) -> Dict:
+    """Retorna resumo mensal de gastos por categoria."""
+    return aggregate_month(year, month).as_summary()
+
+
+def get_monthly_summary_v2(year: int, month: int) -> Dict:
+    """Retorna resumo mensal separando variáveis de excluídas.
+
+    Categorias variáveis (9): alimentacao, transporte, saude, assinaturas,
+                             compras, lazer, educacao, casa, taxas
+    Categorias excluídas (2): obra, esportes
+
+    A taxa de poupança é calculada APENAS sobre as variáveis.
+    """
+    return aggregate_month(year, month).as_summary_v2()
 
 
 # ==================== INSTALLMENTS ====================
@@ -421,33 +2210,35 @@ def add_installment(
 ) -> Dict:
     """Adiciona um parcelamento."""
     conn = get_connection()
-    cursor = conn.cursor()
-
-    installment_amount = total_amount / total_installments
-
-    # Calcular data final
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end_month = start.month + total_installments - 1
-    end_year = start.year + (end_month - 1) // 12
-    end_month = ((end_month - 1) % 12) + 1
-    end_date = f"{end_year}-{end_month:02d}-01"
-
-    # Buscar category_id
-    cursor.execute("SELECT id FROM categories WHERE name = ?", (category.lower(),))
-    cat_row = cursor.fetchone()
-    category_id = cat_row["id"] if cat_row else None
-
-    cursor.execute('''
-        INSERT INTO installments
-        (description, total_amount, installment_amount, total_installments,
-         current_installment, start_date, end_date, category_id)
-        VALUES (?, ?, ?, ?, 1, ?, ?, ?)
-    ''', (description, total_amount, installment_amount, total_installments,
-          start_date, end_date, category_id))
-
-    inst_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+
+        installment_amount = total_amount / total_installments
+
+        # Calcular data final
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end_month = start.month + total_installments - 1
+        end_year = start.year + (end_month - 1) // 12
+        end_month = ((end_month - 1) % 12) + 1
+        end_date = f"{end_year}-{end_month:02d}-01"
+
+        # Buscar category_id
+        cursor.execute("SELECT id FROM categories WHERE name = ?", (category.lower(),))
+        cat_row = cursor.fetchone()
+        category_id = cat_row["id"] if cat_row else None
+
+        cursor.execute('''
+            INSERT INTO installments
+            (description, total_amount, installment_amount, total_installments,
+             current_installment, start_date, end_date, category_id)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+        ''', (description, total_amount, installment_amount, total_installments,
+              start_date, end_date, category_id))
+
+        inst_id = cursor.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
 
     return {
         "id": inst_id,
@@ -458,95 +2249,389 @@ def add_installment(
     }
 
 
-def get_active_installments() -> List[Dict]:
-    """Retorna parcelamentos ativos."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT i.*, c.name as category_name
-        FROM installments i
-        LEFT JOIN categories c ON i.category_id = c.id
-        WHERE i.status = 'active'
-        ORDER BY i.end_date
-    ''')
-
-    rows = cursor.fetchall()
-    conn.close()
-
-    return [dict(row) for row in rows]
-
-
-def generate_installment_transactions(year: int, month: int) -> Dict:
+def get_active_installments(fmt: str = "dict"):
     """
-    Gera transações para parcelamentos ativos em um mês específico.
-    Isso garante que os parcelamentos "comam" do budget mensal.
+    Retorna parcelamentos ativos.
 
-    Usa installment_id para prevenir duplicação quando transações
-    são importadas manualmente do cartão de crédito.
+    Args:
+        fmt: "dict" (padrão), "rows" (InstallmentRow) ou "array" (numpy)
     """
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        if fmt != "dict":
+            cursor = _typed_cursor(conn)
+            cursor.execute('''
+                SELECT i.id, i.description, i.total_amount, i.installment_amount,
+                       i.total_installments, COALESCE(i.current_installment, 1),
+                       i.start_date, i.end_date, COALESCE(i.category_id, 0),
+                       c.name, i.status
+                FROM installments i
+                LEFT JOIN categories c ON i.category_id = c.id
+                WHERE i.status = 'active'
+                ORDER BY i.end_date
+            ''')
+            return _typed_result(cursor, fmt, InstallmentRow)
+
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT i.*, c.name as category_name
+            FROM installments i
+            LEFT JOIN categories c ON i.category_id = c.id
+            WHERE i.status = 'active'
+            ORDER BY i.end_date
+        ''')
+
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
 
-    results = {"created": 0, "skipped": 0, "errors": 0}
+    return [dict(row) for row in rows]
 
-    # Buscar parcelamentos ativos
-    installments = get_active_installments()
 
-    for inst in installments:
-        try:
-            start_date = datetime.strptime(inst['start_date'], '%Y-%m-%d')
-            end_date = datetime.strptime(inst['end_date'], '%Y-%m-%d')
-            target_date = datetime(year, month, 1)
+def month_index(year: int, month: int) -> int:
+    """Índice absoluto do mês (ano * 12 + mês - 1), base da aritmética de meses."""
+    return year * 12 + month - 1
 
-            # Verificar se o mês está dentro do período do parcelamento
-            if start_date <= target_date <= end_date:
-                # Calcular número da parcela para este mês
-                months_elapsed = (target_date.year - start_date.year) * 12 + (target_date.month - start_date.month)
-                parcela_num = months_elapsed + 1  # Parcelas começam em 1
 
-                if parcela_num > inst['total_installments']:
-                    continue
+def installment_schedule(year: int, month: int, months: int = 1) -> np.ndarray:
+    """
+    Expande os parcelamentos ativos em parcelas mensais, de (year, month)
+    por `months` meses, sem loop por parcelamento.
 
-                # ✅ VERIFICAR SE JÁ EXISTE transação com este installment_id no mês
-                cursor.execute("""
-                    SELECT id FROM transactions
-                    WHERE installment_id = ?
-                    AND strftime('%Y-%m', date) = ?
-                """, (inst['id'], f"{year}-{month:02d}"))
+    Regras (as mesmas da versão anterior, dia a dia):
+    - ativo no mês M se start_date <= dia 1 de M <= end_date
+    - parcela = meses desde o mês de start_date + 1, até total_installments
 
-                if cursor.fetchone():
-                    results["skipped"] += 1
-                    continue  # ✅ Já existe, não duplicar
+    Returns:
+        structured array com installment_id, month_index, parcela,
+        total_installments, amount, category_id e description
+        (ordenado por mês e parcelamento)
+    """
+    inst = get_active_installments(fmt="array")
+    dtype = [("installment_id", "i8"), ("month_index", "i8"), ("parcela", "i8"),
+             ("total_installments", "i8"), ("amount", "f8"), ("category_id", "i8"),
+             ("description", "O")]
+    if len(inst) == 0 or months <= 0:
+        return np.zeros(0, dtype=dtype)
+
+    # Meses absolutos (datetime64[M] -> meses desde 1970-01)
+    start_month = inst["start_date"].astype("datetime64[M]")
+    start_idx = start_month.astype("i8") + month_index(1970, 1)
+    end_idx = inst["end_date"].astype("datetime64[M]").astype("i8") + month_index(1970, 1)
+    # Início no meio do mês: o dia 1 daquele mês ainda não está no período
+    first_active = start_idx + (inst["start_date"] > start_month.astype("datetime64[D]"))
+
+    valid = ~(np.isnat(inst["start_date"]) | np.isnat(inst["end_date"]))
+    targets = month_index(year, month) + np.arange(months)[:, None]   # (meses, 1)
+    parcela = targets - start_idx                                     # (meses, n)
+    parcela += 1
+    active = (valid & (targets >= first_active) & (targets <= end_idx)
+              & (parcela <= inst["total_installments"]))
+
+    t_pos, i_pos = np.nonzero(active)
+    schedule = np.zeros(len(t_pos), dtype=dtype)
+    schedule["installment_id"] = inst["id"][i_pos]
+    schedule["month_index"] = targets[t_pos, 0]
+    schedule["parcela"] = parcela[t_pos, i_pos]
+    schedule["total_installments"] = inst["total_installments"][i_pos]
+    schedule["amount"] = inst["installment_amount"][i_pos]
+    schedule["category_id"] = inst["category_id"][i_pos]
+    schedule["description"] = inst["description"][i_pos]
+    return schedule
+
+
+GENERATE_INSTALLMENTS_SQL = '''
+    INSERT OR IGNORE INTO transactions
+    (date, description, amount, category_id, type, source, hash,
+     installment_id, installment_current, installment_total)
+    SELECT s.date, s.description, s.amount, s.category_id, 'expense', 'parcelamento',
+           s.hash, s.installment_id, s.parcela, s.total_installments
+    FROM temp.installment_schedule s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM transactions t
+        WHERE t.installment_id = s.installment_id
+        AND t.date >= s.month_start AND t.date < s.month_end
+    )
+'''
+
+# Parcelas ainda não lançadas cujo hash já pertence a outra transação (mesma
+# data, descrição e valor, ex: lançamento manual): o índice UNIQUE em hash
+# descarta a linha no INSERT OR IGNORE acima, então o mês ficaria sem parcela
+INSTALLMENT_HASH_CONFLICTS_SQL = '''
+    SELECT s.installment_id, s.date, s.description, s.amount, t.id AS transaction_id
+    FROM temp.installment_schedule s
+    JOIN transactions t ON t.hash = s.hash
+    WHERE NOT EXISTS (
+        SELECT 1 FROM transactions i
+        WHERE i.installment_id = s.installment_id
+        AND i.date >= s.month_start AND i.date < s.month_end
+    )
+'''
+
+
+def generate_installment_range(year: int, month: int, months: int = 1) -> Dict:
+    """
+    Gera as transações de parcelamento de `months` meses a partir de
+    (year, month) em uma única transação: o cronograma vai para uma tabela
+    temporária e um INSERT ... SELECT ... WHERE NOT EXISTS grava só as
+    parcelas que ainda não têm transação com o mesmo installment_id no mês
+    (inclusive as importadas manualmente do cartão).
+
+    Returns:
+        {"created", "skipped", "conflicts", "errors"}:
+        - skipped: parcelas que já tinham transação no mês
+        - conflicts: parcelas não gravadas porque o hash já pertence a outra
+          transação ([{installment_id, date, description, amount,
+          transaction_id}]); o mês fica sem a parcela até resolver
+        - errors: parcelamentos ativos sem start_date/end_date válidos
+    """
+    schedule = installment_schedule(year, month, months)
+
+    rows = []
+    for inst_id, m_idx, parcela, total, amount, category_id, desc in schedule.tolist():
+        y, m = divmod(m_idx, 12)
+        month_start, month_end = month_range(y, m + 1)
+        description = f"{desc} {parcela}/{total}"
+        # Data da transação: dia 10 do mês
+        tx_date = f"{y}-{m + 1:02d}-10"
+        rows.append((tx_date, description, amount, category_id or None,
+                     generate_hash(tx_date, description, amount),
+                     inst_id, parcela, total, month_start, month_end))
 
-                # Descrição da transação
-                description = f"{inst['description']} {parcela_num}/{inst['total_installments']}"
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS installment_schedule (
+                date TEXT, description TEXT, amount REAL, category_id INTEGER,
+                hash TEXT, installment_id INTEGER, parcela INTEGER,
+                total_installments INTEGER, month_start TEXT, month_end TEXT
+            )
+        ''')
+        cursor.execute("DELETE FROM temp.installment_schedule")
+        cursor.executemany(
+            "INSERT INTO temp.installment_schedule VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        cursor.execute(INSTALLMENT_HASH_CONFLICTS_SQL)
+        conflicts = [dict(row) for row in cursor.fetchall()]
+        cursor.execute(GENERATE_INSTALLMENTS_SQL)
+        created = max(cursor.rowcount, 0)
+        cursor.execute("DELETE FROM temp.installment_schedule")
+
+        # Parcelamentos ativos sem datas válidas (não entram no cronograma)
+        cursor.execute('''
+            SELECT COUNT(*) FROM installments
+            WHERE status = 'active' AND (start_date IS NULL OR end_date IS NULL)
+        ''')
+        errors = cursor.fetchone()[0]
+
+        conn.commit()
+    finally:
+        conn.close()
 
-                # Data da transação (dia 10 do mês)
-                tx_date = f"{year}-{month:02d}-10"
+    return {
+        "created": created,
+        "skipped": len(rows) - created - len(conflicts),
+        "conflicts": conflicts,
+        "errors": errors
+    }
 
-                # Hash para evitar duplicatas
-                tx_hash = generate_hash(tx_date, description, inst['installment_amount'])
 
-                # Inserir transação com installment_id
-                cursor.execute('''
-                    INSERT INTO transactions
-                    (date, description, amount, category_id, type, source, hash,
-                     installment_id, installment_current, installment_total)
-                    VALUES (?, ?, ?, ?, 'expense', 'parcelamento', ?, ?, ?, ?)
-                ''', (tx_date, description, inst['installment_amount'], inst['category_id'], tx_hash,
-                      inst['id'], parcela_num, inst['total_installments']))
+def generate_installment_transactions(year: int, month: int) -> Dict:
+    """
+    Gera transações para parcelamentos ativos em um mês específico.
+    Isso garante que os parcelamentos "comam" do budget mensal.
 
-                results["created"] += 1
+    Usa installment_id para prevenir duplicação quando transações
+    são importadas manualmente do cartão de crédito.
+    """
+    return generate_installment_range(year, month, 1)
 
-        except Exception as e:
-            print(f"Erro ao processar parcelamento {inst['description']}: {e}")
-            results["errors"] += 1
 
-    conn.commit()
-    conn.close()
+@dataclass
+class InstallmentCalendar:
+    """
+    Calendário parcelamento × mês dos parcelamentos ativos.
 
-    return results
+    Cada parcelamento vira uma entrada por mês entre o mês de start_date e o
+    de end_date (inclusive — mesma regra usada no dashboard e no Excel). As
+    entradas ficam ordenadas por mês, então "ativos no mês M" é uma busca
+    binária + fatia (O(log n + k)); o valor comprometido por mês é um
+    vetor denso pré-somado.
+    """
+    installments: List[Dict]
+    months: np.ndarray        # índice do mês de cada entrada (ordenado)
+    positions: np.ndarray     # posição em `installments` de cada entrada
+    first_month: int = 0      # índice do primeiro mês de `committed_by_month`
+    committed_by_month: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    end_dates: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype="datetime64[D]"))
+    end_order: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype="i8"))
+
+    @classmethod
+    def build(cls, installments: List[Dict]) -> "InstallmentCalendar":
+        n = len(installments)
+        start = np.array([i.get("start_date") or None for i in installments],
+                         dtype="datetime64[D]")
+        end = np.array([i.get("end_date") or None for i in installments],
+                       dtype="datetime64[D]")
+        amounts = np.array([i.get("installment_amount") or 0 for i in installments],
+                           dtype=float)
+
+        valid = ~(np.isnat(start) | np.isnat(end))
+        offset = month_index(1970, 1)
+        start_idx = np.where(valid, start.astype("datetime64[M]").astype("i8"), 0) + offset
+        end_idx = np.where(valid, end.astype("datetime64[M]").astype("i8"), -1) + offset
+        lengths = np.where(valid, np.maximum(end_idx - start_idx + 1, 0), 0)
+
+        # Expande (parcelamento, mês) e ordena por mês
+        positions = np.repeat(np.arange(n), lengths)
+        steps = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        months = start_idx[positions] + steps
+        order = np.argsort(months, kind="stable")
+        months, positions = months[order], positions[order]
+
+        calendar = cls(installments, months, positions)
+        if len(months):
+            calendar.first_month = int(months[0])
+            calendar.committed_by_month = np.bincount(
+                months - calendar.first_month, weights=amounts[positions]
+            )
+        calendar.end_order = np.flatnonzero(valid)[np.argsort(end[valid], kind="stable")]
+        calendar.end_dates = end[calendar.end_order]
+        return calendar
+
+    def active(self, year: int, month: int) -> List[Dict]:
+        """Parcelamentos ativos no mês."""
+        target = month_index(year, month)
+        lo = np.searchsorted(self.months, target, side="left")
+        hi = np.searchsorted(self.months, target, side="right")
+        return [self.installments[i] for i in self.positions[lo:hi]]
+
+    def committed(self, year: int, month: int, months: int = 12) -> np.ndarray:
+        """Valor comprometido por mês, de (year, month) por `months` meses."""
+        result = np.zeros(months)
+        first = month_index(year, month) - self.first_month
+        lo, hi = max(first, 0), min(first + months, len(self.committed_by_month))
+        if lo < hi:
+            result[lo - first:hi - first] = self.committed_by_month[lo:hi]
+        return result
+
+    def ending_between(self, start: date, end: date) -> List[Dict]:
+        """Parcelamentos com end_date em [start, end]."""
+        lo = np.searchsorted(self.end_dates, np.datetime64(start, "D"), side="left")
+        hi = np.searchsorted(self.end_dates, np.datetime64(end, "D"), side="right")
+        return [self.installments[i] for i in self.end_order[lo:hi]]
+
+
+# Calendário e projeções em cache, invalidados pela versão de `installments`
+_installment_cache: Dict[str, Any] = {"version": None, "calendar": None, "projections": {}}
+_installment_cache_lock = threading.Lock()
+
+
+def get_installment_calendar() -> InstallmentCalendar:
+    """
+    Calendário dos parcelamentos ativos. Fica em cache até a tabela
+    `installments` mudar (contador mantido por trigger em table_versions).
+    """
+    version = get_table_version("installments")
+    with _installment_cache_lock:
+        cached = _installment_cache["calendar"]
+        if cached is not None and version is not None and _installment_cache["version"] == version:
+            return cached
+
+    calendar = InstallmentCalendar.build(get_active_installments())
+    with _installment_cache_lock:
+        _installment_cache.update(version=version, calendar=calendar, projections={})
+    return calendar
+
+
+# Classes de descrição dos parcelamentos (Fluxo de Caixa); o resto é "outros"
+INSTALLMENT_CLASSES = [
+    ("moveis", ("MOVEIS PLANEJADOS",)),
+    ("mesa", ("MESA", "CADEIRAS")),
+    ("eletros", ("ELETRODOMESTICOS",)),
+]
+COMMITMENT_GROUPS = ("category", "description_class")
+
+
+def classify_installment(description: str) -> str:
+    """Classe do parcelamento pela descrição (todas as palavras precisam aparecer)."""
+    description = (description or "").upper()
+    for name, words in INSTALLMENT_CLASSES:
+        if all(word in description for word in words):
+            return name
+    return "outros"
+
+
+@dataclass
+class CommitmentProjection:
+    """Saída comprometida com parcelamentos: grupos × meses."""
+    year: int
+    month: int
+    labels: List[str]
+    values: np.ndarray        # (len(labels), meses)
+
+    @property
+    def total(self) -> np.ndarray:
+        """Total comprometido por mês (todos os grupos)."""
+        return self.values.sum(axis=0)
+
+    def row(self, label: str) -> np.ndarray:
+        """Série mensal de um grupo (zeros se o grupo não tem parcelas)."""
+        if label not in self.labels:
+            return np.zeros(self.values.shape[1])
+        return self.values[self.labels.index(label)]
+
+    def months(self) -> List[tuple]:
+        """(ano, mês) de cada coluna."""
+        start = month_index(self.year, self.month)
+        return [(i // 12, i % 12 + 1) for i in range(start, start + self.values.shape[1])]
+
+
+def project_commitments(start: tuple, months: int = 12,
+                        group_by: str = "category") -> CommitmentProjection:
+    """
+    Projeta a saída comprometida com parcelamentos a partir de `start`
+    ((ano, mês)) por `months` meses, agrupada por categoria ou por classe de
+    descrição (INSTALLMENT_CLASSES).
+
+    Usa as entradas do calendário que caem na janela (busca binária) e soma
+    com bincount — sem loop mês × parcelamento. O resultado fica em cache
+    até `installments` mudar; trate a matriz como somente leitura.
+    """
+    if group_by not in COMMITMENT_GROUPS:
+        raise ValueError(f"group_by inválido: {group_by!r} (use {', '.join(COMMITMENT_GROUPS)})")
+
+    year, month = start
+    calendar = get_installment_calendar()
+    key = (year, month, months, group_by)
+    with _installment_cache_lock:
+        if _installment_cache["calendar"] is calendar and key in _installment_cache["projections"]:
+            return _installment_cache["projections"][key]
+
+    if group_by == "category":
+        groups = [inst.get("category_name") or "sem categoria" for inst in calendar.installments]
+    else:
+        groups = [classify_installment(inst.get("description")) for inst in calendar.installments]
+    labels = sorted(set(groups))
+    codes = np.array([labels.index(g) for g in groups], dtype="i8")
+    amounts = np.array([inst.get("installment_amount") or 0 for inst in calendar.installments],
+                       dtype=float)
+
+    first = month_index(year, month)
+    lo = np.searchsorted(calendar.months, first, side="left")
+    hi = np.searchsorted(calendar.months, first + months, side="left")
+    positions = calendar.positions[lo:hi]
+    cells = codes[positions] * months + (calendar.months[lo:hi] - first)
+    values = np.bincount(cells, weights=amounts[positions],
+                         minlength=len(labels) * months).reshape(len(labels), months)
+
+    projection = CommitmentProjection(year, month, labels, values)
+    with _installment_cache_lock:
+        if _installment_cache["calendar"] is calendar:
+            _installment_cache["projections"][key] = projection
+    return projection
 
 
 # ==================== REPORTS ====================
@@ -601,157 +2686,233 @@ def generate_monthly_report(year: int, month: int) -> str:
 
 # ==================== PJ (EMPRESA) ====================
 
-def init_pj_tables():
+PJ_SCHEMA = '''
+    -- Tabela de faturamento PJ
+    CREATE TABLE IF NOT EXISTS pj_revenue (
+        id INTEGER PRIMARY KEY,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        gross_revenue REAL NOT NULL,
+        currency TEXT DEFAULT 'BRL',
+        source TEXT DEFAULT 'contabilizei',
+        notes TEXT,
+        synced_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(year, month)
+    );
+
+    -- Tabela de impostos PJ
+    CREATE TABLE IF NOT EXISTS pj_taxes (
+        id INTEGER PRIMARY KEY,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        tax_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        due_date DATE,
+        paid_date DATE,
+        status TEXT DEFAULT 'pending',
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(year, month, tax_type)
+    );
+
+    -- Tabela de despesas fixas PJ
+    CREATE TABLE IF NOT EXISTS pj_expenses (
+        id INTEGER PRIMARY KEY,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        expense_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(year, month, expense_type)
+    );
+'''
+
+
+def create_pj_tables(conn):
     """Cria tabelas para dados da empresa (PJ) se não existirem."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Tabela de faturamento PJ
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pj_revenue (
-            id INTEGER PRIMARY KEY,
-            year INTEGER NOT NULL,
-            month INTEGER NOT NULL,
-            gross_revenue REAL NOT NULL,
-            currency TEXT DEFAULT 'BRL',
-            source TEXT DEFAULT 'contabilizei',
-            notes TEXT,
-            synced_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(year, month)
-        )
-    ''')
-
-    # Tabela de impostos PJ
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pj_taxes (
-            id INTEGER PRIMARY KEY,
-            year INTEGER NOT NULL,
-            month INTEGER NOT NULL,
-            tax_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            due_date DATE,
-            paid_date DATE,
-            status TEXT DEFAULT 'pending',
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(year, month, tax_type)
-        )
-    ''')
-
-    # Tabela de despesas fixas PJ
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pj_expenses (
-            id INTEGER PRIMARY KEY,
-            year INTEGER NOT NULL,
-            month INTEGER NOT NULL,
-            expense_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(year, month, expense_type)
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+    conn.executescript(PJ_SCHEMA)
+
+
+PJ_REVENUE_UPSERT = '''
+    INSERT INTO pj_revenue (year, month, gross_revenue, source, notes, synced_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(year, month) DO UPDATE SET
+        gross_revenue = excluded.gross_revenue,
+        source = excluded.source,
+        notes = excluded.notes,
+        synced_at = excluded.synced_at
+'''
+
+PJ_TAX_UPSERT = '''
+    INSERT INTO pj_taxes (year, month, tax_type, amount, due_date, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(year, month, tax_type) DO UPDATE SET
+        amount = excluded.amount,
+        due_date = excluded.due_date,
+        status = excluded.status
+'''
+
+PJ_EXPENSE_UPSERT = '''
+    INSERT INTO pj_expenses (year, month, expense_type, amount, notes)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(year, month, expense_type) DO UPDATE SET
+        amount = excluded.amount,
+        notes = excluded.notes
+'''
 
 
 def add_pj_revenue(year: int, month: int, gross_revenue: float, source: str = "contabilizei", notes: str = None) -> Dict:
     """Adiciona ou atualiza faturamento PJ do mês."""
-    init_pj_tables()
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO pj_revenue (year, month, gross_revenue, source, notes, synced_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(year, month) DO UPDATE SET
-            gross_revenue = excluded.gross_revenue,
-            source = excluded.source,
-            notes = excluded.notes,
-            synced_at = excluded.synced_at
-    ''', (year, month, gross_revenue, source, notes, datetime.now().isoformat()))
+        cursor.execute(PJ_REVENUE_UPSERT,
+                       (year, month, gross_revenue, source, notes, datetime.now().isoformat()))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    finally:
+        conn.close()
 
     return {"year": year, "month": month, "gross_revenue": gross_revenue, "status": "saved"}
 
 
 def add_pj_tax(year: int, month: int, tax_type: str, amount: float, due_date: str = None, status: str = "pending") -> Dict:
     """Adiciona ou atualiza imposto PJ."""
-    init_pj_tables()
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO pj_taxes (year, month, tax_type, amount, due_date, status)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(year, month, tax_type) DO UPDATE SET
-            amount = excluded.amount,
-            due_date = excluded.due_date,
-            status = excluded.status
-    ''', (year, month, tax_type, amount, due_date, status))
+        cursor.execute(PJ_TAX_UPSERT, (year, month, tax_type, amount, due_date, status))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    finally:
+        conn.close()
 
     return {"year": year, "month": month, "tax_type": tax_type, "amount": amount, "status": "saved"}
 
 
 def add_pj_expense(year: int, month: int, expense_type: str, amount: float, notes: str = None) -> Dict:
     """Adiciona ou atualiza despesa fixa PJ."""
-    init_pj_tables()
     conn = get_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO pj_expenses (year, month, expense_type, amount, notes)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(year, month, expense_type) DO UPDATE SET
-            amount = excluded.amount,
-            notes = excluded.notes
-    ''', (year, month, expense_type, amount, notes))
+        cursor.execute(PJ_EXPENSE_UPSERT, (year, month, expense_type, amount, notes))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    finally:
+        conn.close()
 
     return {"year": year, "month": month, "expense_type": expense_type, "amount": amount, "status": "saved"}
 
 
+def upsert_pj_batch(months: List[Dict], source: str = "contabilizei") -> Dict:
+    """
+    Grava dados PJ de vários meses em uma única transação.
+
+    Cada item de `months`:
+        {
+            "year": 2026, "month": 1,
+            "revenue": 36427.14,                  # opcional
+            "notes": "...",                       # opcional (faturamento)
+            "taxes": [{"tax_type": "simples", "amount": 2185.63,
+                       "due_date": "2026-02-20", "status": "pending"}],
+            "expenses": [{"expense_type": "prolabore", "amount": 1518.0,
+                          "notes": None}],
+        }
+
+    Returns:
+        {"months", "revenue", "taxes", "expenses", "status"} com as
+        quantidades gravadas.
+    """
+    synced_at = datetime.now().isoformat()
+    revenue_rows, tax_rows, expense_rows = [], [], []
+
+    for item in months:
+        year, month = item["year"], item["month"]
+        if item.get("revenue") is not None:
+            revenue_rows.append((year, month, item["revenue"], item.get("source", source),
+                                 item.get("notes"), synced_at))
+        for tax in item.get("taxes") or []:
+            tax_rows.append((year, month, tax["tax_type"], tax["amount"],
+                             tax.get("due_date"), tax.get("status", "pending")))
+        for expense in item.get("expenses") or []:
+            expense_rows.append((year, month, expense["expense_type"], expense["amount"],
+                                 expense.get("notes")))
+
+    conn = get_connection()
+    try:
+        conn.executemany(PJ_REVENUE_UPSERT, revenue_rows)
+        conn.executemany(PJ_TAX_UPSERT, tax_rows)
+        conn.executemany(PJ_EXPENSE_UPSERT, expense_rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {
+        "months": len(months),
+        "revenue": len(revenue_rows),
+        "taxes": len(tax_rows),
+        "expenses": len(expense_rows),
+        "status": "saved"
+    }
+
+
+def upsert_pj_month(
+    year: int,
+    month: int,
+    revenue: Optional[float] = None,
+    taxes: Optional[List[Dict]] = None,
+    expenses: Optional[List[Dict]] = None,
+    source: str = "contabilizei",
+    notes: Optional[str] = None
+) -> Dict:
+    """Grava faturamento, impostos e despesas PJ de um mês em uma transação."""
+    return upsert_pj_batch([{
+        "year": year,
+        "month": month,
+        "revenue": revenue,
+        "notes": notes,
+        "taxes": taxes,
+        "expenses": expenses,
+    }], source=source)
+
+
 def get_pj_monthly_summary(year: int, month: int) -> Dict:
     """Retorna resumo mensal da empresa (PJ)."""
-    init_pj_tables()
     conn = get_connection()
-    cursor = conn.cursor()
-
-    # Buscar faturamento
-    cursor.execute('''
-        SELECT gross_revenue, synced_at FROM pj_revenue
-        WHERE year = ? AND month = ?
-    ''', (year, month))
-    rev_row = cursor.fetchone()
-    gross_revenue = rev_row["gross_revenue"] if rev_row else 0
-    synced_at = rev_row["synced_at"] if rev_row else None
-
-    # Buscar impostos
-    cursor.execute('''
-        SELECT tax_type, amount, due_date, status FROM pj_taxes
-        WHERE year = ? AND month = ?
-    ''', (year, month))
-    taxes = [dict(row) for row in cursor.fetchall()]
-    total_taxes = sum(t["amount"] for t in taxes)
-
-    # Buscar despesas fixas
-    cursor.execute('''
-        SELECT expense_type, amount FROM pj_expenses
-        WHERE year = ? AND month = ?
-    ''', (year, month))
-    expenses = [dict(row) for row in cursor.fetchall()]
-    total_expenses = sum(e["amount"] for e in expenses)
-
-    conn.close()
+    try:
+        cursor = conn.cursor()
+
+        # Buscar faturamento
+        cursor.execute('''
+            SELECT gross_revenue, synced_at FROM pj_revenue
+            WHERE year = ? AND month = ?
+        ''', (year, month))
+        rev_row = cursor.fetchone()
+        gross_revenue = rev_row["gross_revenue"] if rev_row else 0
+        synced_at = rev_row["synced_at"] if rev_row else None
+
+        # Buscar impostos
+        cursor.execute('''
+            SELECT tax_type, amount, due_date, status FROM pj_taxes
+            WHERE year = ? AND month = ?
+        ''', (year, month))
+        taxes = [dict(row) for row in cursor.fetchall()]
+        total_taxes = sum(t["amount"] for t in taxes)
+
+        # Buscar despesas fixas
+        cursor.execute('''
+            SELECT expense_type, amount FROM pj_expenses
+            WHERE year = ? AND month = ?
+        ''', (year, month))
+        expenses = [dict(row) for row in cursor.fetchall()]
+        total_expenses = sum(e["amount"] for e in expenses)
+    finally:
+        conn.close()
 
     # Calcular líquido
     net_revenue = gross_revenue - total_taxes
@@ -772,26 +2933,26 @@ def get_pj_monthly_summary(year: int, month: int) -> Dict:
 
 def get_pj_yearly_summary(year: int) -> Dict:
     """Retorna resumo anual da empresa (PJ)."""
-    init_pj_tables()
     conn = get_connection()
-    cursor = conn.cursor()
-
-    # Buscar todos os meses do ano
-    cursor.execute('''
-        SELECT month, gross_revenue FROM pj_revenue
-        WHERE year = ?
-        ORDER BY month
-    ''', (year,))
-    revenues = {row["month"]: row["gross_revenue"] for row in cursor.fetchall()}
-
-    cursor.execute('''
-        SELECT month, SUM(amount) as total FROM pj_taxes
-        WHERE year = ?
-        GROUP BY month
-    ''', (year,))
-    taxes = {row["month"]: row["total"] for row in cursor.fetchall()}
-
-    conn.close()
+    try:
+        cursor = conn.cursor()
+
+        # Buscar todos os meses do ano
+        cursor.execute('''
+            SELECT month, gross_revenue FROM pj_revenue
+            WHERE year = ?
+            ORDER BY month
+        ''', (year,))
+        revenues = {row["month"]: row["gross_revenue"] for row in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT month, SUM(amount) as total FROM pj_taxes
+            WHERE year = ?
+            GROUP BY month
+        ''', (year,))
+        taxes = {row["month"]: row["total"] for row in cursor.fetchall()}
+    finally:
+        conn.close()
 
     months = []
     total_gross = 0
@@ -822,29 +2983,96 @@ def get_pj_yearly_summary(year: int) -> Dict:
 
 def get_consolidated_summary(year: int, month: int) -> Dict:
     """Retorna visão consolidada PF + PJ."""
-    pj = get_pj_monthly_summary(year, month)
-    pf = get_monthly_summary(year, month)
+    return aggregate_month(year, month, include_pj=True).as_consolidated()
+
+
+# ==================== SCHEMA MIGRATIONS ====================
+# Registro versionado de migrações automáticas (idempotentes), aplicado uma
+# vez por processo na abertura do pool. A versão aplicada fica em
+# schema_version. Migrações destrutivas ou com backup (remover duplicatas)
+# continuam em scripts/migrate_schema.py, que também aplica este registro.
+#
+# Para adicionar uma migração: acrescentar (versão, descrição, função) ao
+# fim de SCHEMA_MIGRATIONS; a função recebe uma conexão sqlite3.
+
+def create_installment_month_index(conn):
+    """Índice (installment_id, date) para checar parcela já lançada no mês."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(transactions)")]
+    if "installment_id" in columns:
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transactions_installment_date "
+            "ON transactions(installment_id, date)"
+        )
 
-    # Renda total fixa mensal (PJ líquido é parte da renda)
-    TOTAL_INCOME = 55000  # Renda líquida mensal total
 
-    return {
-        "year": year,
-        "month": month,
-        # PJ
-        "pj_gross_revenue": pj["gross_revenue"],
-        "pj_taxes": pj["total_taxes"],
-        "pj_net_revenue": pj["net_revenue"],
-        "pj_tax_rate": pj["effective_tax_rate"],
-        # PF
-        "pf_expenses": pf["total_spent"],
-        "pf_budget": pf["total_budget"],
-        # Consolidado
-        "total_income": TOTAL_INCOME,
-        "total_outflow": pf["total_spent"] + pj["total_taxes"],
-        "savings": TOTAL_INCOME - pf["total_spent"],
-        "savings_rate": round((TOTAL_INCOME - pf["total_spent"]) / TOTAL_INCOME * 100, 1)
-    }
+SCHEMA_MIGRATIONS = [
+    (1, "tabelas PJ (pj_revenue, pj_taxes, pj_expenses)", create_pj_tables),
+    (2, "rollup monthly_category_totals + triggers", ensure_rollup_schema),
+    (3, "índice transactions(installment_id, date)", create_installment_month_index),
+    (4, "table_versions + triggers de versão de installments", create_table_versions),
+    (5, "cache merchant_categories semeado do ledger", create_merchant_categories),
+    (6, "hash canônico blake2b + índice UNIQUE em hash", rehash_transactions),
+    (7, "near_duplicates + índice (centavos, data)", create_near_duplicates),
+    (8, "category_stats (Welford + EWMA) + triggers", create_category_stats),
+    (9, "triggers de versão de transactions e categories", create_history_versions),
+    (10, "remove escala 'transaction' de category_stats e seus triggers", drop_transaction_stats),
+]
+
+
+def get_schema_version(conn) -> int:
+    """Retorna a última versão aplicada (0 se nenhuma)."""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def check_schema_version(path: Optional[Path] = None) -> int:
+    """
+    Lê a versão do schema sem escrever no banco (modo somente leitura) e
+    avisa se houver migrações pendentes: quem migra é um processo escritor.
+    """
+    path = Path(path or DB_PATH)
+    if not path.exists():
+        raise FileNotFoundError(f"Banco {path} não existe: crie-o a partir de um processo escritor")
+    conn = sqlite3.connect(read_only_uri(path), uri=True)
+    try:
+        current = get_schema_version(conn)
+    finally:
+        conn.close()
+
+    latest = SCHEMA_MIGRATIONS[-1][0]
+    if current < latest:
+        print(f"⚠️  {path.name} está na versão {current} do schema (atual: {latest}); "
+              f"rode scripts/migrate_schema.py antes de abrir em modo somente leitura")
+    return current
+
+
+def apply_migrations(conn) -> List[int]:
+    """Aplica as migrações pendentes em ordem. Retorna as versões aplicadas."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    current = get_schema_version(conn)
+
+    applied = []
+    for version, description, migrate in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(conn)
+        # OR IGNORE: outro processo pode ter aplicado a mesma versão em paralelo
+        conn.execute(
+            "INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description)
+        )
+        conn.commit()
+        applied.append(version)
+
+    return applied
 
 
 # ==================== CLI ====================
@@ -854,7 +3082,7 @@ if __name__ == "__main__":
 
     if len(sys.argv) < 2:
         print("Uso: python finance_db.py <comando>")
-        print("Comandos: categories, summary, transactions, report, pj, consolidated")
+        print("Comandos: categories, summary, transactions, report, pj, consolidated, rebuild-rollups, snapshot, installments, learn-merchants, near-duplicates, stats")
         sys.exit(1)
 
     cmd = sys.argv[1]
@@ -917,5 +3145,48 @@ if __name__ == "__main__":
         print(f"  Renda Total: R$ {cons['total_income']:,.2f}")
         print(f"  Poupanca: R$ {cons['savings']:,.2f} ({cons['savings_rate']}%)")
 
+    elif cmd == "rebuild-rollups":
+        count = rebuild_rollups()
+        print(f"✅ monthly_category_totals reconstruída: {count} linhas")
+
+    elif cmd == "learn-merchants":
+        print(f"Estabelecimentos no cache: {learn_merchant_categories()}")
+
+    elif cmd == "stats":
+        # stats [rebuild]: fecha meses nas estatísticas online e lista por categoria
+        if len(sys.argv) > 2 and sys.argv[2] == "rebuild":
+            print(f"Linhas reconstruídas: {rebuild_category_stats()}")
+        else:
+            print(f"Categorias atualizadas: {close_month_stats()}")
+        for name, st in sorted(get_category_stats("month").items()):
+            print(f"  {name:15} meses n={st.n:3} média R$ {st.mean:10,.2f} dp {st.std:10,.2f} "
+                  f"ewma R$ {st.ewma:10,.2f} conf {st.confidence():.0%}")
+
+    elif cmd == "near-duplicates":
+        # near-duplicates [full]: varre transações novas e lista pares pendentes
+        result = scan_near_duplicates(full=len(sys.argv) > 2 and sys.argv[2] == "full")
+        print(f"Transações verificadas: {result['scanned']}, pares comparados: "
+              f"{result['candidates']}, novos suspeitos: {result['found']}")
+        for dup in get_near_duplicates():
+            print(f"  #{dup['id']} {dup['date']} {dup['description']} ≈ "
+                  f"#{dup['original_id']} {dup['original_date']} {dup['original_description']} "
+                  f"R$ {dup['amount']:,.2f} ({dup['score']:.0%})")
+
+    elif cmd == "installments":
+        # installments <ano> <mes> [meses]: gera parcelas (ex: backfill do ano)
+        year = int(sys.argv[2]) if len(sys.argv) > 2 else datetime.now().year
+        month = int(sys.argv[3]) if len(sys.argv) > 3 else datetime.now().month
+        months = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+        result = generate_installment_range(year, month, months)
+        print(f"Parcelas criadas: {result['created']}, já existentes: {result['skipped']}, "
+              f"conflitos de hash: {len(result['conflicts'])}, erros: {result['errors']}")
+        for c in result["conflicts"]:
+            print(f"  ⚠️  {c['date']} {c['description']} R$ {c['amount']:,.2f} "
+                  f"= transação #{c['transaction_id']} (parcela não gravada)")
+
+    elif cmd == "snapshot":
+        dest = snapshot_database(Path(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(f"✅ Snapshot gravado em {dest}")
+
     else:
         print(f"Comando desconhecido: {cmd}")
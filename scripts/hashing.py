@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Hashing Module
+Hash canônico de transações, usado por todos os caminhos de importação
+para deduplicar contra o índice UNIQUE em transactions(hash).
+
+Chave: data, descrição normalizada (espaços colapsados, minúsculas) e valor
+absoluto com 2 casas, separados por \\x00. Digest: BLAKE2b de 16 bytes
+(32 caracteres hex, mesmo tamanho do md5 anterior).
+"""
+
+import hashlib
+from typing import Iterable, List, Tuple
+
+HASH_SCHEME = "blake2b-128"
+DIGEST_SIZE = 16
+
+
+def normalize_key(date_str: str, description: str, amount: float) -> bytes:
+    """Chave normalizada de uma transação (o que entra no hash)."""
+    normalized_desc = " ".join(description.split()).lower()
+    return f"{date_str}\x00{normalized_desc}\x00{abs(amount):.2f}".encode()
+
+
+def transaction_hash(date_str: str, description: str, amount: float) -> str:
+    """Hash canônico de uma transação."""
+    return hashlib.blake2b(normalize_key(date_str, description, amount),
+                           digest_size=DIGEST_SIZE).hexdigest()
+
+
+def hash_many(rows: Iterable[Tuple[str, str, float]]) -> List[str]:
+    """
+    Hash canônico de várias transações (date, description, amount).
+
+    Monta todas as chaves com normalize_key primeiro e depois faz os digests
+    em um loop enxuto.
+    """
+    keys = [normalize_key(*row) for row in rows]
+    blake2b = hashlib.blake2b
+    return [blake2b(key, digest_size=DIGEST_SIZE).hexdigest() for key in keys]
@@ -4,16 +4,23 @@ Import BB History - Importa histórico de faturas BB (Jul-Dez 2025)
 """
 
 import re
-import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
+
+try:
+    from finance_db import add_transactions_chunked, get_categories, get_connection, lookup_merchant_category
+except ImportError:
+    from scripts.finance_db import add_transactions_chunked, get_categories, get_connection, lookup_merchant_category
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
 DB_PATH = PROJECT_ROOT / "data" / "finance.db"
 HISTORY_FILE = PROJECT_ROOT / "data" / "bb_history_2025.txt"
 
+# Transações por lote (uma transação SQLite cada) na importação em streaming
+CHUNK_SIZE = 5000
+
 # Mapeamento de categorias BB para categorias do sistema
 BB_TO_SYSTEM_CATEGORY = {
     "restaurantes": "alimentacao",
@@ -112,6 +119,11 @@ def get_system_category(bb_category: str, description: str) -> Optional[str]:
     """Mapeia categoria BB para categoria do sistema."""
     desc_lower = description.lower()
 
+    # Estabelecimento já conhecido no ledger (inclui recategorizações manuais)
+    known = lookup_merchant_category(description)
+    if known:
+        return known
+
     # PicPay: contas de utilidade -> casa
     if "picpay*" in desc_lower:
         for util in PICPAY_UTILITIES:
@@ -181,92 +193,87 @@ def parse_amount(amount_str: str) -> float:
 
 def parse_history_file(filepath: Path) -> List[Dict]:
     """Parseia arquivo de histórico BB."""
-    transactions = []
+    return list(iter_history_file(filepath))
+
+
+def iter_history_file(filepath: Path) -> Iterator[Dict]:
+    """Versão em streaming de parse_history_file: lê e gera linha a linha."""
     current_month = None
     current_year = 2025
     current_bb_category = None
 
     with open(filepath, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-
-        # Detectar mês
-        if line.startswith("=== "):
-            month_match = re.search(r"(JULHO|AGOSTO|SETEMBRO|OUTUBRO|NOVEMBRO|DEZEMBRO)\s+(\d{4})", line)
-            if month_match:
-                month_name = month_match.group(1)
-                current_year = int(month_match.group(2))
-                month_map = {
-                    "JULHO": 7, "AGOSTO": 8, "SETEMBRO": 9,
-                    "OUTUBRO": 10, "NOVEMBRO": 11, "DEZEMBRO": 12
-                }
-                current_month = month_map.get(month_name)
-            continue
-
-        # Detectar categoria BB
-        if line in ["Bancos", "Lazer", "Restaurantes", "Saude", "Servicos",
-                    "Supermercados", "Transporte", "Vestuario", "Viagens",
-                    "Educacao", "Outros"]:
-            current_bb_category = line.lower()
-            continue
-
-        # Parsear transação
-        # Formato: DD/MM\tDESCRICAO\tR$\tVALOR
-        parts = line.split("\t")
-        if len(parts) >= 4:
-            date_str = parts[0].strip()
-            description = parts[1].strip()
-            # Valor está nas últimas partes
-            amount_str = parts[-1].strip()
-
-            # Ignorar transações específicas
-            if should_ignore(description):
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
                 continue
 
-            # Ignorar valores negativos (créditos)
-            amount = parse_amount(amount_str)
-            if amount <= 0:
+            # Detectar mês
+            if line.startswith("=== "):
+                month_match = re.search(r"(JULHO|AGOSTO|SETEMBRO|OUTUBRO|NOVEMBRO|DEZEMBRO)\s+(\d{4})", line)
+                if month_match:
+                    month_name = month_match.group(1)
+                    current_year = int(month_match.group(2))
+                    month_map = {
+                        "JULHO": 7, "AGOSTO": 8, "SETEMBRO": 9,
+                        "OUTUBRO": 10, "NOVEMBRO": 11, "DEZEMBRO": 12
+                    }
+                    current_month = month_map.get(month_name)
                 continue
 
-            # Obter categoria do sistema
-            system_category = get_system_category(current_bb_category or "servicos", description)
-            if system_category is None:
-                continue  # Ignorar (ex: PicPay)
-
-            # Parsear data
-            date = parse_date(date_str, current_year)
-            if not date:
+            # Detectar categoria BB
+            if line in ["Bancos", "Lazer", "Restaurantes", "Saude", "Servicos",
+                        "Supermercados", "Transporte", "Vestuario", "Viagens",
+                        "Educacao", "Outros"]:
+                current_bb_category = line.lower()
                 continue
 
-            transactions.append({
-                "date": date,
-                "description": description,
-                "amount": amount,
-                "category": system_category,
-                "bb_category": current_bb_category,
-                "source": "bb_historico_2025"
-            })
-
-    return transactions
-
-
-def get_category_mapping(cursor) -> Dict[str, int]:
-    """Obtém mapeamento nome -> id das categorias."""
-    cursor.execute("SELECT id, name FROM categories")
-    return {row[1]: row[0] for row in cursor.fetchall()}
-
+            # Parsear transação
+            # Formato: DD/MM\tDESCRICAO\tR$\tVALOR
+            parts = line.split("\t")
+            if len(parts) >= 4:
+                date_str = parts[0].strip()
+                description = parts[1].strip()
+                # Valor está nas últimas partes
+                amount_str = parts[-1].strip()
+
+                # Ignorar transações específicas
+                if should_ignore(description):
+                    continue
+
+                # Ignorar valores negativos (créditos)
+                amount = parse_amount(amount_str)
+                if amount <= 0:
+                    continue
+
+                # Obter categoria do sistema
+                system_category = get_system_category(current_bb_category or "servicos", description)
+                if system_category is None:
+                    continue  # Ignorar (ex: PicPay)
+
+                # Parsear data
+                date = parse_date(date_str, current_year)
+                if not date:
+                    continue
+
+                yield {
+                    "date": date,
+                    "description": description,
+                    "amount": amount,
+                    "category": system_category,
+                    "bb_category": current_bb_category,
+                    "source": "bb_historico_2025"
+                }
 
-def import_to_database(transactions: List[Dict]) -> Dict:
-    """Importa transações no banco SQLite."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
-    # Obter mapeamento de categorias
-    category_map = get_category_mapping(cursor)
+def import_to_database(transactions: Iterable[Dict]) -> Dict:
+    """
+    Importa transações no banco em lotes de CHUNK_SIZE (add_transactions_chunked):
+    duplicatas caem no índice UNIQUE de hash via INSERT OR IGNORE e o cache de
+    estabelecimentos é atualizado no mesmo lote. Aceita lista ou gerador
+    (iter_history_file); a memória fica limitada a um lote.
+    """
+    category_names = {cat["name"] for cat in get_categories()}
 
     results = {
         "inserted": 0,
@@ -276,59 +283,71 @@ def import_to_database(transactions: List[Dict]) -> Dict:
         "by_month": {},
     }
 
-    for tx in transactions:
-        try:
-            # Obter category_id
-            cat_name = tx["category"]
-            category_id = category_map.get(cat_name)
-            if category_id is None:
-                print(f"Categoria não encontrada: {cat_name}")
-                results["errors"] += 1
-                continue
-
-            # Gerar hash para evitar duplicatas
-            import hashlib
-            hash_str = f"{tx['date']}|{tx['description']}|{tx['amount']}"
-            tx_hash = hashlib.md5(hash_str.encode()).hexdigest()
+    consumed = 0
 
-            # Verificar duplicata
-            cursor.execute("""
-                SELECT id FROM transactions
-                WHERE hash = ?
-            """, (tx_hash,))
-
-            if cursor.fetchone():
-                results["duplicates"] += 1
+    def rows():
+        nonlocal consumed
+        for tx in transactions:
+            if tx["category"] not in category_names:
+                print(f"Categoria não encontrada: {tx['category']}")
+                results["errors"] += 1
                 continue
+            consumed += 1
+            yield {
+                "date": tx["date"],
+                "description": tx["description"],
+                "amount": tx["amount"],
+                "category": tx["category"],
+                "source": tx["source"],
+            }
+
+    last_id = get_last_transaction_id()
+    stats: Dict = {}
+    try:
+        add_transactions_chunked(rows(), chunk_size=CHUNK_SIZE, stats=stats)
+    except Exception as e:
+        # Lotes anteriores ficam gravados; o lote com erro é descartado
+        failed = consumed - stats.get("total", 0)
+        results["errors"] += failed
+        print(f"Erro ao importar lote de {failed} transações: {e}")
+
+    results["inserted"] = stats.get("inserted", 0)
+    results["duplicates"] = stats.get("duplicates", 0)
+    results["by_category"], results["by_month"] = get_inserted_breakdown(last_id)
+    return results
 
-            # Inserir
-            cursor.execute("""
-                INSERT INTO transactions (date, description, amount, category_id, type, source, hash)
-                VALUES (?, ?, ?, ?, 'expense', ?, ?)
-            """, (tx["date"], tx["description"], tx["amount"], category_id, tx["source"], tx_hash))
-
-            results["inserted"] += 1
-
-            # Estatísticas
-            if cat_name not in results["by_category"]:
-                results["by_category"][cat_name] = {"count": 0, "total": 0}
-            results["by_category"][cat_name]["count"] += 1
-            results["by_category"][cat_name]["total"] += tx["amount"]
-
-            month = tx["date"][:7]
-            if month not in results["by_month"]:
-                results["by_month"][month] = {"count": 0, "total": 0}
-            results["by_month"][month]["count"] += 1
-            results["by_month"][month]["total"] += tx["amount"]
 
-        except Exception as e:
-            print(f"Erro ao importar {tx['description']}: {e}")
-            results["errors"] += 1
+def get_last_transaction_id() -> int:
+    """Maior id em transactions (0 se vazia): linhas novas terão id maior."""
+    conn = get_connection()
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+    finally:
+        conn.close()
 
-    conn.commit()
-    conn.close()
 
-    return results
+def get_inserted_breakdown(last_id: int) -> Tuple[Dict, Dict]:
+    """Contagem e total por categoria e por mês das transações com id > last_id."""
+    conn = get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT c.name, substr(t.date, 1, 7), COUNT(*), SUM(t.amount)
+            FROM transactions t
+            JOIN categories c ON c.id = t.category_id
+            WHERE t.id > ?
+            GROUP BY c.name, substr(t.date, 1, 7)
+        """, (last_id,)).fetchall()
+    finally:
+        conn.close()
+
+    by_category: Dict[str, Dict] = {}
+    by_month: Dict[str, Dict] = {}
+    for cat_name, month, count, total in rows:
+        for key, bucket in ((cat_name, by_category), (month, by_month)):
+            entry = bucket.setdefault(key, {"count": 0, "total": 0})
+            entry["count"] += count
+            entry["total"] += total
+    return by_category, by_month
 
 
 def print_report(results: Dict):
@@ -367,14 +386,12 @@ def main():
         print(f"❌ Banco de dados não encontrado: {DB_PATH}")
         return
 
-    # Parsear arquivo
+    # Parsear e importar em streaming (arquivo lido linha a linha)
     print(f"📖 Lendo arquivo: {HISTORY_FILE}")
-    transactions = parse_history_file(HISTORY_FILE)
-    print(f"   Encontradas {len(transactions)} transações válidas")
-
-    # Importar
     print(f"💾 Importando para: {DB_PATH}")
-    results = import_to_database(transactions)
+    results = import_to_database(iter_history_file(HISTORY_FILE))
+    found = results["inserted"] + results["duplicates"] + results["errors"]
+    print(f"   Encontradas {found} transações válidas")
 
     # Relatório
     print_report(results)
@@ -5,17 +5,21 @@ Workflow Unificado de Importação e Sincronização
 Integra todos os passos do processo de importação:
 1. Importar statement BB (opcional)
 2. Gerar parcelamentos automáticos
-3. Remover duplicatas
+3. Remover duplicatas (e listar quase-duplicatas para revisão)
 4. Regenerar relatórios
 
 Uso:
     python import_workflow.py 2026 1              # Só regenerar
     python import_workflow.py 2026 1 fatura.txt   # Importar + regenerar
+    python import_workflow.py import-dir faturas/ # Importar vários statements
 """
 
 import sys
 import sqlite3
-import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
@@ -23,17 +27,33 @@ from typing import Dict, List, Optional, Tuple
 # Importar módulos do projeto
 try:
     from scripts.finance_db import (
+        add_transactions_chunked,
+        close_month_stats,
+        configure_read_only,
         generate_installment_transactions,
         generate_hash,
-        get_connection
+        get_connection,
+        get_near_duplicates,
+        month_range,
+        scan_near_duplicates
     )
+    from scripts.bb_parser import iter_bb_transactions
+    import scripts.finance_db as finance_db
     from scripts.sync_obsidian import sync_to_obsidian, sync_pj
 except ImportError:
     from finance_db import (
+        add_transactions_chunked,
+        close_month_stats,
+        configure_read_only,
         generate_installment_transactions,
         generate_hash,
-        get_connection
+        get_connection,
+        get_near_duplicates,
+        month_range,
+        scan_near_duplicates
     )
+    from bb_parser import iter_bb_transactions
+    import finance_db
     from sync_obsidian import sync_to_obsidian, sync_pj
 
 DB_PATH = Path(__file__).parent.parent / 'data' / 'finance.db'
@@ -44,15 +64,13 @@ def find_duplicates(year: int, month: int) -> List[Dict]:
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
-    month_str = f"{year}-{month:02d}"
-
     # Buscar todas transações do mês
     cursor.execute("""
         SELECT id, date, description, amount, hash
         FROM transactions
-        WHERE strftime('%Y-%m', date) = ?
+        WHERE date >= ? AND date < ?
         ORDER BY date, id
-    """, (month_str,))
+    """, month_range(year, month))
 
     transactions = cursor.fetchall()
     conn.close()
@@ -62,18 +80,20 @@ def find_duplicates(year: int, month: int) -> List[Dict]:
     duplicates = []
 
     for txn_id, date, description, amount, stored_hash in transactions:
-        # Usar hash armazenado
-        if stored_hash in seen_hashes:
+        # Hash armazenado; linhas sem hash (colisões deixadas em NULL pelo
+        # rehash) usam o hash canônico calculado
+        txn_hash = stored_hash or generate_hash(date, description or "", amount)
+        if txn_hash in seen_hashes:
             duplicates.append({
                 'id': txn_id,
-                'original_id': seen_hashes[stored_hash],
+                'original_id': seen_hashes[txn_hash],
                 'date': date,
                 'description': description,
                 'amount': amount,
-                'hash': stored_hash
+                'hash': txn_hash
             })
         else:
-            seen_hashes[stored_hash] = txn_id
+            seen_hashes[txn_hash] = txn_id
 
     return duplicates
 
@@ -114,6 +134,112 @@ def import_bb_statement(statement_file: str, year: int, month: int) -> Dict:
     }
 
 
+def _init_statement_worker(db_path: str):
+    """Worker do import-dir usa o mesmo banco do processo principal, só leitura."""
+    finance_db.DB_PATH = Path(db_path)
+    configure_read_only(snapshot=False)
+
+
+def _parse_statement_file(path: str) -> Tuple[str, List[Dict], float]:
+    """
+    Worker do import-dir: parseia e categoriza um statement inteiro.
+    Roda em outro processo; só lê o banco (cache de estabelecimentos).
+    """
+    start = time.perf_counter()
+    rows = [
+        {
+            "date": tx.date,
+            "description": tx.description,
+            "amount": tx.amount,
+            "category": tx.category,
+            "installment_current": tx.installment_current,
+            "installment_total": tx.installment_total,
+        }
+        for tx in iter_bb_transactions(Path(path))
+    ]
+    return path, rows, time.perf_counter() - start
+
+
+def import_statement_dir(
+    directory: str,
+    pattern: str = "*.txt",
+    workers: Optional[int] = None,
+    source: str = "bb_fatura"
+) -> Dict:
+    """
+    Importa todos os statements de um diretório.
+
+    O parse + categorização (CPU) roda em um ProcessPoolExecutor; este
+    processo é o único escritor e grava cada arquivo com
+    add_transactions_chunked (dedup pelo índice UNIQUE em hash). Os
+    arquivos são gravados em ordem de nome, independente de qual worker
+    termina primeiro, então o resultado (ids, qual cópia de uma duplicata
+    fica) é sempre o mesmo.
+
+    Os workers categorizam com um snapshot do cache merchant_categories
+    (banco aberto somente leitura no início de cada worker): o que um
+    arquivo ensina não vale para os outros arquivos do mesmo lote. A
+    gravação de cada arquivo atualiza o cache de forma incremental
+    (add_transactions_bulk), então a próxima importação já o encontra em dia.
+
+    Returns:
+        {"files": [{file, transactions, inserted, duplicates, parse_s, write_s}],
+         "inserted", "duplicates", "near_duplicates", "elapsed_s"}
+    """
+    files = sorted(str(p) for p in Path(directory).glob(pattern) if p.is_file())
+    summary = {"files": [], "inserted": 0, "duplicates": 0,
+               "near_duplicates": 0, "elapsed_s": 0.0}
+    if not files:
+        print(f"  Nenhum arquivo {pattern} em {directory}")
+        return summary
+
+    workers = workers or min(len(files), os.cpu_count() or 1)
+    print(f"  {len(files)} arquivos, {workers} workers")
+
+    start = time.perf_counter()
+    # Schema/migrações aplicados antes dos workers abrirem o banco
+    get_connection().close()
+
+    # spawn: workers não herdam conexões SQLite abertas neste processo
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_statement_worker,
+                             initargs=(str(finance_db.DB_PATH),)) as executor:
+        # map devolve na ordem de `files`: gravação determinística
+        for path, rows, parse_s in executor.map(_parse_statement_file, files):
+            write_start = time.perf_counter()
+            result = add_transactions_chunked(rows, source=source)
+            write_s = time.perf_counter() - write_start
+
+            summary["files"].append({
+                "file": Path(path).name,
+                "transactions": len(rows),
+                "inserted": result["inserted"],
+                "duplicates": result["duplicates"],
+                "parse_s": parse_s,
+                "write_s": write_s,
+            })
+            summary["inserted"] += result["inserted"]
+            summary["duplicates"] += result["duplicates"]
+            print(f"  {Path(path).name:32} {len(rows):6} txs  "
+                  f"+{result['inserted']:<6} dup {result['duplicates']:<6} "
+                  f"parse {parse_s:6.2f}s  write {write_s:6.2f}s")
+
+    summary["elapsed_s"] = time.perf_counter() - start
+    print(f"  Total: {summary['inserted']} inseridas, {summary['duplicates']} duplicatas "
+          f"em {summary['elapsed_s']:.2f}s")
+
+    # Meses fechados que os statements tocaram entram nas estatísticas online
+    close_month_stats()
+
+    scan = scan_near_duplicates()
+    summary["near_duplicates"] = scan["found"]
+    if scan["found"]:
+        print(f"  🟡 {scan['found']} possíveis duplicatas para revisar "
+              f"(python finance_db.py near-duplicates)")
+    return summary
+
+
 def import_and_sync_month(
     year: int,
     month: int,
@@ -133,6 +259,7 @@ def import_and_sync_month(
         'imported': 0,
         'installments_created': 0,
         'duplicates_removed': 0,
+        'near_duplicates': 0,
         'errors': []
     }
 
@@ -161,6 +288,9 @@ def import_and_sync_month(
         skipped = result.get('skipped', 0)
         print(f"  ✅ Criados: {stats['installments_created']}")
         print(f"  ⏭️  Já existentes: {skipped}")
+        for c in result.get('conflicts', []):
+            print(f"  ⚠️  Parcela não gravada: {c['date']} {c['description']} "
+                  f"R$ {c['amount']:,.2f} (mesmo hash da transação #{c['transaction_id']})")
         print()
 
         # Etapa 3: Remover duplicatas
@@ -198,11 +328,28 @@ def import_and_sync_month(
             print(f"  ✅ {removed} duplicatas removidas")
         else:
             print("  ✅ Nenhuma duplicata encontrada")
+
+        # Quase-duplicatas (só transações novas desde a última varredura)
+        scan = scan_near_duplicates()
+        pending = get_near_duplicates()
+        stats['near_duplicates'] = len(pending)
+        if pending:
+            print(f"  🟡 {len(pending)} possíveis duplicatas para revisar "
+                  f"({scan['scanned']} transações novas verificadas):")
+            for dup in pending[:5]:
+                print(f"     • {dup['date']} {dup['description']} ≈ "
+                      f"{dup['original_date']} {dup['original_description']} "
+                      f"R$ {dup['amount']:,.2f} ({dup['score']:.0%})")
+            if len(pending) > 5:
+                print(f"     ... e mais {len(pending) - 5} pares")
         print()
 
         # Etapa 4: Regenerar relatórios
         print(f"[4/4] Regenerando relatórios...")
 
+        # Estatísticas online: incorpora meses fechados (e os recém-alterados)
+        close_month_stats()
+
         # Sync Obsidian PF
         sync_to_obsidian(year, month)
         print("  ✅ Obsidian PF atualizado")
@@ -242,12 +389,22 @@ def import_and_sync_month(
 
 def main():
     """Main execution."""
+    if len(sys.argv) >= 3 and sys.argv[1] == "import-dir":
+        # import-dir <diretorio> [padrao] [workers]
+        pattern = sys.argv[3] if len(sys.argv) > 3 else "*.txt"
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        print(f"Importando statements de {sys.argv[2]}")
+        import_statement_dir(sys.argv[2], pattern, workers)
+        return
+
     if len(sys.argv) < 3:
         print("Uso: python import_workflow.py <ano> <mes> [arquivo_statement]")
+        print("     python import_workflow.py import-dir <diretorio> [padrao] [workers]")
         print()
         print("Exemplos:")
         print("  python import_workflow.py 2026 1              # Só regenerar")
         print("  python import_workflow.py 2026 1 fatura.txt   # Importar + regenerar")
+        print("  python import_workflow.py import-dir faturas/ \"*.txt\" 4")
         sys.exit(1)
 
     year = int(sys.argv[1])
@@ -1,26 +1,22 @@
 #!/usr/bin/env python3
 """
 Schema Migration Script
-Adiciona colunas is_excluded e installment_id, e recalcula todos os hashes
-com a nova função normalizada.
+Adiciona colunas is_excluded e installment_id, recalcula todos os hashes
+com o hash canônico (scripts/hashing.py), remove hashes duplicados, cria
+os índices de consulta (data e hash único) e aplica as migrações registradas em
+finance_db.SCHEMA_MIGRATIONS (tabela schema_version).
 """
 
 import sqlite3
-import hashlib
 from pathlib import Path
 from datetime import datetime
 
-DB_PATH = Path(__file__).parent.parent / 'data' / 'finance.db'
+try:
+    from finance_db import apply_migrations, get_schema_version, rehash_transactions
+except ImportError:
+    from scripts.finance_db import apply_migrations, get_schema_version, rehash_transactions
 
-def generate_hash_new(date_str: str, description: str, amount: float) -> str:
-    """Nova função de hash robusta com normalização."""
-    # Normalizar descrição: remover espaços extras, lowercase
-    normalized_desc = ' '.join(description.strip().split()).lower()
-    # Formatar valor com 2 casas decimais
-    amount_str = f"{abs(amount):.2f}"
-    # Usar separador null byte (não aparece em texto)
-    content = f"{date_str}\x00{normalized_desc}\x00{amount_str}"
-    return hashlib.md5(content.encode()).hexdigest()
+DB_PATH = Path(__file__).parent.parent / 'data' / 'finance.db'
 
 def backup_database():
     """Criar backup do banco antes da migration."""
@@ -32,6 +28,56 @@ def backup_database():
     print(f"✅ Backup criado: {backup_path}")
     return backup_path
 
+# Índices de consulta (nome, DDL)
+# - date/category_id/type/amount: cobre os resumos mensais por categoria
+#   (filtro por intervalo de data sem acessar a tabela)
+# - hash (UNIQUE): deduplicação na importação via INSERT OR IGNORE
+#   (finance_db.add_transactions_bulk); substitui o antigo idx_transactions_hash
+QUERY_INDEXES = [
+    ("idx_transactions_date_cat_type_amount",
+     "CREATE INDEX idx_transactions_date_cat_type_amount "
+     "ON transactions(date, category_id, type, amount)"),
+    ("idx_transactions_hash_unique",
+     "CREATE UNIQUE INDEX idx_transactions_hash_unique ON transactions(hash)"),
+]
+
+def create_index_if_not_exists(cursor, name: str, ddl: str) -> bool:
+    """Cria índice se não existir."""
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type='index' AND name=?
+    """, (name,))
+    if cursor.fetchone():
+        print(f"  ⏭️  Índice {name} já existe")
+        return False
+
+    cursor.execute(ddl)
+    print(f"  ✅ Índice {name} criado")
+    return True
+
+def remove_duplicate_hashes(cursor) -> int:
+    """Remove transações com hash repetido, mantendo a de menor id."""
+    cursor.execute("""
+        DELETE FROM transactions
+        WHERE hash IS NOT NULL
+        AND id NOT IN (
+            SELECT MIN(id) FROM transactions
+            WHERE hash IS NOT NULL
+            GROUP BY hash
+        )
+    """)
+    return cursor.rowcount
+
+def create_query_indexes(cursor):
+    """Cria os índices de consulta por data e hash."""
+    removed = remove_duplicate_hashes(cursor)
+    if removed:
+        print(f"  ✅ {removed} transações com hash duplicado removidas")
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_hash")
+    for name, ddl in QUERY_INDEXES:
+        create_index_if_not_exists(cursor, name, ddl)
+    cursor.execute("ANALYZE transactions")
+
 def add_column_if_not_exists(cursor, table: str, column: str, type_def: str):
     """Adiciona coluna se não existir."""
     cursor.execute(f"PRAGMA table_info({table})")
@@ -61,7 +107,7 @@ def migrate_schema():
 
     try:
         # Etapa 1: Adicionar is_excluded à tabela categories
-        print("[1/5] Adicionando coluna is_excluded...")
+        print("[1/7] Adicionando coluna is_excluded...")
         added = add_column_if_not_exists(cursor, 'categories', 'is_excluded', 'BOOLEAN DEFAULT 0')
 
         if added:
@@ -77,7 +123,7 @@ def migrate_schema():
         print()
 
         # Etapa 2: Adicionar installment_id à tabela transactions
-        print("[2/5] Adicionando coluna installment_id...")
+        print("[2/7] Adicionando coluna installment_id...")
         add_column_if_not_exists(cursor, 'transactions', 'installment_id', 'INTEGER')
         conn.commit()
 
@@ -96,22 +142,15 @@ def migrate_schema():
         print()
 
         # Etapa 3: Recalcular TODOS os hashes
-        print("[3/5] Recalculando hashes de todas as transações...")
-        cursor.execute("SELECT id, date, description, amount FROM transactions")
-        transactions = cursor.fetchall()
-
-        updated = 0
-        for txn_id, date, desc, amt in transactions:
-            new_hash = generate_hash_new(date, desc, amt)
-            cursor.execute("UPDATE transactions SET hash = ? WHERE id = ?", (new_hash, txn_id))
-            updated += 1
-
-        conn.commit()
-        print(f"  ✅ {updated} hashes recalculados")
+        print("[3/7] Recalculando hashes de todas as transações...")
+        result = rehash_transactions(conn, delete_duplicates=True)
+        print(f"  ✅ {result['rehashed']} hashes recalculados (hashing.transaction_hash)")
+        if result["duplicates"]:
+            print(f"  ✅ {result['duplicates']} transações com hash duplicado removidas")
         print()
 
         # Etapa 4: Associar transações existentes aos installments (best effort)
-        print("[4/5] Associando transações a parcelamentos...")
+        print("[4/7] Associando transações a parcelamentos...")
 
         # Buscar todos os installments ativos
         cursor.execute("""
@@ -151,8 +190,25 @@ def migrate_schema():
         print(f"  ✅ {associated} transações associadas a parcelamentos")
         print()
 
-        # Etapa 5: Verificar resultado final
-        print("[5/5] Verificando migration...")
+        # Etapa 5: Índices de consulta (filtros por intervalo de data)
+        print("[5/7] Criando índices de consulta...")
+        create_query_indexes(cursor)
+        conn.commit()
+        print()
+
+        # Etapa 6: Migrações registradas em finance_db (schema_version)
+        print("[6/7] Aplicando migrações registradas...")
+        applied = apply_migrations(conn)
+        if applied:
+            print(f"  ✅ Versões aplicadas: {', '.join(map(str, applied))}")
+        else:
+            print("  ⏭️  Nenhuma migração pendente")
+        print()
+
+        # Etapa 7: Verificar resultado final
+        print("[7/7] Verificando migration...")
+
+        print(f"  Versão do schema: {get_schema_version(conn)}")
 
         # Verificar categorias excluded
         cursor.execute("SELECT COUNT(*) FROM categories WHERE is_excluded = 1")
@@ -177,8 +233,7 @@ def migrate_schema():
         print("=" * 60)
         print()
         print("Próximos passos:")
-        print("1. Verificar se há duplicatas: python scripts/remove_duplicates_jan2026.py")
-        print("2. Regenerar relatórios: python scripts/sync_obsidian.py syncall 2026 1")
+        print("1. Regenerar relatórios: python scripts/sync_obsidian.py syncall 2026 1")
         print()
 
     except Exception as e:
@@ -5,5 +5,6 @@ Provides spending predictions and budget optimization
 
 from .spending_predictor import SpendingPredictor
 from .budget_optimizer import BudgetOptimizer
+from .model_store import ModelStore
 
-__all__ = ['SpendingPredictor', 'BudgetOptimizer']
+__all__ = ['SpendingPredictor', 'BudgetOptimizer', 'ModelStore']
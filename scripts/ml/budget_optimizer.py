@@ -13,14 +13,13 @@ from dataclasses import dataclass
 
 DB_PATH = Path(__file__).parent.parent.parent / "data" / "finance.db"
 
-# Import finance_db to ensure database exists with correct schema
+# finance_db provides the connection pool, schema and the shared history cache
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
-try:
-    from finance_db import ensure_database_exists
-    ensure_database_exists()
-except ImportError:
-    pass
+from finance_db import ensure_database_exists, get_connection, get_spending_history, history_window
+ensure_database_exists()
+
+from ml.model_store import ModelStore
 
 
 @dataclass
@@ -52,23 +51,25 @@ class BudgetOptimizer:
     # Categories that are discretionary (easier to cut)
     DISCRETIONARY_CATEGORIES = {'lazer', 'compras', 'assinaturas'}
 
-    def __init__(self, analysis_months: int = 6):
+    def __init__(self, analysis_months: int = 6, cache: bool = True):
         """
         Initialize optimizer.
 
         Args:
             analysis_months: Number of months to analyze
+            cache: Read history and stats from the SpendingPredictor ModelStore
+                   with the same window when its fingerprint is current
         """
         self.analysis_months = analysis_months
+        self.store = ModelStore("spending", analysis_months) if cache else None
         self.current_budgets: Dict[str, float] = {}
         self.spending_history: Dict[str, List[float]] = {}
+        self.history_stats: Dict[str, Dict] = {}
         self.utilization: Dict[str, Dict] = {}
 
     def _get_connection(self):
-        """Get database connection."""
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get database connection (shared finance_db pool)."""
+        return get_connection()
 
     def load_budgets(self) -> Dict[str, float]:
         """Load current budget allocations from database."""
@@ -82,36 +83,41 @@ class BudgetOptimizer:
         self.current_budgets = {row['name']: row['budget_monthly'] for row in rows}
         return self.current_budgets
 
-    def load_spending_history(self) -> Dict[str, List[float]]:
-        """Load monthly spending history by category."""
+    def _load_stored_history(self) -> bool:
+        """Take history and stats from a current ModelStore fit, if there is one."""
         conn = self._get_connection()
-        cursor = conn.cursor()
-
-        query = '''
-            SELECT
-                strftime('%Y-%m', t.date) as month,
-                c.name as category,
-                SUM(ABS(t.amount)) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense'
-            AND t.date >= date('now', ?)
-            GROUP BY month, c.name
-            ORDER BY month
-        '''
-
-        cursor.execute(query, (f'-{self.analysis_months} months',))
-        rows = cursor.fetchall()
-        conn.close()
-
-        # Organize by category
-        from collections import defaultdict
-        history: Dict[str, List[float]] = defaultdict(list)
+        try:
+            fingerprint = self.store.fingerprint(conn)
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+
+        stored = self.store.load()
+        if not stored or stored['fingerprint'] != fingerprint:
+            return False
+
+        self.spending_history = {}
+        self.history_stats = {}
+        for i, category in enumerate(str(c) for c in stored['categories']):
+            n = int(stored['months'][i])
+            self.spending_history[category] = [float(v) for v in stored['Y'][i, :n]]
+            self.history_stats[category] = {
+                'mean': float(stored['mean'][i]),
+                'std': float(stored['std'][i]),
+                'max': float(stored['max'][i])
+            }
+        return True
 
-        for row in rows:
-            history[row['category']].append(row['total'])
+    def load_spending_history(self) -> Dict[str, List[float]]:
+        """Load monthly spending history by category."""
+        if self.store is not None and self._load_stored_history():
+            return self.spending_history
 
-        self.spending_history = dict(history)
+        self.history_stats = {}
+        # Last N closed calendar months, zero-filled (shared finance_db cache)
+        history = get_spending_history(*history_window(self.analysis_months))
+        self.spending_history = history.as_dict()
         return self.spending_history
 
     def analyze_utilization(self) -> Dict[str, Dict]:
@@ -139,9 +145,13 @@ class BudgetOptimizer:
                 }
                 continue
 
-            avg_spending = np.mean(history)
-            std_spending = np.std(history) if len(history) > 1 else 0
-            max_spending = np.max(history)
+            stats = self.history_stats.get(category)
+            if stats:
+                avg_spending, std_spending, max_spending = stats['mean'], stats['std'], stats['max']
+            else:
+                avg_spending = np.mean(history)
+                std_spending = np.std(history) if len(history) > 1 else 0
+                max_spending = np.max(history)
 
             if budget > 0:
                 utilization_pct = (avg_spending / budget) * 100
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Model Store - persisted, versioned cache of fitted spending models
+Keeps the batched fit of SpendingPredictor (series, slope/intercept and
+category stats) on disk, keyed by a fingerprint of the data it came from.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import finance_db
+
+# Arrays saved per store, one row per category
+STATE_ARRAYS = ('categories', 'labels', 'Y', 'mask', 'slope', 'intercept',
+                'months', 'mean', 'std', 'min', 'max')
+
+# Calendar window plus a digest of the ordered rollup rows inside it and of
+# the category names (the stored state is keyed by name). Any import,
+# deletion, recategorization or rename changes the digest; closing a month
+# moves the window. Spending in the current (open) month is outside the
+# window and does not invalidate the fit.
+FINGERPRINT_ROWS_QUERY = '''
+    SELECT r.category_id, r.year, r.month, r.total
+    FROM monthly_category_totals r
+    WHERE r.type = 'expense'
+    AND r.year * 12 + r.month - 1 BETWEEN ? AND ?
+    ORDER BY r.category_id, r.year, r.month
+'''
+FINGERPRINT_NAMES_QUERY = "SELECT id, name FROM categories ORDER BY id"
+
+
+def data_fingerprint(conn, lookback_months: int) -> Dict:
+    """Fingerprint of the history a model with this lookback is fitted on."""
+    start, end = finance_db.history_window(lookback_months)
+    window = (finance_db.month_index(*start), finance_db.month_index(*end))
+    rows = conn.execute(FINGERPRINT_ROWS_QUERY, window).fetchall()
+    names = conn.execute(FINGERPRINT_NAMES_QUERY).fetchall()
+
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    digest.update(b"\x00")
+    for row in names:
+        digest.update(repr(tuple(row)).encode())
+    return {
+        'lookback_months': lookback_months,
+        'window_start': window[0],
+        'window_end': window[1],
+        'rows': len(rows),
+        'digest': digest.hexdigest(),
+    }
+
+
+class ModelStore:
+    """
+    One .npz file per (model name, lookback) in a models/ directory next to
+    the database.
+
+    The fingerprint is stored next to the arrays; load() returns the saved
+    state even when the fingerprint is stale, so callers can reuse the rows
+    (categories) whose series did not change.
+    """
+
+    def __init__(self, name: str, lookback_months: int, directory: Optional[Path] = None):
+        self.name = name
+        self.lookback_months = lookback_months
+        if directory is None:
+            directory = Path(finance_db.DB_PATH).parent / "models"
+        self.directory = Path(directory)
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"{self.name}_{self.lookback_months}m.npz"
+
+    def fingerprint(self, conn) -> Dict:
+        return data_fingerprint(conn, self.lookback_months)
+
+    def load(self) -> Optional[Dict]:
+        """Saved state ({'fingerprint': dict, <STATE_ARRAYS>}) or None."""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                state = {key: data[key] for key in STATE_ARRAYS}
+                state['fingerprint'] = json.loads(str(data['fingerprint']))
+        except (OSError, KeyError, ValueError):
+            return None
+        return state
+
+    def save(self, fingerprint: Dict, state: Dict) -> bool:
+        """Write the state atomically. Returns False if the directory is not writable."""
+        arrays = {key: np.asarray(state[key]) for key in STATE_ARRAYS}
+        arrays['fingerprint'] = np.array(json.dumps(fingerprint, sort_keys=True))
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path)
+        except OSError:
+            return False
+        return True
+
+    def clear(self):
+        """Remove the saved state (next fit starts from scratch)."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -6,6 +6,7 @@ Uses historical transaction data to forecast spending by category
 
 import sqlite3
 import numpy as np
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -31,14 +32,95 @@ MINIMUM_CATEGORY_SPENDING = {
     'casa': 120,           # Conta Vivo fixa
 }
 
-# Import finance_db to ensure database exists with correct schema
+# finance_db provides the connection pool, schema and the shared history cache
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
-try:
-    from finance_db import ensure_database_exists
-    ensure_database_exists()
-except ImportError:
-    pass
+from finance_db import ensure_database_exists, get_connection, get_spending_history, history_window
+ensure_database_exists()
+import anomalies
+
+from ml.model_store import ModelStore
+
+
+def fit_linear_batch(Y: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form least-squares fit of y = slope * x + intercept for every row
+    of a padded matrix at once.
+
+    Args:
+        Y: (categories, months) amounts, row i holds its series in the first
+           mask[i].sum() columns (x = 0, 1, 2, ...)
+        mask: boolean matrix of the same shape, True where Y holds data
+
+    Returns:
+        (slope, intercept) arrays; slope is 0 for rows with fewer than 2 points
+    """
+    w = mask.astype(float)
+    n = w.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    x = np.arange(Y.shape[1], dtype=float)
+
+    x_mean = (w * x).sum(axis=1) / safe_n
+    y_mean = (w * Y).sum(axis=1) / safe_n
+    dx = (x - x_mean[:, None]) * w
+    numerator = (dx * (Y - y_mean[:, None])).sum(axis=1)
+    denominator = (dx * dx).sum(axis=1)
+
+    slope = np.divide(numerator, denominator,
+                      out=np.zeros_like(numerator), where=denominator > 0)
+    intercept = y_mean - slope * x_mean
+    return slope, intercept
+
+
+@dataclass
+class BatchForecast:
+    """Next-month forecast for every category, one array entry per category."""
+    categories: List[str]
+    months: np.ndarray          # history length per category
+    predicted: np.ndarray
+    confidence: np.ndarray
+    lower_bound: np.ndarray
+    upper_bound: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray
+    minimum: np.ndarray         # MINIMUM_CATEGORY_SPENDING (0 if none)
+    minimum_applied: np.ndarray
+
+    def as_dict(self, i: int) -> Dict:
+        """Entry i in the predict_next_month format."""
+        result = {
+            'predicted': round(float(self.predicted[i]), 2),
+            'confidence': round(float(self.confidence[i]), 2),
+            'lower_bound': round(float(self.lower_bound[i]), 2),
+            'upper_bound': round(float(self.upper_bound[i]), 2),
+            'historical_mean': round(float(self.mean[i]), 2),
+            'historical_std': round(float(self.std[i]), 2)
+        }
+        if self.minimum_applied[i]:
+            result['minimum_applied'] = True
+            result['minimum_value'] = int(self.minimum[i])
+        return result
+
+
+def insufficient_data_prediction(category: str) -> Dict:
+    """Prediction for a category without enough history to fit a trend."""
+    min_spending = MINIMUM_CATEGORY_SPENDING.get(category, 0)
+    if min_spending > 0:
+        return {
+            'predicted': min_spending,
+            'confidence': 0.9,  # High confidence for fixed costs
+            'lower_bound': min_spending,
+            'upper_bound': min_spending * 1.2,
+            'minimum_applied': True,
+            'note': f'Baseado em gasto fixo mínimo de R$ {min_spending:,.0f}'
+        }
+    return {
+        'predicted': 0,
+        'confidence': 0,
+        'lower_bound': 0,
+        'upper_bound': 0,
+        'error': 'Insufficient data'
+    }
 
 
 class SpendingPredictor:
@@ -51,58 +133,50 @@ class SpendingPredictor:
     - Analyze trends over time
     """
 
-    def __init__(self, lookback_months: int = 6):
+    def __init__(self, lookback_months: int = 6, engine: str = "numpy", cache: bool = True):
         """
         Initialize predictor.
 
         Args:
             lookback_months: Number of months of history to use for predictions
+            engine: "numpy" (all categories fitted at once, closed form) or
+                    "sklearn" (one LinearRegression per category)
+            cache: Reuse/persist the numpy fit in a ModelStore (data/models)
         """
         self.lookback_months = lookback_months
+        self.engine = engine if SKLEARN_AVAILABLE else "numpy"
+        self.store = ModelStore("spending", lookback_months) if cache else None
+        self._fit: Optional[Dict] = None
+        self._history_from_db = False
         self.models: Dict[str, any] = {}
         self.historical_data: Dict[str, List[float]] = {}
         self.category_stats: Dict[str, Dict] = {}
 
     def _get_connection(self):
-        """Get database connection."""
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get database connection (shared finance_db pool)."""
+        return get_connection()
 
     def load_historical_data(self) -> Dict[str, List[Tuple[str, float]]]:
         """
         Load historical spending data from database.
 
+        The window is the last `lookback_months` closed calendar months
+        (finance_db.history_window); months without spending are 0, so every
+        series has the same length and x = 0, 1, 2, ... is the same month
+        for every category.
+
         Returns:
             Dict with category -> list of (month, amount) tuples
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        # Get spending by category and month for the last N months
-        query = '''
-            SELECT
-                strftime('%Y-%m', t.date) as month,
-                c.name as category,
-                SUM(ABS(t.amount)) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense'
-            AND t.date >= date('now', ?)
-            GROUP BY month, c.name
-            ORDER BY month, c.name
-        '''
-
-        cursor.execute(query, (f'-{self.lookback_months} months',))
-        rows = cursor.fetchall()
-        conn.close()
-
-        # Organize by category
+        history = get_spending_history(*history_window(self.lookback_months))
+
         data: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
-        for row in rows:
-            data[row['category']].append((row['month'], row['total']))
+        for category, row in zip(history.categories, history.totals):
+            data[category] = list(zip(history.labels, row.tolist()))
 
         self.historical_data = data
+        self._history_from_db = True
+        self._fit = None
         return data
 
     def prepare_features(self, category: str) -> Tuple[np.ndarray, np.ndarray]:
@@ -143,7 +217,7 @@ class SpendingPredictor:
         if len(X) < 2:
             return False
 
-        if SKLEARN_AVAILABLE:
+        if self.engine == "sklearn":
             model = LinearRegression()
             model.fit(X, y)
             self.models[category] = model
@@ -175,6 +249,140 @@ class SpendingPredictor:
 
         return True
 
+    def build_matrix(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Padded category x month matrix of the loaded history.
+
+        Returns:
+            (categories, Y, mask): row i holds the series of categories[i]
+            left-aligned (x = 0, 1, 2, ...), mask marks the filled cells
+        """
+        if not self.historical_data:
+            self.load_historical_data()
+
+        categories = list(self.historical_data.keys())
+        lengths = np.array([len(self.historical_data[c]) for c in categories], dtype=int)
+        width = int(lengths.max()) if len(lengths) else 0
+
+        mask = np.arange(width) < lengths[:, None]
+        Y = np.zeros(mask.shape)
+        Y[mask] = [amount for c in categories for _, amount in self.historical_data[c]]
+        return categories, Y, mask
+
+    @staticmethod
+    def _fit_rows(Y: np.ndarray, mask: np.ndarray) -> Dict[str, np.ndarray]:
+        """Fit and summarize the rows of a padded matrix."""
+        slope, intercept = fit_linear_batch(Y, mask)
+
+        months = mask.sum(axis=1)
+        safe_n = np.maximum(months, 1)
+        mean = (Y * mask).sum(axis=1) / safe_n
+        return {
+            'slope': slope,
+            'intercept': intercept,
+            'months': months,
+            'mean': mean,
+            'std': np.sqrt((((Y - mean[:, None]) * mask) ** 2).sum(axis=1) / safe_n),
+            'min': np.where(mask, Y, np.inf).min(axis=1, initial=np.inf),
+            'max': np.where(mask, Y, -np.inf).max(axis=1, initial=-np.inf),
+        }
+
+    def _data_fingerprint(self) -> Optional[Dict]:
+        conn = self._get_connection()
+        try:
+            return self.store.fingerprint(conn)
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def _restore_history(self, state: Dict):
+        """Rebuild historical_data from a stored fit."""
+        self.historical_data = defaultdict(list)
+        for i, category in enumerate(state['categories']):
+            n = int(state['months'][i])
+            self.historical_data[str(category)] = [
+                (str(label), float(amount))
+                for label, amount in zip(state['labels'][i, :n], state['Y'][i, :n])
+            ]
+        self._history_from_db = True
+
+    def _fit_batch(self) -> Dict[str, np.ndarray]:
+        """
+        Fit and summarize every category in one pass over the padded matrix.
+
+        With a ModelStore: if the data fingerprint matches the saved one, the
+        saved fit (and history) is used as is; otherwise only categories whose
+        monthly series changed are refitted and the store is rewritten.
+        """
+        fingerprint = stored = None
+        if self.store is not None:
+            fingerprint = self._data_fingerprint()
+            stored = self.store.load() if fingerprint else None
+            if stored and not self.historical_data and stored['fingerprint'] == fingerprint:
+                self._restore_history(stored)
+                stored['refitted'] = 0
+                self._fit = stored
+                return stored
+
+        categories, Y, mask = self.build_matrix()
+        labels = np.full(Y.shape, "", dtype=object)
+        labels[mask] = [month for c in categories for month, _ in self.historical_data[c]]
+        labels = labels.astype(str)
+
+        # Rows with the same series as the stored fit keep their parameters
+        changed = np.ones(len(categories), dtype=bool)
+        reuse = {}
+        if stored is not None:
+            index = {str(c): j for j, c in enumerate(stored['categories'])}
+            for i, category in enumerate(categories):
+                j = index.get(category)
+                if j is None:
+                    continue
+                n = int(mask[i].sum())
+                if (n == int(stored['months'][j])
+                        and np.array_equal(labels[i, :n], stored['labels'][j, :n])
+                        and np.array_equal(Y[i, :n], stored['Y'][j, :n])):
+                    changed[i] = False
+                    reuse[i] = j
+
+        refit = self._fit_rows(Y[changed], mask[changed])
+        fit = {'categories': categories, 'labels': labels, 'Y': Y, 'mask': mask}
+        for key, values in refit.items():
+            column = np.zeros(len(categories), dtype=values.dtype)
+            column[changed] = values
+            for i, j in reuse.items():
+                column[i] = stored[key][j]
+            fit[key] = column
+        fit['refitted'] = int(changed.sum())
+
+        if fingerprint and self._history_from_db:
+            self.store.save(fingerprint, fit)
+        self._fit = fit
+        return fit
+
+    def _train_batch(self) -> Dict[str, bool]:
+        """Store the batched fit in self.models / self.category_stats."""
+        fit = self._fit_batch()
+
+        results = {}
+        for i, category in enumerate(str(c) for c in fit['categories']):
+            results[category] = bool(fit['months'][i] >= 2)
+            if not results[category]:
+                continue
+            self.models[category] = {
+                'slope': float(fit['slope'][i]),
+                'intercept': float(fit['intercept'][i])
+            }
+            self.category_stats[category] = {
+                'mean': float(fit['mean'][i]),
+                'std': float(fit['std'][i]),
+                'min': float(fit['min'][i]),
+                'max': float(fit['max'][i]),
+                'months': int(fit['months'][i])
+            }
+        return results
+
     def train_all(self) -> Dict[str, bool]:
         """
         Train models for all categories.
@@ -182,6 +390,9 @@ class SpendingPredictor:
         Returns:
             Dict with category -> training success
         """
+        if self.engine == "numpy":
+            return self._train_batch()
+
         if not self.historical_data:
             self.load_historical_data()
 
@@ -191,6 +402,38 @@ class SpendingPredictor:
 
         return results
 
+    def predict_batch(self) -> BatchForecast:
+        """
+        Predict next month for all categories at once (same rules as
+        predict_next_month: minimum floor, CV-based confidence, 1.5 std bounds).
+        """
+        fit = self._fit if self._fit is not None else self._fit_batch()
+        categories, months = [str(c) for c in fit['categories']], fit['months']
+        mean, std = fit['mean'], fit['std']
+
+        minimum = np.array([MINIMUM_CATEGORY_SPENDING.get(c, 0) for c in categories], dtype=float)
+        predicted = fit['slope'] * months + fit['intercept']
+        minimum_applied = (minimum > 0) & (predicted < minimum)
+        predicted = np.where(minimum_applied, minimum, predicted)
+
+        # Confidence: lower if high variance relative to mean (CV)
+        cv = np.divide(std, mean, out=np.zeros_like(std), where=mean > 0)
+        confidence = np.where(mean > 0, np.clip(1 - cv, 0, 1), 0.5)
+        confidence = np.where(minimum_applied, np.maximum(confidence, 0.85), confidence)
+
+        return BatchForecast(
+            categories=categories,
+            months=months,
+            predicted=predicted,
+            confidence=confidence,
+            lower_bound=np.maximum(minimum, predicted - 1.5 * std),
+            upper_bound=predicted + 1.5 * std,
+            mean=mean,
+            std=std,
+            minimum=minimum,
+            minimum_applied=minimum_applied
+        )
+
     def predict_next_month(self, category: str) -> Dict:
         """
         Predict spending for next month.
@@ -203,34 +446,16 @@ class SpendingPredictor:
         """
         if category not in self.models:
             if not self.train_model(category):
-                # Check if category has minimum spending defined
-                min_spending = MINIMUM_CATEGORY_SPENDING.get(category, 0)
-                if min_spending > 0:
-                    return {
-                        'predicted': min_spending,
-                        'confidence': 0.9,  # High confidence for fixed costs
-                        'lower_bound': min_spending,
-                        'upper_bound': min_spending * 1.2,
-                        'minimum_applied': True,
-                        'note': f'Baseado em gasto fixo mínimo de R$ {min_spending:,.0f}'
-                    }
-                return {
-                    'predicted': 0,
-                    'confidence': 0,
-                    'lower_bound': 0,
-                    'upper_bound': 0,
-                    'error': 'Insufficient data'
-                }
+                return insufficient_data_prediction(category)
 
         data = self.historical_data.get(category, [])
         next_idx = len(data)
 
-        if SKLEARN_AVAILABLE:
-            model = self.models[category]
-            predicted = model.predict([[next_idx]])[0]
-        else:
-            model = self.models[category]
+        model = self.models[category]
+        if isinstance(model, dict):
             predicted = model['slope'] * next_idx + model['intercept']
+        else:
+            predicted = model.predict([[next_idx]])[0]
 
         # Apply minimum spending floor if defined for this category
         min_spending = MINIMUM_CATEGORY_SPENDING.get(category, 0)
@@ -287,10 +512,20 @@ class SpendingPredictor:
         predictions = {}
         total_predicted = 0
 
-        for category in self.historical_data.keys():
-            pred = self.predict_next_month(category)
-            predictions[category] = pred
-            total_predicted += pred.get('predicted', 0)
+        if self.engine == "numpy":
+            forecast = self.predict_batch()
+            for i, category in enumerate(forecast.categories):
+                if forecast.months[i] >= 2:
+                    pred = forecast.as_dict(i)
+                else:
+                    pred = insufficient_data_prediction(category)
+                predictions[category] = pred
+                total_predicted += pred.get('predicted', 0)
+        else:
+            for category in self.historical_data.keys():
+                pred = self.predict_next_month(category)
+                predictions[category] = pred
+                total_predicted += pred.get('predicted', 0)
 
         predictions['_total'] = {
             'predicted': round(total_predicted, 2),
@@ -299,66 +534,36 @@ class SpendingPredictor:
 
         return predictions
 
-    def detect_anomalies(self, threshold: float = 2.0) -> List[Dict]:
+    def detect_anomalies(self, threshold: float = 2.0, method: str = "mad") -> List[Dict]:
         """
-        Detect anomalous spending in recent transactions.
+        Detect anomalous spending in the last 30 days.
+
+        Scores are robust z-scores (median/MAD per category over the full
+        expense history) from the vectorized engine in scripts/anomalies.py,
+        scaled to standard deviations, so the threshold keeps its meaning.
 
         Args:
             threshold: Number of standard deviations to consider anomalous
+            method: "mad" or "isolation_forest" (requires scikit-learn)
 
         Returns:
             List of anomalous transactions
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        # Get recent transactions
-        query = '''
-            SELECT
-                t.id, t.date, t.description, ABS(t.amount) as amount,
-                c.name as category
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense'
-            AND t.date >= date('now', '-30 days')
-            ORDER BY t.date DESC
-        '''
-
-        cursor.execute(query)
-        transactions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        anomalies = []
-
-        for tx in transactions:
-            category = tx['category']
-            stats = self.category_stats.get(category, {})
-
-            if not stats:
-                continue
-
-            mean = stats.get('mean', 0)
-            std = stats.get('std', 0)
-
-            if std == 0:
-                continue
+        if method == "isolation_forest" and not SKLEARN_AVAILABLE:
+            method = "mad"
 
-            # Z-score
-            z_score = (tx['amount'] - mean) / std
+        start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        flagged = anomalies.detect_anomalies(
+            start=start, threshold=threshold, two_sided=True, method=method
+        )
 
-            if abs(z_score) > threshold:
-                anomalies.append({
-                    'id': tx['id'],
-                    'date': tx['date'],
-                    'description': tx['description'],
-                    'amount': tx['amount'],
-                    'category': category,
-                    'z_score': round(z_score, 2),
-                    'reason': f'{abs(z_score):.1f}x desvio padrão' if z_score > 0 else f'Abaixo da média',
-                    'expected_range': f'R$ {mean - std:.0f} - R$ {mean + std:.0f}'
-                })
+        for a in flagged:
+            median, scale = a.pop('median'), a.pop('scale')
+            z_score = a['z_score']
+            a['reason'] = f'{abs(z_score):.1f}x desvio robusto' if z_score > 0 else 'Abaixo da mediana'
+            a['expected_range'] = f'R$ {max(median - scale, 0):.0f} - R$ {median + scale:.0f}'
 
-        return sorted(anomalies, key=lambda x: abs(x['z_score']), reverse=True)
+        return flagged
 
     def analyze_trends(self) -> Dict[str, Dict]:
         """
@@ -419,7 +624,10 @@ class SpendingPredictor:
         Returns:
             Complete analysis report
         """
-        self.load_historical_data()
+        # Fresh history (the numpy engine takes it from the ModelStore when
+        # the data fingerprint is unchanged)
+        self.historical_data = {}
+        self._fit = None
         self.train_all()
 
         return {
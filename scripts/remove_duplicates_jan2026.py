@@ -1,21 +1,24 @@
 #!/usr/bin/env python3
 """
 Remove duplicate transactions from finance.db
-Uses hash-based detection: MD5(date|description|amount)
+Uses hash-based detection: canonical transaction hash (scripts/hashing.py)
 Keeps first occurrence, deletes subsequent duplicates
 """
 
 import sqlite3
-import hashlib
 from datetime import datetime
 from pathlib import Path
 
+try:
+    from hashing import hash_many, transaction_hash
+except ImportError:
+    from scripts.hashing import hash_many, transaction_hash
+
 DB_PATH = Path(__file__).parent.parent / 'data' / 'finance.db'
 
 def calculate_hash(date: str, description: str, amount: float) -> str:
-    """Calculate MD5 hash for transaction."""
-    key = f"{date}|{description}|{amount:.2f}"
-    return hashlib.md5(key.encode()).hexdigest()
+    """Calculate the canonical hash for a transaction."""
+    return transaction_hash(date, description, amount)
 
 def update_missing_hashes(conn):
     """Update hash column for transactions that don't have one."""
@@ -33,13 +36,21 @@ def update_missing_hashes(conn):
     if not transactions:
         return 0
 
-    # Update each transaction with calculated hash
-    for txn_id, date, description, amount in transactions:
-        txn_hash = calculate_hash(date, description, amount)
-        cursor.execute("UPDATE transactions SET hash = ? WHERE id = ?", (txn_hash, txn_id))
+    cursor.execute("SELECT hash FROM transactions WHERE hash IS NOT NULL AND hash != ''")
+    taken = {row[0] for row in cursor.fetchall()}
+
+    # Rows whose hash is already taken stay NULL (unique index on hash);
+    # find_duplicates recomputes their hash and reports them
+    updates = []
+    hashes = hash_many((date, description or "", amount) for _, date, description, amount in transactions)
+    for (txn_id, _, _, _), txn_hash in zip(transactions, hashes):
+        if txn_hash not in taken:
+            taken.add(txn_hash)
+            updates.append((txn_hash, txn_id))
 
+    cursor.executemany("UPDATE transactions SET hash = ? WHERE id = ?", updates)
     conn.commit()
-    return len(transactions)
+    return len(updates)
 
 def find_duplicates(conn):
     """Find all duplicate transactions in database."""
@@ -21,13 +21,11 @@ from typing import Dict, Optional, Tuple
 # Import database functions
 try:
     from finance_db import (
-        add_pj_revenue, add_pj_tax, add_pj_expense,
-        get_pj_monthly_summary, get_consolidated_summary
+        upsert_pj_batch, get_pj_monthly_summary, get_consolidated_summary
     )
 except ImportError:
     from scripts.finance_db import (
-        add_pj_revenue, add_pj_tax, add_pj_expense,
-        get_pj_monthly_summary, get_consolidated_summary
+        upsert_pj_batch, get_pj_monthly_summary, get_consolidated_summary
     )
 
 
@@ -125,65 +123,65 @@ def save_contabilizei_data(
         "operations": []
     }
 
-    # Salvar faturamento
+    # Meses podem diferir (faturamento x competencia do imposto):
+    # agrupar por (ano, mes) e gravar tudo em uma unica transacao
+    batch: Dict[Tuple[int, int], Dict] = {}
+
+    def month_entry(year: int, month: int) -> Dict:
+        return batch.setdefault((year, month), {
+            "year": year, "month": month, "taxes": [], "expenses": []
+        })
+
+    # Faturamento
     if faturamento and faturamento_mes and faturamento_ano:
-        result = add_pj_revenue(
-            faturamento_ano,
-            faturamento_mes,
-            faturamento,
-            "contabilizei",
-            f"Faturamento {faturamento_mes}/{faturamento_ano} - Importado via scraping"
-        )
+        entry = month_entry(faturamento_ano, faturamento_mes)
+        entry["revenue"] = faturamento
+        entry["notes"] = f"Faturamento {faturamento_mes}/{faturamento_ano} - Importado via scraping"
         results["operations"].append({
             "type": "faturamento",
             "year": faturamento_ano,
             "month": faturamento_mes,
-            "value": faturamento,
-            "status": result.get("status")
+            "value": faturamento
         })
 
-    # Salvar imposto
+    # Imposto
     if imposto and imposto_mes and imposto_ano:
-        result = add_pj_tax(
-            imposto_ano,
-            imposto_mes,
-            "simples",
-            imposto,
-            imposto_vencimento,
-            "pending"
-        )
+        month_entry(imposto_ano, imposto_mes)["taxes"].append({
+            "tax_type": "simples",
+            "amount": imposto,
+            "due_date": imposto_vencimento,
+            "status": "pending"
+        })
         results["operations"].append({
             "type": "imposto_simples",
             "year": imposto_ano,
             "month": imposto_mes,
             "value": imposto,
-            "due_date": imposto_vencimento,
-            "status": result.get("status")
+            "due_date": imposto_vencimento
         })
 
-    # Salvar despesas fixas (mesmo mes do faturamento)
+    # Despesas fixas (mesmo mes do faturamento)
     expense_year = faturamento_ano or imposto_ano or datetime.now().year
     expense_month = faturamento_mes or imposto_mes or datetime.now().month
 
-    if prolabore:
-        result = add_pj_expense(expense_year, expense_month, "prolabore", prolabore)
-        results["operations"].append({
-            "type": "prolabore",
-            "year": expense_year,
-            "month": expense_month,
-            "value": prolabore,
-            "status": result.get("status")
-        })
-
-    if contabilizei_fee:
-        result = add_pj_expense(expense_year, expense_month, "contabilizei", contabilizei_fee)
-        results["operations"].append({
-            "type": "contabilizei_fee",
-            "year": expense_year,
-            "month": expense_month,
-            "value": contabilizei_fee,
-            "status": result.get("status")
-        })
+    for op_type, expense_type, value in (("prolabore", "prolabore", prolabore),
+                                         ("contabilizei_fee", "contabilizei", contabilizei_fee)):
+        if value:
+            month_entry(expense_year, expense_month)["expenses"].append({
+                "expense_type": expense_type,
+                "amount": value
+            })
+            results["operations"].append({
+                "type": op_type,
+                "year": expense_year,
+                "month": expense_month,
+                "value": value
+            })
+
+    if batch:
+        saved = upsert_pj_batch(list(batch.values()), source="contabilizei")
+        for op in results["operations"]:
+            op["status"] = saved["status"]
 
     return results
 
@@ -8,6 +8,11 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from hashing import transaction_hash
+except ImportError:
+    from scripts.hashing import transaction_hash
+
 DB_PATH = Path(__file__).parent.parent / "data" / "finance.db"
 
 # Dados reais do planejamento
@@ -159,13 +164,12 @@ def setup_database():
     cursor.execute("SELECT id FROM accounts WHERE name = 'BB Credito'")
     account_id = cursor.fetchone()[0]
 
-    import hashlib
     for date_str, desc, amount, category in JANUARY_TRANSACTIONS:
         cursor.execute("SELECT id FROM categories WHERE name = ?", (category,))
         cat_row = cursor.fetchone()
         cat_id = cat_row[0] if cat_row else None
 
-        tx_hash = hashlib.md5(f"{date_str}|{desc}|{abs(amount)}".encode()).hexdigest()
+        tx_hash = transaction_hash(date_str, desc, amount)
 
         cursor.execute("""
             INSERT INTO transactions
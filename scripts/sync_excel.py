@@ -5,21 +5,23 @@ Updates Dashboard_2026.xlsx with data from SQLite database.
 Preserves charts and formatting while updating data cells.
 """
 
-import sqlite3
 from datetime import datetime
 from pathlib import Path
 from openpyxl import load_workbook
 
+try:
+    from finance_db import month_range, get_yearly_matrix, connect_read_only
+except ImportError:
+    from scripts.finance_db import month_range, get_yearly_matrix, connect_read_only
+
 # Paths
 DB_PATH = Path(__file__).parent.parent / "data" / "finance.db"
 EXCEL_PATH = Path(__file__).parent.parent / "projections" / "Dashboard_2026.xlsx"
 
 
 def get_connection():
-    """Get database connection."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get read-only database connection (sync never writes to the ledger)."""
+    return connect_read_only(DB_PATH)
 
 
 def get_monthly_summary(year: int, month: int) -> dict:
@@ -34,12 +36,11 @@ def get_monthly_summary(year: int, month: int) -> dict:
             COALESCE(SUM(ABS(t.amount)), 0) as total
         FROM categories c
         LEFT JOIN transactions t ON t.category_id = c.id
-            AND strftime('%Y', t.date) = ?
-            AND strftime('%m', t.date) = ?
+            AND t.date >= ? AND t.date < ?
             AND t.type = 'expense'
         GROUP BY c.id
         ORDER BY c.name
-    ''', (str(year), f"{month:02d}"))
+    ''', month_range(year, month))
 
     rows = cursor.fetchall()
     conn.close()
@@ -55,9 +56,8 @@ def get_transactions_count(year: int, month: int) -> int:
     cursor.execute('''
         SELECT COUNT(*) as count
         FROM transactions
-        WHERE strftime('%Y', date) = ?
-        AND strftime('%m', date) = ?
-    ''', (str(year), f"{month:02d}"))
+        WHERE date >= ? AND date < ?
+    ''', month_range(year, month))
 
     result = cursor.fetchone()
     conn.close()
@@ -132,10 +132,9 @@ def sync_dashboard(year: int = 2026, month: int = 1):
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
         WHERE c.is_excluded = 1
-            AND strftime('%Y', t.date) = ?
-            AND strftime('%m', t.date) = ?
+            AND t.date >= ? AND t.date < ?
             AND t.type = 'expense'
-    ''', (str(year), f"{month:02d}"))
+    ''', month_range(year, month))
     total_excluded = cursor_excluded.fetchone()['total_excluded']
     conn_excluded.close()
 
@@ -209,9 +208,11 @@ def sync_all_months(year: int = 2026):
     """Sync all months for the year."""
     print(f"Sincronizando todos os meses de {year}...")
 
+    # Totais de todos os meses em uma única consulta
+    month_totals = get_yearly_matrix(year).month_totals()
+
     for month in range(1, 13):
-        summary = get_monthly_summary(year, month)
-        total = sum(cat['total'] for cat in summary.values())
+        total = month_totals[month - 1]
 
         if total > 0:
             print(f"\n--- {month:02d}/{year} ---")
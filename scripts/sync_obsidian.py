@@ -16,6 +16,8 @@ try:
         get_categories,
         get_transactions,
         get_monthly_summary,
+        get_yearly_matrix,
+        budget_status,
         get_active_installments,
         get_pj_monthly_summary,
         get_pj_yearly_summary,
@@ -28,6 +30,8 @@ except ImportError:
         get_categories,
         get_transactions,
         get_monthly_summary,
+        get_yearly_matrix,
+        budget_status,
         get_active_installments,
         get_pj_monthly_summary,
         get_pj_yearly_summary,
@@ -319,18 +323,23 @@ def sync_categories(year: int):
     cat_path = TRACKING_PATH / "categorias"
     cat_path.mkdir(parents=True, exist_ok=True)
 
+    # Category x month spending for the whole year (single query)
+    matrix = get_yearly_matrix(year)
+
     for cat in categories:
         # Get yearly data for this category
         yearly_data = []
-        for month in range(1, 13):
-            summary = get_monthly_summary(year, month)
-            cat_data = next((c for c in summary["categories"] if c["category"] == cat["name"]), None)
-            if cat_data:
+        i = matrix.index(cat["name"])
+        if i is not None:
+            budget = float(matrix.budgets[i])
+            for month in range(1, 13):
+                total = float(matrix.totals[i, month - 1])
+                percent, _ = budget_status(total, budget)
                 yearly_data.append({
                     "month": month,
-                    "total": cat_data["total"],
-                    "budget": cat_data["budget"],
-                    "percent": cat_data["percent"]
+                    "total": total,
+                    "budget": budget,
+                    "percent": percent
                 })
 
         content = generate_category_page(cat, yearly_data)
@@ -656,6 +665,8 @@ def sync_all(year: int, month: int):
     print("[0/4] Gerando transacoes de parcelamentos...")
     inst_result = generate_installment_transactions(year, month)
     print(f"  Parcelamentos: {inst_result['created']} criados, {inst_result['skipped']} ja existentes")
+    if inst_result.get("conflicts"):
+        print(f"  ⚠️  {len(inst_result['conflicts'])} parcela(s) nao gravada(s): hash igual a outra transacao")
 
     # 1. Sync Obsidian PF
     print("\n[1/4] Sincronizando Obsidian (PF)...")